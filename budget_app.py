@@ -1,22 +1,43 @@
 import imaplib
+import io
+import asyncio
 import email
 import time
 import json
+import sqlite3
 import os
 import sys
 import threading
 import subprocess
 import logging
 import signal
+import select
+import socket
+import ssl
+import itertools
+import heapq
+import hashlib
+import functools
+import mailbox
+import csv
+import random
 from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
 import smtplib
 from email.mime.text import MIMEText
+from email.utils import parsedate_to_datetime
 import re
+import html
 import pygsheets
 import requests
 from flask import Flask, Response, request
-from datetime import datetime
+from datetime import datetime, timedelta
 from colorama import init as colorama_init, Fore, Style
+try:
+    import resource  # POSIX only; used for peak RSS in cycle stats
+except ImportError:
+    resource = None
 
 colorama_init(autoreset=True)
 
@@ -24,8 +45,54 @@ colorama_init(autoreset=True)
 CONFIG_FILE = "config.json"
 LOG_FILE = "budget_app_logs.txt"
 LAST_TXN_FILE = "last_transaction.json"
+PARSE_CACHE_FILE = "parse_cache.json"
+PARSE_CACHE_SIZE = 5000      # Parse results kept (LRU); override with "parse_cache_size" in config.json
+CATEGORY_CACHE_TTL = 600     # Seconds the summary tab's category list is reused; override with "category_cache_ttl"
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_FLUSH_INTERVAL = 60  # Seconds between AppState writes of the newest checkpointed UID
+CHECKPOINT_RECOVERY_ROWS = 500  # Newest rows searched for an unfinished batch's ids beyond its own size
+LEDGER_STATE_FILE = "ledger_state.json"
+LEDGER_FIRST_ROW = 5         # First transaction row (rows 1-4 are the header block)
+LEDGER_GROW_ROWS = 1000      # Rows added at a time when an append-mode ledger runs out of grid
+MERCHANT_MEMO_FILE = "merchant_memo.json"
+MERCHANT_MEMO_SIZE = 10000   # Merchants remembered (LRU); override with "merchant_memo_size" in config.json
+MERCHANT_MEMO_SAVE_INTERVAL = 60        # Seconds between saves of the merchant memo file
+MERCHANT_MEMO_LEARN_INTERVAL = 60 * 60  # Seconds between reads of sheet corrections
+MERCHANT_MEMO_LEARN_ROWS = 2000         # Newest transaction rows read back when learning corrections
+MERCHANT_MEMO_WRITTEN_ROWS = 5000       # Newest rows whose written category is kept to tell hand fixes apart
 HEARTBEAT_INTERVAL = 1800    # Health check/heartbeat every 30 minutes
-EMAIL_POLL_INTERVAL = 60     # Check email every minute
+EMAIL_POLL_INTERVAL = 60     # Check email every minute (poll mode, or IDLE fallback)
+IMAP_IDLE_REFRESH = 25 * 60  # Re-issue IDLE well before the 29-minute server timeout (RFC 2177)
+IMAP_FETCH_BATCH_SIZE = 50   # UIDs per batched FETCH command
+IMAP_MAX_BODY_BYTES = 64 * 1024  # Default per-message body limit (truncated in batch mode, skipped in bodystructure mode)
+IMAP_HEADER_FIELDS = "SUBJECT FROM MESSAGE-ID DATE"
+IMAP_MIME_FIELDS = "CONTENT-TYPE CONTENT-TRANSFER-ENCODING"
+IMAP_SOCKET_TIMEOUT = 60     # Seconds a read may block before the socket is treated as dead
+IMAP_KEEPALIVE_INTERVAL = 30 # NOOP a reused session that has been idle at least this long
+IMAP_RECONNECT_BASE = 2      # Seconds of backoff after the first dropped session / failed connect
+IMAP_RECONNECT_MAX = 5 * 60  # Cap on the reconnect backoff
+HTML_MAX_TEXT_CHARS = 32 * 1024  # Visible text kept from an HTML-only email; alert fields come long before this
+BACKFILL_BATCH_SIZE = 5000   # Messages handed to the process pool at a time during a backfill
+INGEST_QUEUE_SIZE = 100      # Parsed emails a source may hold waiting for the sheet before its fetcher blocks
+SHEET_BATCH_MAX_ROWS = 200   # Emails written (and checkpointed) per batched sheet write
+LEDGER_SYNC_INTERVAL = 30    # Seconds between local-ledger sync passes when nothing wakes the worker
+LEDGER_SYNC_RETRY_BASE = 2   # First sync retry delay (seconds) after a Sheets failure, doubled per failure
+LEDGER_SYNC_RETRY_MAX = 300  # Ceiling for the sync retry delay
+STORAGE_BACKEND = "sheets"     # Where transactions and app state live: "sheets", "memory" or "csv" ("storage_backend")
+STORAGE_DIR = "storage"        # Folder the csv backend writes to; override with "storage_dir" in config.json
+SHEETS_READS_PER_MINUTE = 60   # Sheets API read quota per user; override with "sheets_read_quota" in config.json
+SHEETS_WRITES_PER_MINUTE = 60  # Sheets API write quota per user; override with "sheets_write_quota"
+SHEETS_QUOTA_WINDOW = 60       # Seconds the quotas above are counted over
+SHEETS_RETRY_BASE = 1          # First backoff (seconds) after a 429/5xx, doubled per retry
+SHEETS_RETRY_MAX = 64          # Cap on the Sheets backoff
+SHEETS_MAX_RETRIES = 6         # Retries of one request before the error is passed on
+SHEETS_RETRY_STATUSES = (429, 500, 502, 503, 504)
+SHEETS_NETWORK_ERRORS = (ConnectionError, TimeoutError, socket.gaierror)  # Retried like a 5xx
+SHEETS_STALE_HANDLE_STATUSES = (403, 404)  # Sheet or tab deleted, renamed or unshared: cached handles are stale
+# Scheduler priorities, lowest runs first
+SHEETS_PRIORITY_TRANSACTIONS = 0
+SHEETS_PRIORITY_CHECKPOINT = 1
+SHEETS_PRIORITY_BOOKKEEPING = 2
 LOG_SERVER_PORT = 8080
 LOG_SERVER_USERNAME = "admin"  # TODO: I need to update this to something more secure
 LOG_SERVER_PASSWORD = "changeme"  # TODO: I need to update this to something more secure
@@ -34,6 +101,7 @@ NGROK_URL_FILE = "ngrok_url.txt"  # TODO: I need to keep this file up to date wi
 # --- Google Sheet UID State ---
 APPSTATE_TAB = "AppState"
 APPSTATE_UID_CELL = "A1"
+APPSTATE_UIDVALIDITY_CELL = "A2"
 APPSTATE_LAST_UP_CELL = "B1"
 APPSTATE_LAST_DOWN_CELL = "B2"
 
@@ -42,6 +110,14 @@ NGROK_PUBLIC_URL = None
 NGROK_STATUS = "unknown"
 APP_RUNNING = True
 
+# --- Ingest stats (reported in the heartbeat) ---
+INGEST_STATS = {
+    "mode": "unknown",
+    "last_push_latency_ms": None,
+    "last_cycle_bytes": None,
+    "peak_rss_mb": None,
+}
+
 def print_startup_banner():
     print(Fore.CYAN + Style.BRIGHT + "\n=== Budget App Startup ===\n" + Style.RESET_ALL)
     print(Fore.GREEN + Style.BRIGHT + "✓ Health: OK" + Style.RESET_ALL)
@@ -106,41 +182,405 @@ def get_appstate_sheet(gc, sh):
     except pygsheets.WorksheetNotFound:
         wks = sh.add_worksheet(APPSTATE_TAB, rows=10, cols=2)
         wks.update_value(APPSTATE_UID_CELL, "0")
+        wks.update_value(APPSTATE_UIDVALIDITY_CELL, "")
         wks.update_value(APPSTATE_LAST_UP_CELL, "")
         wks.update_value(APPSTATE_LAST_DOWN_CELL, "")
     return wks
 
-def save_last_uid(uid):
-    """I need to track the last processed email UID remotely in the AppState tab."""
+class SheetsSession:
+    """
+    I need one authorized Sheets client for the whole process, with the spreadsheet and worksheet handles
+    cached, instead of a service-account token exchange and a metadata fetch on every helper call. The
+    access token is refreshed by google-auth only when it expires. The client's HTTP connection is not
+    thread-safe, so requests run inside "with SHEETS_SESSION as sheets:" (SheetsScheduler does this), which
+    serializes the health and ingest threads. A not-found or permission error inside the block drops the
+    cached handles so the next call reopens them; a throttled or failed request (429/5xx, network) keeps
+    them, since its retry would only pay for the reopen.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.gc = None
+        self.sh = None
+        self.worksheets = {}
+        self.authorizations = 0
+        self.opens = 0
+        self.handle_hits = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc is not None and (
+                isinstance(exc, (pygsheets.SpreadsheetNotFound, pygsheets.WorksheetNotFound))
+                or sheets_error_status(exc) in SHEETS_STALE_HANDLE_STATUSES
+            ):
+                self.invalidate()
+        finally:
+            self.lock.release()
+
+    def client(self):
+        if self.gc is None:
+            self.gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
+            self.authorizations += 1
+        return self.gc
+
+    def spreadsheet(self):
+        if self.sh is None:
+            self.sh = self.client().open(CONFIG["sheet_name"])
+            self.opens += 1
+        else:
+            self.handle_hits += 1
+        return self.sh
+
+    def worksheet(self, title):
+        wks = self.worksheets.get(title)
+        if wks is None:
+            wks = self.worksheets[title] = self.spreadsheet().worksheet('title', title)
+        else:
+            self.handle_hits += 1
+        return wks
+
+    def appstate(self):
+        wks = self.worksheets.get(APPSTATE_TAB)
+        if wks is None:
+            wks = self.worksheets[APPSTATE_TAB] = get_appstate_sheet(self.client(), self.spreadsheet())
+        else:
+            self.handle_hits += 1
+        return wks
+
+    def invalidate(self):
+        """I need the spreadsheet and worksheet handles re-fetched next time (the client itself stays)."""
+        with self.lock:
+            self.sh = None
+            self.worksheets.clear()
+
+    def stats(self):
+        return {"authorizations": self.authorizations, "opens": self.opens, "handle_hits": self.handle_hits}
+
+SHEETS_SESSION = SheetsSession()
+
+class TokenBucket:
+    """
+    I need a per-window request quota kept as a token bucket. A full bucket plus a window of refill must
+    not pass the quota, so the burst is a tenth of it and the rest refills evenly over SHEETS_QUOTA_WINDOW.
+    """
+
+    def __init__(self, per_window):
+        self.capacity = max(1, per_window // 10)
+        self.tokens = float(self.capacity)
+        self.rate = max(1, per_window - self.capacity) / SHEETS_QUOTA_WINDOW
+        self.updated = time.monotonic()
+
+    def wait_time(self, cost):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = min(cost, self.capacity)
+        return 0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost):
+        self.tokens -= min(cost, self.capacity)
+
+    def drain(self):
+        self.tokens = min(self.tokens, 0)
+
+class SheetsRequest:
+    def __init__(self, fn, priority, reads, writes, key, seq, idempotent=True):
+        self.fn = fn
+        self.priority = priority
+        self.reads = reads
+        self.writes = writes
+        self.key = key
+        self.idempotent = idempotent
+        self.seq = seq
+        self.not_before = 0
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+def sheets_error_status(error):
+    """I need the HTTP status behind a Sheets API error (googleapiclient HttpError or a wrapped one), or None."""
+    status = getattr(getattr(error, "resp", None), "status", None) or getattr(error, "status_code", None)
+    if status:
+        return int(status)
+    text = str(error)
+    if "RATE_LIMIT_EXCEEDED" in text or "Quota exceeded" in text:
+        return 429
+    match = re.search(r'\b(429|50[0234])\b', text)
+    return int(match.group(1)) if match else None
+
+class SheetsScheduler:
+    """
+    I need every Sheets API request to go through one queue: token buckets keep reads and writes under
+    the per-minute quotas, transaction writes go ahead of checkpoints and heartbeat bookkeeping, a request
+    with the same key as one still waiting is folded into it (a newer write replaces the queued one, a read
+    shares its result), and 429/5xx answers are retried with jittered exponential backoff. A 429 also
+    empties the buckets so every queued request backs off, not just the one that hit it. A request that
+    is not idempotent (a row insert) may have landed before a 5xx or a dropped connection, so only a 429
+    retries it; anything else is raised for the checkpoint or ledger recovery to settle. The calling
+    thread runs its own request once it reaches the head of the queue, inside SHEETS_SESSION.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queue = []
+        self.by_key = {}
+        self.seq = itertools.count()
+        self.reads = TokenBucket(int(CONFIG.get("sheets_read_quota", SHEETS_READS_PER_MINUTE)))
+        self.writes = TokenBucket(int(CONFIG.get("sheets_write_quota", SHEETS_WRITES_PER_MINUTE)))
+        self.backoff_until = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.throttle_seconds = 0.0
+        self.max_depth = 0
+
+    def call(self, fn, priority=SHEETS_PRIORITY_TRANSACTIONS, reads=0, writes=0, key=None, idempotent=True):
+        """
+        I need fn(sheets) run under the quotas, returning its result. reads/writes are its API calls;
+        idempotent=False for one that must not run twice (see the class docstring).
+        """
+        with self.cond:
+            request = self.by_key.get(key) if key is not None else None
+            if request is not None:
+                if writes:
+                    # Only the newest value of a coalesced write matters
+                    request.fn = fn
+                if priority < request.priority:
+                    request.priority = priority
+                    heapq.heapify(self.queue)
+                self.coalesced += 1
+                owner = False
+            else:
+                request = SheetsRequest(fn, priority, reads, writes, key, next(self.seq), idempotent)
+                heapq.heappush(self.queue, request)
+                if key is not None:
+                    self.by_key[key] = request
+                self.max_depth = max(self.max_depth, len(self.queue))
+                owner = True
+            # The head may have changed; its owner could be parked with no timeout
+            self.cond.notify_all()
+        if not owner:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+            return request.result
+        try:
+            request.result = self.execute(request)
+            return request.result
+        except Exception as e:
+            request.error = e
+            raise
+        finally:
+            request.done.set()
+
+    def wait_turn(self, request):
+        throttled_since = None
+        with self.cond:
+            while True:
+                wait = None
+                if self.queue[0] is request:
+                    now = time.monotonic()
+                    wait = max(
+                        self.reads.wait_time(request.reads),
+                        self.writes.wait_time(request.writes),
+                        self.backoff_until - now,
+                        request.not_before - now,
+                    )
+                    if wait > 0 and throttled_since is None:
+                        throttled_since = now
+                    if wait <= 0:
+                        if throttled_since is not None:
+                            self.throttle_seconds += now - throttled_since
+                        heapq.heappop(self.queue)
+                        if request.key is not None and self.by_key.get(request.key) is request:
+                            del self.by_key[request.key]
+                        self.reads.take(request.reads)
+                        self.writes.take(request.writes)
+                        self.calls += 1
+                        self.cond.notify_all()
+                        return
+                self.cond.wait(wait)
+
+    def execute(self, request):
+        for attempt in itertools.count():
+            self.wait_turn(request)
+            try:
+                with SHEETS_SESSION as sheets:
+                    return request.fn(sheets)
+            except Exception as e:
+                status = sheets_error_status(e)
+                network = isinstance(e, SHEETS_NETWORK_ERRORS)
+                # A 429 was refused unapplied; a 5xx or network error may have landed
+                retryable = status == 429 or (request.idempotent and (status in SHEETS_RETRY_STATUSES or network))
+                if not retryable or attempt >= SHEETS_MAX_RETRIES:
+                    raise
+                delay = min(SHEETS_RETRY_MAX, SHEETS_RETRY_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                problem = f"network error ({e})" if network else f"returned {status}"
+                logger.warning(f"Sheets API {problem}; retry {attempt + 1}/{SHEETS_MAX_RETRIES} in {delay:.1f}s")
+                with self.cond:
+                    self.retries += 1
+                    if status == 429:
+                        self.reads.drain()
+                        self.writes.drain()
+                        self.backoff_until = max(self.backoff_until, time.monotonic() + delay)
+                    request.not_before = time.monotonic() + delay
+                    heapq.heappush(self.queue, request)
+                    self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "queue_depth": len(self.queue),
+                "max_queue_depth": self.max_depth,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "throttle_s": round(self.throttle_seconds, 1),
+            }
+
+SHEETS_SCHEDULER = SheetsScheduler()
+
+class AppStateStore:
+    """
+    I need the AppState cells (UIDs, UIDVALIDITYs, last up/down) kept in a local mirror: the first read
+    loads every state row from STORAGE at once (one range read on the sheet) and later reads are served
+    from memory, while a write updates the mirror and hands the changed cells to STORAGE together (one
+    batch update). A value the store already holds is not sent again; one that failed to send stays
+    dirty and goes with the next write. The mirror is loaded once per run, so a hand edit to the
+    AppState tab is picked up on restart.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mirror = {}
+        self.dirty = set()
+        self.rows = 2
+        self.loaded_rows = 0
+        self.reads = 0
+        self.writes = 0
+        self.hits = 0
+        self.unchanged = 0
+
+    def load(self, priority):
+        with self.lock:
+            rows = self.rows
+        values = STORAGE.read_state(rows, priority)
+        with self.lock:
+            for cell, value in values.items():
+                if cell not in self.dirty:
+                    self.mirror[cell] = value
+            self.loaded_rows = max(self.loaded_rows, rows)
+            self.reads += 1
+
+    def get(self, cell, priority=SHEETS_PRIORITY_BOOKKEEPING):
+        """I need a cell's value, loading the state rows first if the mirror does not cover it yet."""
+        row = int(cell[1:])
+        with self.lock:
+            if row <= self.loaded_rows:
+                self.hits += 1
+                return self.mirror.get(cell, "")
+            self.rows = max(self.rows, row)
+        self.load(priority)
+        with self.lock:
+            return self.mirror.get(cell, "")
+
+    def set(self, values, priority=SHEETS_PRIORITY_BOOKKEEPING):
+        """I need {cell: value} written to the mirror and, where it changed, to the sheet in one batch update."""
+        with self.lock:
+            changed = {cell: str(value) for cell, value in values.items() if self.mirror.get(cell) != str(value) or cell in self.dirty}
+            if not changed:
+                self.unchanged += 1
+                return
+            self.mirror.update(changed)
+            self.dirty.update(changed)
+            pending = {cell: self.mirror[cell] for cell in self.dirty}
+        STORAGE.write_state(pending, priority)
+        with self.lock:
+            for cell, value in pending.items():
+                if self.mirror.get(cell) == value:
+                    self.dirty.discard(cell)
+            self.writes += 1
+
+    def stats(self):
+        with self.lock:
+            return {"reads": self.reads, "writes": self.writes, "mirror_hits": self.hits, "unchanged": self.unchanged}
+
+APPSTATE = AppStateStore()
+
+def get_uid_cells(source=None):
+    """
+    I need the AppState cells holding a source's last UID and UIDVALIDITY. The default inbox keeps
+    A1/A2; every extra source from "imap_sources" gets its own row (A = UID, B = UIDVALIDITY).
+    """
+    row = (source or {}).get("appstate_row")
+    if not row:
+        return APPSTATE_UID_CELL, APPSTATE_UIDVALIDITY_CELL
+    return f"A{row}", f"B{row}"
+
+def source_label(source=None):
+    """I need a short " [name]" suffix for log lines about a named source."""
+    return f" [{source['name']}]" if source and source.get("name") else ""
+
+def transaction_row_id(uid, source=None, uidvalidity=None):
+    """I need the id written beside each ledger row (column F), unique per email: "<source>/<uidvalidity>/<uid>"."""
+    return f"{(source or {}).get('name') or 'default'}/{uidvalidity or 0}/{uid}"
+
+def write_sheet_last_uid(uid, source=None):
+    """I need to write a source's last processed email UID to the AppState tab. Returns whether it worked."""
     try:
-        gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
-        sh = gc.open(CONFIG["sheet_name"])
-        wks = get_appstate_sheet(gc, sh)
-        wks.update_value(APPSTATE_UID_CELL, str(uid))
-        logger.info(f"Saved last UID {uid} to Google Sheet AppState tab")
+        APPSTATE.set({get_uid_cells(source)[0]: uid}, SHEETS_PRIORITY_CHECKPOINT)
+        logger.info(f"Saved last UID {uid}{source_label(source)} to Google Sheet AppState tab")
+        return True
     except Exception as e:
-        logger.error(f"Failed to save last UID to Google Sheet: {e}")
+        logger.error(f"Failed to save last UID{source_label(source)} to Google Sheet: {e}")
+        return False
 
-def load_last_uid():
+def read_sheet_last_uid(source=None):
     """I need to load the last processed email UID from the AppState tab."""
     try:
-        gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
-        sh = gc.open(CONFIG["sheet_name"])
-        wks = get_appstate_sheet(gc, sh)
-        val = wks.get_value(APPSTATE_UID_CELL)
+        val = APPSTATE.get(get_uid_cells(source)[0], SHEETS_PRIORITY_CHECKPOINT)
+        return int(val) if val and val.strip().isdigit() else None
+    except Exception as e:
+        logger.error(f"Failed to load last UID{source_label(source)} from Google Sheet: {e}")
+        return None
+
+def save_last_uid(uid, source=None):
+    """I need to checkpoint the last processed email UID (locally now, in the AppState tab write-behind)."""
+    CHECKPOINTS.commit(uid, source)
+
+def load_last_uid(source=None):
+    """I need the last processed email UID, from the local checkpoint journal when it has one."""
+    return CHECKPOINTS.last_uid(source)
+
+def save_uidvalidity(uidvalidity, source=None):
+    """I need to remember which UIDVALIDITY the saved UID belongs to."""
+    try:
+        APPSTATE.set({get_uid_cells(source)[1]: uidvalidity}, SHEETS_PRIORITY_CHECKPOINT)
+        logger.info(f"Saved UIDVALIDITY {uidvalidity}{source_label(source)} to Google Sheet AppState tab")
+    except Exception as e:
+        logger.error(f"Failed to save UIDVALIDITY{source_label(source)} to Google Sheet: {e}")
+
+def load_uidvalidity(source=None):
+    """I need to load the UIDVALIDITY the saved UID belongs to."""
+    try:
+        val = APPSTATE.get(get_uid_cells(source)[1], SHEETS_PRIORITY_CHECKPOINT)
         return int(val) if val and val.strip().isdigit() else None
     except Exception as e:
-        logger.error(f"Failed to load last UID from Google Sheet: {e}")
+        logger.error(f"Failed to load UIDVALIDITY{source_label(source)} from Google Sheet: {e}")
         return None
 
 def save_last_up():
     """I need to save the last time the app was up to the AppState tab."""
     try:
-        gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
-        sh = gc.open(CONFIG["sheet_name"])
-        wks = get_appstate_sheet(gc, sh)
         now_str = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
-        wks.update_value(APPSTATE_LAST_UP_CELL, now_str)
+        APPSTATE.set({APPSTATE_LAST_UP_CELL: now_str})
         logger.info(f"Saved last up time {now_str} to Google Sheet AppState tab")
     except Exception as e:
         logger.error(f"Failed to save last up time to Google Sheet: {e}")
@@ -148,10 +588,7 @@ def save_last_up():
 def load_last_up():
     """I need to load the last up time from the AppState tab."""
     try:
-        gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
-        sh = gc.open(CONFIG["sheet_name"])
-        wks = get_appstate_sheet(gc, sh)
-        val = wks.get_value(APPSTATE_LAST_UP_CELL)
+        val = APPSTATE.get(APPSTATE_LAST_UP_CELL)
         return val.strip() if val else "N/A"
     except Exception as e:
         logger.error(f"Failed to load last up time from Google Sheet: {e}")
@@ -160,11 +597,8 @@ def load_last_up():
 def save_last_down():
     """I need to save the last time the app went down to the AppState tab."""
     try:
-        gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
-        sh = gc.open(CONFIG["sheet_name"])
-        wks = get_appstate_sheet(gc, sh)
         now_str = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
-        wks.update_value(APPSTATE_LAST_DOWN_CELL, now_str)
+        APPSTATE.set({APPSTATE_LAST_DOWN_CELL: now_str})
         logger.info(f"Saved last down time {now_str} to Google Sheet AppState tab")
     except Exception as e:
         logger.error(f"Failed to save last down time to Google Sheet: {e}")
@@ -172,15 +606,151 @@ def save_last_down():
 def load_last_down():
     """I need to load the last down time from the AppState tab."""
     try:
-        gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
-        sh = gc.open(CONFIG["sheet_name"])
-        wks = get_appstate_sheet(gc, sh)
-        val = wks.get_value(APPSTATE_LAST_DOWN_CELL)
+        val = APPSTATE.get(APPSTATE_LAST_DOWN_CELL)
         return val.strip() if val else "N/A"
     except Exception as e:
         logger.error(f"Failed to load last down time from Google Sheet: {e}")
         return "N/A"
 
+# --- Checkpoint Journal ---
+class CheckpointJournal:
+    """
+    I need each source's last processed UID recorded durably on local disk (fsync'd) as soon as its
+    emails are written, with only the newest UID copied to the AppState tab, at most once per cycle and
+    CHECKPOINT_FLUSH_INTERVAL, instead of a Sheets write per email. The local journal wins over the
+    sheet; the sheet copy seeds a fresh install.
+
+    Before a batch of transactions is written, its row ids are journaled as pending. If the process dies
+    (or the write fails) before the batch is committed, the next load looks for those ids among the
+    newest ledger rows (other sources may have written since): if the batch landed it is committed,
+    otherwise it is dropped and those emails are fetched again, so nothing is lost or inserted twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.entries = None
+        self.sources = {}
+        self.flushed_at = {}
+        self.fsyncs = 0
+        self.sheet_writes = 0
+        self.recovered = 0
+
+    def key(self, source):
+        return f"{CONFIG['sheet_name']}/{(source or {}).get('name') or 'default'}"
+
+    def load(self):
+        # Called with the lock held
+        self.entries = {}
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable checkpoint journal {self.path}: {e}")
+
+    def entry(self, source):
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            key = self.key(source)
+            self.sources[key] = source
+            return self.entries.get(key)
+
+    def persist(self):
+        """I need the journal on disk before I return: temp file, fsync, rename, fsync the directory."""
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            if os.name == "posix":
+                dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            self.fsyncs += 1
+
+    def last_uid(self, source=None):
+        entry = self.entry(source)
+        if entry is None:
+            uid = read_sheet_last_uid(source)
+            if uid is not None:
+                with self.lock:
+                    self.entries[self.key(source)] = {"uid": uid, "flushed_uid": uid, "pending": None}
+                    self.persist()
+            return uid
+        if entry.get("pending"):
+            self.recover(source, entry)
+        return entry["uid"]
+
+    def recover(self, source, entry):
+        """
+        I need to settle a batch that was being written when the last run stopped. Raises if the sheet
+        cannot be read, so the cycle is retried later rather than guessing.
+        """
+        pending = entry["pending"]
+        newest = STORAGE.recent_transactions(len(pending["ids"]) + CHECKPOINT_RECOVERY_ROWS, SHEETS_PRIORITY_CHECKPOINT)
+        found = {row[2] for row in newest if len(row) > 2}
+        landed = all(row_id in found for row_id in pending["ids"])
+        with self.lock:
+            if landed:
+                entry["uid"] = pending["uid"]
+                self.recovered += 1
+            entry["pending"] = None
+            self.persist()
+        logger.warning(
+            f"Checkpoint recovery{source_label(source)}: unfinished batch up to UID {pending['uid']} "
+            f"{'was written; committed it' if landed else 'was not written; it will be fetched again'}"
+        )
+
+    def begin(self, uid, txns, source=None):
+        """I need a batch journaled as pending before its transactions are written."""
+        with self.lock:
+            entry = self.entry(source) or {"uid": None, "flushed_uid": None}
+            entry["pending"] = {"uid": uid, "ids": [txn['row_id'] for txn in txns]}
+            self.entries[self.key(source)] = entry
+            self.persist()
+
+    def commit(self, uid, source=None):
+        """I need a source's progress recorded once its emails are written (or skipped)."""
+        with self.lock:
+            entry = self.entry(source) or {"flushed_uid": None}
+            entry["uid"] = uid
+            entry["pending"] = None
+            self.entries[self.key(source)] = entry
+            self.persist()
+
+    def flush(self, source=None, force=False):
+        """I need the newest committed UID copied to the AppState tab, if it changed and the interval passed."""
+        key = self.key(source)
+        if not force and time.monotonic() - self.flushed_at.get(key, float("-inf")) < CHECKPOINT_FLUSH_INTERVAL:
+            return
+        entry = self.entry(source)
+        if entry is None or entry["uid"] is None or entry["uid"] == entry.get("flushed_uid"):
+            return
+        uid = entry["uid"]
+        self.flushed_at[key] = time.monotonic()
+        if write_sheet_last_uid(uid, source):
+            self.sheet_writes += 1
+            with self.lock:
+                entry["flushed_uid"] = uid
+                self.persist()
+
+    def flush_all(self):
+        """I need every source's checkpoint in the AppState tab now (shutdown)."""
+        for source in list(self.sources.values()):
+            self.flush(source, force=True)
+
+    def stats(self):
+        return {"fsyncs": self.fsyncs, "sheet_writes": self.sheet_writes, "recovered": self.recovered}
+
+CHECKPOINTS = CheckpointJournal(CHECKPOINT_FILE)
+
 # --- Email Notifications ---
 def send_email(subject, body):
     """I need to send email notifications for important events only."""
@@ -199,63 +769,164 @@ def send_email(subject, body):
     except Exception as e:
         logger.error(f"Failed to send email: {e}")
 
+# --- Local Caches ---
+class JsonLRUCache:
+    """
+    I need a thread-safe, size-capped LRU mapping that persists to a JSON file. It is loaded lazily on
+    first use; save() writes it atomically, and only when something changed.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = None
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        # Called with the lock held; a missing or corrupt file just means an empty cache
+        self.entries = OrderedDict()
+        try:
+            with open(self.path, "r") as f:
+                self.entries.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache file {self.path}: {e}")
+
+    def get(self, key):
+        """I need (hit, value) for a key."""
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            if key not in self.entries:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def discard(self, key):
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            if self.entries.pop(key, None) is not None:
+                self.dirty = True
+
+    def save(self):
+        """
+        I need to write the cache out (atomically) if anything changed since the last save. Saves are
+        serialized by their own lock, so threads never share the temp file and an older snapshot never
+        replaces a newer one, while get/put only wait for the snapshot copy.
+        """
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                snapshot = list(self.entries.items())
+                self.dirty = False
+            try:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(dict(snapshot), f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                with self.lock:
+                    self.dirty = True
+                logger.error(f"Failed to save {self.path}: {e}")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries or ())}
+
 # --- Transaction Processing ---
+# Compiled once at import; parse_email_transaction runs for every fetched email
+AMOUNT_OUT_RE = re.compile(r'\$([0-9,]+\.\d{2}) came out of your account')
+AMOUNT_FOR_RE = re.compile(r'for \$([0-9,]+\.\d{2})')
+
+def find_amount(body):
+    """
+    I need the amount from the first line that has one, preferring "came out of your account" over
+    "for $" on that line. Neither pattern can span a line break, so two searches of the whole body
+    are enough: the "for $" match only wins when a line break separates it from the other one.
+    """
+    out = AMOUNT_OUT_RE.search(body)
+    for_ = AMOUNT_FOR_RE.search(body)
+    if out and for_ and for_.start() < out.start():
+        between = body[for_.start():out.start()]
+        if "\n" in between or "\r" in between:
+            return for_.group(1)
+    found = out or for_
+    return found.group(1) if found else None
+
+def label_value(line, bare_labels):
+    """I need the value after a "Label:" line, or None for a bare label whose value is on the next line."""
+    if line in bare_labels:
+        return None
+    return line.split(":", 1)[-1].strip("*").strip()
+
 def parse_email_transaction(body):
     """
     Parse a transaction email body and extract details.
     I need to handle various formats of transaction alerts.
-    TODO: Add HTML parsing if emails come in HTML-only format.
+    Mail without an amount is rejected before any line handling; otherwise merchant and date come from
+    one pass over the lines that stops as soon as both are known. Each field comes from the first line
+    that has it. HTML-only emails arrive here already flattened by html_to_text.
     """
-    lines = [line.strip() for line in body.replace('\r\n', '\n').replace('\r', '\n').split('\n') if line.strip()]
-
-    amount = None
-    amount_pattern_1 = re.compile(r'\$([0-9,]+\.\d{2}) came out of your account')
-    amount_pattern_2 = re.compile(r'for \$([0-9,]+\.\d{2})')
-    for line in lines:
-        match = amount_pattern_1.search(line)
-        if match:
-            amount = match.group(1)
-            break
-        match = amount_pattern_2.search(line)
-        if match:
-            amount = match.group(1)
-            break
+    amount = find_amount(body)
+    if not amount:
+        return None
 
     merchant = None
-    for i, line in enumerate(lines):
-        if "*To:*" in line or "To:" in line:
-            if line.strip() in ("*To:*", "To:"):
-                for j in range(i+1, len(lines)):
-                    next_line = lines[j].strip()
-                    if next_line:
-                        merchant = next_line
-                        break
-                break
-            else:
-                merchant = line.split(":", 1)[-1].strip("*").strip()
+    date = None
+    merchant_fallback = None
+    merchant_seen = date_seen = False
+    merchant_next = date_next = False
+
+    # Universal-newline StringIO reads lines lazily, so the scan never touches lines past the fields
+    for line in io.StringIO(body, newline=None):
+        line = line.strip()
+        if not line:
+            continue
+
+        # A bare "To:"/"Date:" label takes its value from the following line, whatever that line is
+        if merchant_next:
+            merchant, merchant_next = line, False
+        if date_next:
+            date, date_next = line, False
+
+        # Labels only count at the start of a line, so "Sent To: Jane Doe" is not the recipient field
+        if not merchant_seen and line.startswith(("To:", "*To:*")):
+            merchant_seen = True
+            merchant = label_value(line, ("*To:*", "To:"))
+            merchant_next = merchant is None
+        if not date_seen and line.startswith(("Date:", "*Date:*")):
+            date_seen = True
+            date = label_value(line, ("*Date:*", "Date:"))
+            date_next = date is None
+        if merchant_fallback is None and line[:9].lower() == "merchant:":
+            merchant_fallback = line.split(":", 1)[-1].strip()
+
+        if date_seen and not date_next and merchant_seen and not merchant_next:
+            if merchant or merchant_fallback is not None:
                 break
 
     if not merchant:
-        for line in lines:
-            if line.lower().startswith("merchant:"):
-                merchant = line.split(":", 1)[-1].strip()
-                break
+        merchant = merchant_fallback
 
-    date = None
-    for i, line in enumerate(lines):
-        if "*Date:*" in line or "Date:" in line:
-            if line.strip() in ("*Date:*", "Date:"):
-                for j in range(i+1, len(lines)):
-                    next_line = lines[j].strip()
-                    if next_line:
-                        date = next_line
-                        break
-                break
-            else:
-                date = line.split(":", 1)[-1].strip("*").strip()
-                break
-
-    if not amount or not merchant or not date:
+    if not merchant or not date:
         return None
 
     return {
@@ -264,56 +935,1278 @@ def parse_email_transaction(body):
         "date": date
     }
 
+# Tokens of an HTML document: comments, tags (group 1 = "/" for end tags, group 2 = name), then text runs
+HTML_TOKEN_RE = re.compile(r'<!--.*?(?:-->|$)|<(/?)([a-zA-Z][a-zA-Z0-9]*)\b[^>]*>|<[!?/][^>]*>|[^<]+|<', re.S)
+HTML_SPACE_RE = re.compile(r'\s+')
+HTML_SKIP_TAGS = frozenset(("head", "script", "style", "title", "template"))
+HTML_BLOCK_TAGS = frozenset((
+    "br", "p", "div", "tr", "td", "th", "li", "ul", "ol", "table", "tbody", "thead", "section",
+    "header", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "blockquote", "center", "dt", "dd",
+))
+
+def html_to_text(document, max_chars=HTML_MAX_TEXT_CHARS):
+    """
+    I need the visible text of an HTML-only alert with each block (paragraph, table cell, <br>...) on
+    its own line, so parse_email_transaction can read it like a plain-text alert. This walks the tokens
+    once without building a DOM, skips head/script/style content, and stops after max_chars of text.
+    """
+    out = []
+    size = 0
+    skip = None
+    for match in HTML_TOKEN_RE.finditer(document):
+        tag = match.group(2)
+        if tag:
+            tag = tag.lower()
+            if skip:
+                # A missing </head> must not hide the whole body
+                if (match.group(1) and tag == skip) or (skip == "head" and tag == "body"):
+                    skip = None
+            elif tag in HTML_SKIP_TAGS and not match.group(1):
+                skip = tag
+            elif tag in HTML_BLOCK_TAGS:
+                out.append("\n")
+            continue
+        text = match.group()
+        if skip or (text.startswith("<") and len(text) > 1):
+            continue
+        if "&" in text:
+            text = html.unescape(text)
+        # Source line breaks are just whitespace in HTML; only block tags start a new line
+        text = HTML_SPACE_RE.sub(" ", text)
+        out.append(text)
+        size += len(text)
+        if size >= max_chars:
+            break
+    return "".join(out)
+
+# --- Alert Templates ---
+class AlertTemplate:
+    """
+    I need one bank or card issuer's extraction rules: a regex per field, each capturing the value in
+    its first group. Patterns are matched against the whole body with re.MULTILINE and re.IGNORECASE.
+    """
+
+    def __init__(self, name, senders, amount, merchant, date):
+        self.name = name
+        self.senders = [sender.lower().lstrip("@") for sender in senders]
+        self.fields = {
+            "amount": re.compile(amount, re.M | re.I),
+            "desc": re.compile(merchant, re.M | re.I),
+            "date": re.compile(date, re.M | re.I),
+        }
+
+    def parse(self, body):
+        """I need the same dict as parse_email_transaction, or None if any field is missing."""
+        txn = {}
+        for field, pattern in self.fields.items():
+            match = pattern.search(body)
+            value = match.group(1).strip().strip("*").strip() if match else ""
+            if not value:
+                return None
+            txn[field] = value
+        return txn
+
+SENDER_ADDRESS_RE = re.compile(r'<([^<>]*)>')
+
+# Sender address or domain -> template, so picking a template is a dict lookup however many issuers there are
+ALERT_TEMPLATES = {}
+
+def register_alert_template(template):
+    """I need to index a template under each of its sender addresses and domains."""
+    for sender in template.senders:
+        if sender in ALERT_TEMPLATES and ALERT_TEMPLATES[sender] is not template:
+            logger.warning(f"Alert template {template.name} replaces {ALERT_TEMPLATES[sender].name} for {sender}")
+        ALERT_TEMPLATES[sender] = template
+
+def load_alert_templates():
+    """
+    I need the issuer templates from config.json's "alert_templates", e.g.
+    [{"name": "Chase", "senders": ["no.reply.alerts@chase.com", "chase.com"],
+      "amount": "\\$([0-9,]+\\.\\d{2})", "merchant": "^Merchant:\\s*(.+)$", "date": "^Date:\\s*(.+)$"}].
+    A template with a bad pattern is logged and skipped.
+    """
+    for cfg in CONFIG.get("alert_templates") or []:
+        try:
+            register_alert_template(AlertTemplate(**cfg))
+        except (TypeError, re.error) as e:
+            logger.error(f"Skipping alert template {cfg.get('name', cfg)}: {e}")
+
+def find_alert_template(sender):
+    """I need the template for a From header: exact address first, then its domain and parent domains."""
+    # email.utils.parseaddr is thorough but costs more than the whole template parse; "Name <addr>" is enough here
+    match = SENDER_ADDRESS_RE.search(sender or "")
+    address = (match.group(1) if match else sender or "").strip().lower()
+    if address in ALERT_TEMPLATES:
+        return ALERT_TEMPLATES[address]
+    domain = address.rpartition("@")[2]
+    while domain:
+        if domain in ALERT_TEMPLATES:
+            return ALERT_TEMPLATES[domain]
+        domain = domain.partition(".")[2]
+    return None
+
+def parse_alert(body, sender=None):
+    """
+    I need to parse an alert with its sender's template, or with the generic heuristics in
+    parse_email_transaction when no template is registered for the sender.
+    """
+    template = find_alert_template(sender)
+    if template is None:
+        return parse_email_transaction(body)
+    return template.parse(body)
+
+load_alert_templates()
+
 def get_allowed_categories(wks):
     """I need to get valid budget categories from the spreadsheet."""
     cats = wks.get_values('B28', 'B79')
     return [c[0] for c in cats if c and c[0].strip()]
 
-def classify_category(desc, allowed_categories):
-    """I need to automatically classify transactions based on merchant name."""
+class CategoryListCache:
+    """
+    I need the summary tab's category list (which changes maybe monthly) read once per TTL instead of
+    once per transaction, shared by every ingest worker. The spreadsheet's Drive modified time is no use
+    as a change check here, because every ledger write bumps it, so an expired entry is simply re-read
+    and compared; a changed list is logged and the merchant memo's rule tokens move with it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.categories = None
+        self.fetched_at = 0
+        self.reads = 0
+        self.hits = 0
+        self.changes = 0
+
+    def current(self):
+        """I need the cached list if it is still within its TTL, else None, without touching the sheet."""
+        ttl = float(CONFIG.get("category_cache_ttl", CATEGORY_CACHE_TTL))
+        with self.lock:
+            if self.categories is not None and time.monotonic() - self.fetched_at < ttl:
+                self.hits += 1
+                return self.categories
+        return None
+
+    def get(self):
+        """I need the allowed categories, from the cache unless the TTL ran out; only then is STORAGE asked."""
+        categories = self.current()
+        if categories is not None:
+            return categories
+        with self.lock:
+            try:
+                categories = STORAGE.categories()
+            except Exception as e:
+                if self.categories is None:
+                    raise
+                # A storage outage should not stop classification; the stale list is retried next call
+                logger.warning(f"Using the cached category list; re-reading it failed: {e}")
+                return self.categories
+            self.reads += 1
+            if self.categories is not None and categories != self.categories:
+                self.changes += 1
+                logger.info(f"Budget categories changed: {len(self.categories)} -> {len(categories)} categories")
+            self.categories = categories
+            self.fetched_at = time.monotonic()
+            return categories
+
+    def stats(self):
+        return {"reads": self.reads, "hits": self.hits, "changes": self.changes}
+
+CATEGORY_LIST = CategoryListCache()
+
+# Merchant rules in priority order: the first rule that matches and names an allowed category wins
+CATEGORY_RULES = [
+    (r'safeway|save mart|grocery|foodmaxx|winco|whalers|grocery outlet|costco', 'Groceries'),
+    (r'mcdonald|wendy|taco bell|in-n-out|sonic|popeyes|little caesars|chick[- ]fil[- ]a|arby|jack in the box|burger', 'Fast Food'),
+    (r'amazon', 'Shopping'),
+    (r'target|wal[- ]?mart|ross|macys|abc stores|dollar tree', 'Shopping'),
+    (r'starbucks|dunkin', 'Coffee Shops'),
+    (r'chevron|arco|shell|gas|fuel|7-eleven', 'Gas'),
+    (r'cinemark|movies|theatre', 'Movies & DVDs'),
+]
+CATEGORY_RULES_CHECK_INTERVAL = 5  # Seconds between mtime checks of config.json's "category_rules_file"
+KEYWORD_EXPANSION_LIMIT = 64  # Literal variants one alternative may expand to before it is left to re
+
+def expand_keywords(pattern):
+    """
+    I need the literal strings a simple rule pattern matches: alternation, character classes without
+    ranges, "?" and escaped punctuation. Returns None for anything else (., *, groups, \\d...), which
+    is then matched with re instead.
+    """
+    keywords = []
+    current = [""]
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "|":
+            keywords += current
+            current = [""]
+            i += 1
+            continue
+        if ch == "[":
+            end = pattern.find("]", i + 2)
+            body = pattern[i + 1:end]
+            if end == -1 or body.startswith("^") or "\\" in body or "-" in body[1:-1]:
+                return None
+            choices = list(body)
+            i = end + 1
+        elif ch == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                return None
+            choices = [pattern[i + 1]]
+            i += 2
+        elif ch in ".*+?(){}^$]":
+            return None
+        else:
+            choices = [ch]
+            i += 1
+        if i < len(pattern) and pattern[i] == "?":
+            choices.append("")
+            i += 1
+        current = [prefix + choice for prefix in current for choice in choices]
+        if len(current) > KEYWORD_EXPANSION_LIMIT:
+            return None
+    return keywords + current
+
+class KeywordAutomaton:
+    """
+    I need an Aho-Corasick automaton over rule keywords: one pass over the text finds every keyword
+    occurrence, however many keywords there are. Each keyword carries its rule index, and a search
+    returns the lowest index seen.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [None]
+
+    def add(self, keyword, index):
+        node = 0
+        for ch in keyword:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(None)
+                self.goto[node][ch] = nxt
+            node = nxt
+        if self.out[node] is None or index < self.out[node]:
+            self.out[node] = index
+
+    def build(self):
+        """I need the failure links, with each node's output folded in from its failure chain."""
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, child in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and ch not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(ch, 0)
+                inherited = self.out[self.fail[child]]
+                if inherited is not None and (self.out[child] is None or inherited < self.out[child]):
+                    self.out[child] = inherited
+                queue.append(child)
+
+    def search(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        best = out[0]
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            found = out[node]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return best
+
+class CategoryMatcher:
+    """
+    I need the rules compiled for one set of allowed categories. Rules naming other categories are left
+    out up front, so the first match found is the answer. Patterns that expand to keywords go into one
+    automaton; the rest are tried with re, in priority order, only when they could beat its result.
+    """
+
+    def __init__(self, rules, allowed_categories):
+        self.allowed = frozenset(allowed_categories)
+        self.order = tuple(allowed_categories)
+        self.categories = []
+        self.automaton = KeywordAutomaton()
+        self.regex_rules = []
+        for pattern, category in rules:
+            if category not in self.allowed:
+                continue
+            index = len(self.categories)
+            self.categories.append(category)
+            keywords = expand_keywords(pattern)
+            if keywords is None:
+                self.regex_rules.append((index, re.compile(pattern)))
+            else:
+                for keyword in keywords:
+                    self.automaton.add(keyword, index)
+        self.automaton.build()
+
+    def match(self, desc_low):
+        """I need the category of the highest-priority rule matching a lowercased description, or None."""
+        best = self.automaton.search(desc_low)
+        for index, regex in self.regex_rules:
+            if best is not None and index >= best:
+                break
+            if regex.search(desc_low):
+                best = index
+                break
+        return self.categories[best] if best is not None else None
+
+class CategoryRuleSet:
+    """
+    I need one generation of the rules with its compiled matchers. A rule set is never changed after it
+    is published, so a classification that picked it up keeps a consistent rule table throughout.
+    """
+
+    def __init__(self, rules, source="built-in", mtime=None):
+        self.rules = rules
+        self.source = source
+        self.mtime = mtime
+        self.matchers = {}
+
+    def matcher(self, allowed_categories):
+        matcher = self.matchers.get(allowed_categories)
+        if matcher is None:
+            matcher = CategoryMatcher(self.rules, allowed_categories)
+            # Identifies what a cached classification was computed from, stable across restarts
+            matcher.token = hashlib.sha1(json.dumps([self.rules, allowed_categories]).encode()).hexdigest()[:16]
+            self.matchers[allowed_categories] = matcher
+        return matcher
+
+def load_category_rules_file(path):
+    """
+    I need the rules from a JSON file as [(pattern, category)] in priority order. The file holds a list
+    like [{"pattern": "trader joe", "category": "Groceries", "priority": 10}]; higher priority wins and
+    equal priorities keep file order. Raises ValueError for a malformed file or rule.
+    """
+    with open(path, "r") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError("expected a list of rules")
+    ranked = []
+    for i, entry in enumerate(entries):
+        try:
+            pattern, category = entry["pattern"], entry["category"]
+            priority = int(entry.get("priority", 0))
+            if not isinstance(pattern, str) or not isinstance(category, str):
+                raise TypeError("pattern and category must be strings")
+            re.compile(pattern)
+        except (KeyError, TypeError, ValueError, AttributeError, re.error) as e:
+            raise ValueError(f"rule {i}: {e!r}")
+        ranked.append((-priority, i, pattern, category))
+    return [(pattern, category) for _, _, pattern, category in sorted(ranked)]
+
+class CategoryRuleStore:
+    """
+    I need the live rule set: CATEGORY_RULES by default, or config.json's "category_rules_file", reloaded
+    when its mtime changes. A reload compiles the new rule set (including matchers for every category list
+    in use) off to the side and then swaps it in with a single assignment. A bad file keeps the old rules.
+    """
+
+    def __init__(self):
+        self.current = CategoryRuleSet(CATEGORY_RULES)
+        self.lock = threading.Lock()
+        self.checked_at = 0
+        self.failed_mtime = None
+        self.matches = 0
+        self.match_seconds = 0.0
+        self.max_match_us = 0.0
+
+    def refresh(self):
+        """I need to pick up an edited rules file; the mtime is checked at most every CATEGORY_RULES_CHECK_INTERVAL."""
+        path = CONFIG.get("category_rules_file")
+        now = time.monotonic()
+        if not path or now - self.checked_at < CATEGORY_RULES_CHECK_INTERVAL:
+            return
+        # Whoever holds the lock is already reloading; everyone else carries on with the current rules
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.checked_at = now
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError as e:
+                mtime = None
+                if self.failed_mtime != "missing":
+                    logger.error(f"Category rules file {path} unavailable ({e}); keeping {len(self.current.rules)} rules")
+                    self.failed_mtime = "missing"
+            if mtime is None or mtime in (self.current.mtime, self.failed_mtime):
+                return
+
+            started = time.perf_counter()
+            try:
+                rules = load_category_rules_file(path)
+            except (OSError, ValueError) as e:
+                self.failed_mtime = mtime
+                logger.error(f"Invalid category rules file {path}: {e}; keeping {len(self.current.rules)} rules")
+                return
+            ruleset = CategoryRuleSet(rules, path, mtime)
+            for allowed_categories in list(self.current.matchers):
+                ruleset.matcher(allowed_categories)
+            self.current = ruleset
+            self.failed_mtime = None
+            logger.info(
+                f"Loaded {len(rules)} category rules from {path} in {(time.perf_counter() - started) * 1000:.1f} ms; "
+                f"match latency so far: {self.stats()['avg_match_us']} us avg, {self.max_match_us:.1f} us max"
+            )
+        finally:
+            self.lock.release()
+
+    def matcher(self, allowed_categories):
+        """I need the current rule set's matcher for an allowed-category tuple."""
+        self.refresh()
+        return self.current.matcher(allowed_categories)
+
+    def match(self, matcher, desc_low):
+        """I need the matched category (or None), timing the match."""
+        started = time.perf_counter()
+        mapped = matcher.match(desc_low)
+        elapsed = time.perf_counter() - started
+        self.matches += 1
+        self.match_seconds += elapsed
+        self.max_match_us = max(self.max_match_us, elapsed * 1e6)
+        return mapped
+
+    def stats(self):
+        avg = self.match_seconds / self.matches * 1e6 if self.matches else 0
+        return {
+            "rules": len(self.current.rules),
+            "source": self.current.source,
+            "matches": self.matches,
+            "avg_match_us": round(avg, 1),
+            "max_match_us": round(self.max_match_us, 1),
+        }
+
+CATEGORY_RULE_STORE = CategoryRuleStore()
+
+# --- Merchant Normalization ---
+KNOWN_MERCHANTS = {
+    "amazon": ["amazon", "amazon com", "amazon mktplace", "amazon mktpl", "amzn", "amzn mktp", "amzn digital", "prime video"],
+    "walmart": ["walmart", "wal-mart", "wal mart", "wm supercenter", "walmart com"],
+    "target": ["target", "target com", "target t-"],
+    "costco": ["costco", "costco whse", "costco gas", "costco wholesale"],
+    "safeway": ["safeway", "safeway fuel", "safeway store"],
+    "starbucks": ["starbucks", "starbucks store", "starbucks card"],
+    "dunkin": ["dunkin", "dunkin donuts"],
+    "mcdonald's": ["mcdonald's", "mcdonalds", "mc donalds", "mcdonald s"],
+    "chick-fil-a": ["chick-fil-a", "chick fil a", "chickfila"],
+    "in-n-out": ["in-n-out", "in n out", "in-n-out burger"],
+    "taco bell": ["taco bell"],
+    "chevron": ["chevron", "chevron usa"],
+    "shell": ["shell oil", "shell service", "shell"],
+    "arco": ["arco", "ampm", "arco ampm"],
+    "7-eleven": ["7-eleven", "7 eleven", "7-11", "seven eleven"],
+    "uber": ["uber", "uber trip", "uber com"],
+    "uber eats": ["uber eats", "ubereats"],
+    "doordash": ["doordash", "dd doordash"],
+    "cinemark": ["cinemark", "cinemark theatres"],
+    "netflix": ["netflix", "netflix com"],
+    "spotify": ["spotify", "spotify usa"],
+    "apple": ["apple com bill", "apple com", "apple store"],
+    "google": ["google", "google play"],
+    "dollar tree": ["dollar tree", "dollartree"],
+    "grocery outlet": ["grocery outlet"],
+    "winco": ["winco", "winco foods"],
+}
+# Card processor / POS prefixes that come before the real merchant ("SQ *BLUE BOTTLE", "TST* CAFE")
+MERCHANT_PREFIX_RE = re.compile(
+    r'^(?:(?:sq|tst|sp|pp|py|ic|bt|ckc|paypal|in|pos|cke|toast|square)\s*\*\s*'
+    r'|(?:pos|ach|checkcard|debit card|recurring|purchase)\s+(?:purchase\s+)?(?:authorized on\s+)?(?:\d\d/?\d\d\s+)?)+'
+)
+# "*2K3L45" order references, "#0457" / " 04571 " store numbers and everything after them (city, state, phone)
+MERCHANT_REFERENCE_RE = re.compile(r'\*\s*[a-z0-9]*\d[a-z0-9]*')
+MERCHANT_LEADING_NUMBER_RE = re.compile(r'^(?:#?\s*\d+\s+)+')
+MERCHANT_STORE_NUMBER_RE = re.compile(r'(?:#\s*\d+|\s\d{3,}\b).*$')
+MERCHANT_JUNK_RE = re.compile(r"[^a-z0-9&\- ]+")
+US_STATE_CODES = frozenset(
+    "al ak az ar ca co ct de fl ga hi id il in ia ks ky la me md ma mi mn ms mo mt ne nv nh nj nm ny nc nd oh ok "
+    "or pa ri sc sd tn tx ut vt va wa wv wi wy dc".split()
+)
+
+def merchant_tokens(desc):
+    """I need a raw descriptor cut down to lowercase merchant-name tokens (no processor prefix, store number or location)."""
+    text = MERCHANT_PREFIX_RE.sub("", desc.lower().strip())
+    text = MERCHANT_LEADING_NUMBER_RE.sub("", MERCHANT_REFERENCE_RE.sub(" ", text))
+    text = MERCHANT_STORE_NUMBER_RE.sub("", text)
+    tokens = MERCHANT_JUNK_RE.sub(" ", text.replace("'", "")).split()
+    # Trailing "... CA" or "... CA 95112" with no store number in front of it
+    if len(tokens) > 2 and tokens[-1].isdigit() and len(tokens[-1]) == 5:
+        tokens.pop()
+    if len(tokens) > 1 and tokens[-1] in US_STATE_CODES:
+        tokens.pop()
+    return tokens
+
+class MerchantIndex:
+    """
+    I need raw descriptors mapped to one canonical merchant. Every alias is cleaned the same way as a
+    descriptor and stored by its token tuple, so a lookup is at most a few dict probes for the longest
+    alias the descriptor starts with, whatever city or terminal id follows it.
+    """
+
+    def __init__(self, merchants):
+        self.aliases = {}
+        for canonical, aliases in merchants.items():
+            for alias in [canonical] + list(aliases):
+                tokens = tuple(merchant_tokens(alias))
+                if tokens:
+                    self.aliases.setdefault(tokens, canonical.lower())
+        self.max_tokens = max((len(tokens) for tokens in self.aliases), default=0)
+
+    def normalize(self, desc):
+        """I need the canonical merchant key for a descriptor; unknown merchants get their cleaned name."""
+        tokens = merchant_tokens(desc)
+        for n in range(min(self.max_tokens, len(tokens)), 0, -1):
+            canonical = self.aliases.get(tuple(tokens[:n]))
+            if canonical is not None:
+                return canonical
+        return " ".join(tokens) or desc.lower().strip()
+
+def load_merchant_index():
+    """I need the built-in merchant list plus config.json "merchant_aliases" ({canonical: [aliases]}) indexed."""
+    merchants = {canonical: list(aliases) for canonical, aliases in KNOWN_MERCHANTS.items()}
+    for canonical, aliases in CONFIG.get("merchant_aliases", {}).items():
+        merchants.setdefault(canonical.lower(), []).extend(aliases)
+    return MerchantIndex(merchants)
+
+MERCHANT_INDEX = load_merchant_index()
+
+def normalize_merchant(desc):
+    """I need "SQ *STARBUCKS #0457 SAN JOSE CA" and "Starbucks Store 12" to come out as the same merchant."""
+    return MERCHANT_INDEX.normalize(desc)
+
+class MerchantMemo(JsonLRUCache):
+    """
+    I need to remember each merchant's category so repeat merchants skip the rule scan. Entries are
+    [category, origin]: origin is the token of the rules that produced it (stale once rules or the
+    category list change) or "sheet" for a category someone fixed by hand in the transactions tab,
+    which then wins over the rules. A fix is told apart from a rule change by the category each row
+    was written with, kept by row id beside the memo file.
+    """
+
+    def __init__(self, path, max_entries):
+        super().__init__(path, max_entries)
+        self.written = JsonLRUCache(f"{os.path.splitext(path)[0]}_written.json", MERCHANT_MEMO_WRITTEN_ROWS)
+        self.saved_at = time.monotonic()
+        self.learned_at = None
+
+    def lookup(self, key, matcher):
+        hit, entry = self.get(key)
+        if hit and entry[0] in matcher.allowed and entry[1] in ("sheet", matcher.token):
+            return entry[0]
+        return None
+
+    def record_written(self, txns):
+        """I need the category each transaction goes to storage with remembered by its row id."""
+        for txn in txns:
+            if txn.get('row_id'):
+                self.written.put(txn['row_id'], txn['category'])
+
+    def save(self):
+        super().save()
+        self.written.save()
+
+    def maybe_save(self):
+        if time.monotonic() - self.saved_at >= MERCHANT_MEMO_SAVE_INTERVAL:
+            self.saved_at = time.monotonic()
+            self.save()
+
+    def learn_due(self):
+        """I need to know whether it is time to re-read the sheet for fixes; a yes claims the slot, even if the read fails."""
+        if self.learned_at is not None and time.monotonic() - self.learned_at < MERCHANT_MEMO_LEARN_INTERVAL:
+            return False
+        self.learned_at = time.monotonic()
+        return True
+
+    def learn(self, rows, matcher):
+        """
+        I need manual category fixes learned from [description, category, row id] rows, newest first. A row
+        whose category differs from the one it was written with was corrected by hand; the newest row for a
+        merchant wins. Rows with no written category on record are skipped: today's rules say nothing about
+        what was written, so comparing with them would take every rule change for a hand fix.
+        """
+        started = time.perf_counter()
+        seen = set()
+        learned = 0
+        for row in rows:
+            if len(row) < 3 or not row[0].strip() or row[1].strip() not in matcher.allowed:
+                continue
+            key = normalize_merchant(row[0])
+            if key in seen:
+                continue
+            seen.add(key)
+            known, written = self.written.get(row[2])
+            if not known:
+                continue
+            category = row[1].strip()
+            hit, entry = self.get(key)
+            if category != written:
+                if not hit or entry != [category, "sheet"]:
+                    self.put(key, [category, "sheet"])
+                    learned += 1
+            elif hit and entry[1] == "sheet" and entry[0] != category:
+                # The fix was undone by hand; the rules decide again
+                self.discard(key)
+        self.save()
+        self.saved_at = time.monotonic()
+        logger.info(
+            f"Merchant memo: learned {learned} correction(s) from {len(rows)} sheet rows "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+MERCHANT_MEMO = MerchantMemo(MERCHANT_MEMO_FILE, int(CONFIG.get("merchant_memo_size", MERCHANT_MEMO_SIZE)))
+
+def classify_with_rules(desc, matcher, merchant=None):
+    """
+    I need the rule-based category for a description, with the Uncategorized/Shopping fallbacks. The raw
+    description is tried first so existing rules behave as before; the canonical merchant catches what
+    a processor prefix or abbreviation hid from them ("AMZN Mktp" -> amazon).
+    """
     desc_low = desc.lower()
-    rules = [
-        (r'safeway|save mart|grocery|foodmaxx|winco|whalers|grocery outlet|costco', 'Groceries'),
-        (r'mcdonald|wendy|taco bell|in-n-out|sonic|popeyes|little caesars|chick[- ]fil[- ]a|arby|jack in the box|burger', 'Fast Food'),
-        (r'amazon', 'Shopping'),
-        (r'target|wal[- ]?mart|ross|macys|abc stores|dollar tree', 'Shopping'),
-        (r'starbucks|dunkin', 'Coffee Shops'),
-        (r'chevron|arco|shell|gas|fuel|7-eleven', 'Gas'),
-        (r'cinemark|movies|theatre', 'Movies & DVDs'),
-    ]
-
-    for regex, mapped in rules:
-        if re.search(regex, desc_low):
-            if mapped in allowed_categories:
-                return mapped
-
-    if "Uncategorized" in allowed_categories:
+    mapped = CATEGORY_RULE_STORE.match(matcher, desc_low)
+    if mapped is None:
+        merchant = merchant or normalize_merchant(desc)
+        if merchant != desc_low:
+            mapped = CATEGORY_RULE_STORE.match(matcher, merchant)
+    if mapped is not None:
+        return mapped
+
+    if "Uncategorized" in matcher.allowed:
         return "Uncategorized"
-    if "Shopping" in allowed_categories:
+    if "Shopping" in matcher.allowed:
         return "Shopping"
-    return allowed_categories[0] if allowed_categories else ""
+    return next(iter(matcher.order), "")
+
+def classify_category(desc, allowed_categories, merchant=None):
+    """I need to automatically classify transactions based on merchant name, remembering each merchant's answer."""
+    matcher = CATEGORY_RULE_STORE.matcher(tuple(allowed_categories))
+    key = merchant or normalize_merchant(desc)
+    category = MERCHANT_MEMO.lookup(key, matcher)
+    if category is None:
+        category = classify_with_rules(desc, matcher, key)
+        MERCHANT_MEMO.put(key, [category, matcher.token])
+    return category
+
+# --- Append-mode Ledger ---
+def ledger_layout():
+    """I need the transactions tab layout: "insert" (newest at row 5, the default) or "append"."""
+    return str(CONFIG.get("ledger_layout", "insert")).lower()
+
+class AppendLedger:
+    """
+    I need the append-mode layout's insertion point: transactions go to the next free row, oldest at
+    row 5, so nothing below is shifted and formulas/conditional formats are left alone. The next row is
+    found with one column scan the first time and tracked locally (LEDGER_STATE_FILE) after that; delete
+    the file if rows are added or removed by hand.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.next_row = None
+        self.view_checked = False
+
+    def sheet_key(self):
+        return [CONFIG["sheet_name"], CONFIG["transactions_tab"]]
+
+    def locate(self, wks):
+        """I need the next free row, from memory, the state file, or (once) a scan of the date column."""
+        if self.next_row is not None:
+            return self.next_row
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            if state.get("sheet") == self.sheet_key():
+                self.next_row = int(state["next_row"])
+                return self.next_row
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable ledger state {self.path}: {e}")
+        dates = wks.get_col(2, include_tailing_empty=False)
+        self.next_row = max(LEDGER_FIRST_ROW, len(dates) + 1)
+        logger.info(f"Append-mode ledger: next free row is {self.next_row} (scanned {len(dates)} rows)")
+        self.save()
+        return self.next_row
+
+    def save(self):
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"sheet": self.sheet_key(), "next_row": self.next_row}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Failed to save ledger state: {e}")
+
+    def next_free_row(self, tab, priority=SHEETS_PRIORITY_TRANSACTIONS):
+        """I need locate() as its own scheduled call, charged a read only while the row is still unknown."""
+        if self.next_row is None:
+            SHEETS_SCHEDULER.call(lambda sheets: self.locate(sheets.worksheet(tab)), priority, reads=1)
+        return self.next_row
+
+    def append(self, tab, rows):
+        """
+        I need rows (oldest first) written at the next free row, growing the grid in chunks; returns the
+        first row used. Each API request is its own scheduled call charged what it costs: the one-time
+        scan a read, a grid grow and the value write a write each, the view tab a read and three writes.
+        """
+        row = self.next_free_row(tab)
+        last_row = row + len(rows) - 1
+        # The grid size comes with the cached worksheet handle, so checking it sends no request
+        grid_rows = SHEETS_SCHEDULER.call(lambda sheets: sheets.worksheet(tab).rows)
+        if last_row > grid_rows:
+            SHEETS_SCHEDULER.call(
+                lambda sheets: sheets.worksheet(tab).add_rows(max(LEDGER_GROW_ROWS, last_row - grid_rows)), writes=1
+            )
+        SHEETS_SCHEDULER.call(lambda sheets: sheets.worksheet(tab).update_values((row, 2), rows), writes=1)
+        self.next_row = last_row + 1
+        self.save()
+        if CONFIG.get("ledger_view_tab") and not self.view_checked:
+            SHEETS_SCHEDULER.call(self.ensure_view, reads=1, writes=3)
+        return row
+
+    def ensure_view(self, sheets):
+        """
+        I need the newest-first view when "ledger_view_tab" is set: a tab holding one SORT formula over
+        the ledger, so ordering costs the sheet a recalculation instead of shifting rows. Created once,
+        never overwritten.
+        """
+        title = CONFIG.get("ledger_view_tab")
+        if not title or self.view_checked:
+            return
+        try:
+            sheets.worksheet(title)
+        except pygsheets.WorksheetNotFound:
+            view = sheets.spreadsheet().add_worksheet(title, rows=10, cols=4)
+            tab = "'" + CONFIG["transactions_tab"].replace("'", "''") + "'"
+            ledger = f"{tab}!B{LEDGER_FIRST_ROW}:E"
+            dates = f"{tab}!B{LEDGER_FIRST_ROW}:B"
+            view.update_values('A1', [["Date", "Amount", "Description", "Category"]])
+            view.update_value('A2', f'=SORT(FILTER({ledger}, {dates}<>""), FILTER(ROW({dates}), {dates}<>""), FALSE)')
+            logger.info(f"Created newest-first ledger view tab '{title}'")
+        self.view_checked = True
+
+LEDGER = AppendLedger(LEDGER_STATE_FILE)
+
+def read_recent_transactions(wks, count):
+    """I need up to count [description, category, row id] rows from the transactions tab, newest first, in one range read."""
+    if ledger_layout() != "append":
+        return wks.get_values(f'D{LEDGER_FIRST_ROW}', f'F{LEDGER_FIRST_ROW - 1 + count}')
+    last_row = LEDGER.locate(wks) - 1
+    if last_row < LEDGER_FIRST_ROW:
+        return []
+    return wks.get_values(f'D{max(LEDGER_FIRST_ROW, last_row - count + 1)}', f'F{last_row}')[::-1]
+
+def learn_sheet_corrections(allowed_categories):
+    """I need the merchant memo to pick up hand-fixed categories when a re-read is due; never fatal."""
+    if not MERCHANT_MEMO.learn_due():
+        return
+    try:
+        rows = STORAGE.recent_transactions(MERCHANT_MEMO_LEARN_ROWS)
+        MERCHANT_MEMO.learn(rows, CATEGORY_RULE_STORE.matcher(tuple(allowed_categories)))
+    except Exception as e:
+        logger.error(f"Failed to learn category corrections from the sheet: {e}")
+
+def classify_transactions(txns, allowed_categories):
+    """I need each transaction's canonical merchant and category filled in."""
+    for txn in txns:
+        txn['merchant'] = normalize_merchant(txn['desc'])
+        txn['category'] = classify_category(txn['desc'], allowed_categories, txn['merchant'])
+    MERCHANT_MEMO.record_written(txns)
+    MERCHANT_MEMO.maybe_save()
+
+def insert_transactions(txns):
+    """
+    I need to insert a batch of transactions (oldest first) into storage in one append (on the sheet one
+    row insert and one range write, instead of an insert plus four cell writes per transaction).
+    """
+    if not txns:
+        return
+    allowed_categories = CATEGORY_LIST.get()
+    learn_sheet_corrections(allowed_categories)
+    classify_transactions(txns, allowed_categories)
+    first_row = STORAGE.append_transactions(
+        [[txn['date'], txn['amount'], txn['desc'], txn['category'], txn.get('row_id', '')] for txn in txns]
+    )
+
+    # Save the transaction for reference
+    save_last_transaction(txns[-1])
+    for txn in txns:
+        logger.info(f"Inserted transaction: {txn}")
+    if len(txns) > 1:
+        logger.info(f"Inserted {len(txns)} transactions at rows {first_row}-{first_row + len(txns) - 1} in one batch")
 
 def insert_transaction(txn):
     """I need to insert a transaction into the Google Sheet."""
-    gc = pygsheets.authorize(service_account_file=CONFIG["google_service_account_json"])
-    sh = gc.open(CONFIG["sheet_name"])
-    wks = sh.worksheet('title', CONFIG["transactions_tab"])
-    summary_wks = sh.worksheet('title', CONFIG["summary_tab"])
-
-    allowed_categories = get_allowed_categories(summary_wks)
-    txn['category'] = classify_category(txn['desc'], allowed_categories)
-
-    # Insert at row 5 (pushing everything down)
-    wks.insert_rows(4, number=1, values=None)
-    row = 5
-    wks.update_value((row, 2), txn['date'])
-    wks.update_value((row, 3), txn['amount'])
-    wks.update_value((row, 4), txn['desc'])
-    wks.update_value((row, 5), txn['category'])
+    insert_transactions([txn])
 
-    # Save the transaction for reference
-    save_last_transaction(txn)
-    logger.info(f"Inserted transaction at row {row}: {txn}")
+# --- Storage Backends ---
+def insert_ledger_rows(tab, rows):
+    """
+    I need rows (top first) inserted at row 5 as two scheduled calls: the blank rows, never retried once
+    they may have landed, then their values with update_values, which is safe to retry on its own.
+    Callers hold SheetsBackend.write_lock so nothing lands in between.
+    """
+    SHEETS_SCHEDULER.call(
+        lambda sheets: sheets.worksheet(tab).insert_rows(LEDGER_FIRST_ROW - 1, number=len(rows), values=None),
+        writes=1, idempotent=False,
+    )
+    SHEETS_SCHEDULER.call(lambda sheets: sheets.worksheet(tab).update_values((LEDGER_FIRST_ROW, 2), rows), writes=1)
+
+class SheetsBackend:
+    """
+    I need the Google Sheet as the store: transactions on the transactions tab (insert or append layout),
+    categories from the summary tab and app state on the AppState tab, every request queued with
+    SHEETS_SCHEDULER. AppState writes that queue up behind one another go out as one batch update.
+    """
+
+    name = "sheets"
+
+    def __init__(self):
+        self.write_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.pending_state = {}
+
+    def append_transactions(self, rows):
+        """
+        I need [date, amount, description, category, row id] rows (oldest first) written. In the default
+        layout they go in at row 5 with the newest on top, the same order one-at-a-time inserts left, with one
+        row insert and one range write; in append mode they are written below the last transaction without
+        shifting anything. Returns the first row written.
+        """
+        tab = CONFIG["transactions_tab"]
+        with self.write_lock:
+            if ledger_layout() == "append":
+                return LEDGER.append(tab, rows)
+            # Insert at row 5 (pushing everything down)
+            insert_ledger_rows(tab, rows[::-1])
+            return LEDGER_FIRST_ROW
+
+    def add_history(self, rows):
+        """
+        I need backfilled rows (newest first) inserted at row 5 with one row insert and one range write.
+        History is older than anything already in the sheet, so an append-mode ledger gets it on top too,
+        oldest first, and its tracked next row moves down by the rows added.
+        """
+        tab = CONFIG["transactions_tab"]
+        append = ledger_layout() == "append"
+        if append:
+            rows = rows[::-1]
+        with self.write_lock:
+            if append:
+                LEDGER.next_free_row(tab)
+            insert_ledger_rows(tab, rows)
+            if append:
+                LEDGER.next_row += len(rows)
+                LEDGER.save()
+
+    def recent_transactions(self, count, priority=SHEETS_PRIORITY_BOOKKEEPING):
+        if ledger_layout() == "append":
+            # The one-time scan for the last row is a read of its own
+            LEDGER.next_free_row(CONFIG["transactions_tab"], priority)
+        return SHEETS_SCHEDULER.call(
+            lambda sheets: read_recent_transactions(sheets.worksheet(CONFIG["transactions_tab"]), count),
+            priority, reads=1, key=("recent", count),
+        )
+
+    def categories(self):
+        return SHEETS_SCHEDULER.call(
+            lambda sheets: get_allowed_categories(sheets.worksheet(CONFIG["summary_tab"])),
+            reads=1, key="categories",
+        )
+
+    def read_state(self, rows, priority=SHEETS_PRIORITY_BOOKKEEPING):
+        """I need {cell: value} for A1:B<rows> of the AppState tab, in one range read."""
+        values = SHEETS_SCHEDULER.call(
+            lambda sheets: sheets.appstate().get_values("A1", f"B{rows}"),
+            priority, reads=1, key=("appstate read", rows),
+        )
+        state = {}
+        for r in range(1, rows + 1):
+            row = values[r - 1] if r <= len(values) else []
+            for c, col in enumerate("AB"):
+                state[f"{col}{r}"] = row[c] if c < len(row) else ""
+        return state
+
+    def write_state(self, values, priority=SHEETS_PRIORITY_BOOKKEEPING):
+        with self.state_lock:
+            self.pending_state.update(values)
+        SHEETS_SCHEDULER.call(self.flush_state, priority, writes=1, key="appstate write")
+
+    def flush_state(self, sheets):
+        with self.state_lock:
+            pending, self.pending_state = self.pending_state, {}
+        if not pending:
+            return
+        try:
+            sheets.appstate().update_values_batch(list(pending), [[[value]] for value in pending.values()])
+        except Exception:
+            with self.state_lock:
+                for cell, value in pending.items():
+                    self.pending_state.setdefault(cell, value)
+            raise
+
+def default_categories():
+    """I need a category list for stores without a summary tab: config.json "categories", else the built-in rules'."""
+    return list(CONFIG.get("categories") or dict.fromkeys([category for _, category in CATEGORY_RULES] + ["Uncategorized"]))
+
+class MemoryBackend:
+    """
+    I need a store that never leaves the process, so benchmarks and soak tests run the whole pipeline
+    offline at full speed. Rows are kept oldest first; nothing survives a restart.
+    """
+
+    name = "memory"
+
+    def __init__(self, categories=None):
+        self.lock = threading.Lock()
+        self.rows = []
+        self.state = {}
+        self.category_list = list(categories or default_categories())
+
+    def append_transactions(self, rows):
+        with self.lock:
+            first_row = len(self.rows) + 1
+            self.rows.extend(list(row) for row in rows)
+            return first_row
+
+    def add_history(self, rows):
+        """I need backfilled rows (newest first) placed before everything already stored."""
+        with self.lock:
+            self.rows[0:0] = [list(row) for row in reversed(rows)]
+
+    def recent_transactions(self, count, priority=None):
+        with self.lock:
+            return [row[2:5] for row in reversed(self.rows[-count:])] if count else []
+
+    def categories(self):
+        return list(self.category_list)
+
+    def read_state(self, rows, priority=None):
+        with self.lock:
+            return {f"{col}{r}": self.state.get(f"{col}{r}", "") for r in range(1, rows + 1) for col in "AB"}
+
+    def write_state(self, values, priority=None):
+        with self.lock:
+            self.state.update(values)
+
+class CsvBackend(MemoryBackend):
+    """
+    I need a store in plain local files for deployments that do without Sheets: transactions appended
+    to transactions.csv (the backfill CSV's columns plus the row id) and fsync'd, app state in appstate.json replaced
+    atomically. The ledger is read back into memory at start-up for the recent-row reads.
+    """
+
+    name = "csv"
+
+    def __init__(self, folder, categories=None):
+        super().__init__(categories)
+        os.makedirs(folder, exist_ok=True)
+        self.ledger_path = os.path.join(folder, "transactions.csv")
+        self.state_path = os.path.join(folder, "appstate.json")
+        if os.path.exists(self.ledger_path):
+            with open(self.ledger_path, newline="") as f:
+                self.rows = list(csv.reader(f))[1:]
+        else:
+            self.rewrite([])
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+
+    def rewrite(self, rows):
+        tmp_path = f"{self.ledger_path}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Date", "Amount", "Description", "Category", "Id"])
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.ledger_path)
+
+    def append_transactions(self, rows):
+        with self.lock:
+            with open(self.ledger_path, "a", newline="") as f:
+                csv.writer(f).writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+            first_row = len(self.rows) + 1
+            self.rows.extend(list(row) for row in rows)
+            return first_row
+
+    def add_history(self, rows):
+        with self.lock:
+            history = [list(row) for row in reversed(rows)]
+            self.rewrite(history + self.rows)
+            self.rows[0:0] = history
+
+    def write_state(self, values, priority=None):
+        with self.lock:
+            state = {**self.state, **values}
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_path)
+            self.state = state
+
+def open_storage():
+    """I need the storage backend config.json's "storage_backend" names (the Google Sheet by default)."""
+    kind = CONFIG.get("storage_backend", STORAGE_BACKEND)
+    if kind == "sheets":
+        return SheetsBackend()
+    if kind == "memory":
+        return MemoryBackend(CONFIG.get("categories"))
+    if kind == "csv":
+        return CsvBackend(CONFIG.get("storage_dir", STORAGE_DIR), CONFIG.get("categories"))
+    print(f'{Fore.RED}Error loading config: storage_backend must be "sheets", "memory" or "csv", not {kind!r}{Style.RESET_ALL}')
+    sys.exit(1)
+
+STORAGE = open_storage()
+
+# --- Local Ledger ---
+SYNC_PENDING, SYNC_SENDING, SYNC_DONE = 0, 1, 2
+
+# What a sheet write needs per row; the last column matches transaction_row_id()
+LOCAL_LEDGER_SYNC_COLUMNS = "id, date, amount, description, category, source || '/' || uidvalidity || '/' || uid"
+
+class LocalLedger:
+    """
+    I need a local SQLite ledger (WAL mode) that ingest commits to first, so a slow or unavailable Sheets
+    API never holds up the mail side; LedgerSyncWorker copies pending rows to the sheet afterwards.
+    (source, uidvalidity, uid) is unique, so an email re-fetched after a crash is not recorded twice,
+    while a mailbox reset that hands out old UIDs again still records the new mail. Each row keeps
+    its sync state: pending, sending (claimed by a sheet write in flight) or synced. Connections are per
+    thread; synchronous=FULL because the UID checkpoint that follows a commit assumes it is on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        with self.connect() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    uidvalidity INTEGER NOT NULL DEFAULT 0,
+                    uid INTEGER NOT NULL,
+                    date TEXT,
+                    amount TEXT,
+                    description TEXT,
+                    merchant TEXT,
+                    category TEXT,
+                    created_at REAL NOT NULL,
+                    sync_state INTEGER NOT NULL DEFAULT 0,
+                    synced_at REAL,
+                    UNIQUE (source, uidvalidity, uid)
+                );
+                CREATE INDEX IF NOT EXISTS transactions_sync ON transactions (sync_state, id);
+                CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category);
+                CREATE INDEX IF NOT EXISTS transactions_merchant ON transactions (merchant);
+            """)
+
+    def connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=FULL")
+        return db
+
+    def add(self, items, source=None, uidvalidity=None):
+        """I need [(uid, txn), ...] from one UIDVALIDITY committed in one transaction; returns how many were new."""
+        name = (source or {}).get("name") or "default"
+        now = time.time()
+        with self.connect() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO transactions "
+                "(source, uidvalidity, uid, date, amount, description, merchant, category, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(name, uidvalidity or 0, uid, txn['date'], txn['amount'], txn['desc'], txn.get('merchant'), txn.get('category'), now)
+                 for uid, txn in items]
+            )
+            return db.total_changes - before
+
+    def claim(self, limit):
+        """I need the oldest pending rows marked as sending, as (id, date, amount, description, category, row id)."""
+        with self.lock, self.connect() as db:
+            rows = db.execute(
+                f"SELECT {LOCAL_LEDGER_SYNC_COLUMNS} FROM transactions WHERE sync_state = ? ORDER BY id LIMIT ?",
+                (SYNC_PENDING, limit)
+            ).fetchall()
+            db.executemany("UPDATE transactions SET sync_state = ? WHERE id = ?", [(SYNC_SENDING, row[0]) for row in rows])
+        return rows
+
+    def sending(self):
+        with self.connect() as db:
+            return db.execute(
+                f"SELECT {LOCAL_LEDGER_SYNC_COLUMNS} FROM transactions WHERE sync_state = ? ORDER BY id",
+                (SYNC_SENDING,)
+            ).fetchall()
+
+    def mark(self, ids, state):
+        with self.connect() as db:
+            db.executemany(
+                "UPDATE transactions SET sync_state = ?, synced_at = ? WHERE id = ?",
+                [(state, time.time() if state == SYNC_DONE else None, row_id) for row_id in ids]
+            )
+
+    def category_totals(self, since=None):
+        """I need spending per category (optionally for rows recorded since a Unix time), largest first."""
+        with self.connect() as db:
+            return db.execute(
+                "SELECT category, COUNT(*), SUM(CAST(REPLACE(amount, ',', '') AS REAL)) AS total FROM transactions "
+                "WHERE created_at >= ? GROUP BY category ORDER BY total DESC",
+                (since or 0,)
+            ).fetchall()
+
+    def stats(self):
+        with self.connect() as db:
+            counts = dict(db.execute("SELECT sync_state, COUNT(*) FROM transactions GROUP BY sync_state").fetchall())
+        return {
+            "pending": counts.get(SYNC_PENDING, 0),
+            "sending": counts.get(SYNC_SENDING, 0),
+            "synced": counts.get(SYNC_DONE, 0),
+        }
+
+def open_local_ledger():
+    """I need the local ledger when config.json sets "local_ledger_file" (e.g. "ledger.db"), else None."""
+    path = CONFIG.get("local_ledger_file")
+    return LocalLedger(path) if path else None
+
+LOCAL_LEDGER = open_local_ledger()
+
+class LedgerSyncWorker:
+    """
+    I need pending local-ledger rows copied to the sheet in batches on a background thread, woken as soon
+    as ingest commits and backing off (jittered, exponential) while Sheets is failing. Rows are claimed
+    before the write; rows still claimed at the next attempt (a crash or an error mid-write) are looked
+    up by row id among the newest sheet rows, and marked synced if they landed or released to be written again.
+    One pass runs at a time, so the shutdown pass waits out a write in flight instead of recovering it.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.sync_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.failures = 0
+        self.synced = 0
+        self.last_sync_ms = None
+        self.last_error = None
+
+    def run(self):
+        while APP_RUNNING:
+            self.wake.wait(LEDGER_SYNC_INTERVAL)
+            self.wake.clear()
+            try:
+                self.sync()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(LEDGER_SYNC_RETRY_MAX, LEDGER_SYNC_RETRY_BASE * 2 ** (self.failures - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.error(f"Ledger sync to the sheet failed ({self.failures} in a row), retrying in {delay:.0f}s: {e}")
+                time.sleep(delay)
+
+    def recover(self):
+        rows = self.ledger.sending()
+        if not rows:
+            return
+        newest = STORAGE.recent_transactions(len(rows) + CHECKPOINT_RECOVERY_ROWS, SHEETS_PRIORITY_CHECKPOINT)
+        found = {row[2] for row in newest if len(row) > 2}
+        landed = all(row[5] in found for row in rows)
+        self.ledger.mark([row[0] for row in rows], SYNC_DONE if landed else SYNC_PENDING)
+        logger.warning(
+            f"Ledger sync recovery: {len(rows)} row(s) from an unfinished sheet write "
+            f"{'had landed; marked synced' if landed else 'had not landed; they will be written again'}"
+        )
+
+    def sync(self):
+        """I need every pending row in the sheet, SHEET_BATCH_MAX_ROWS per write."""
+        with self.sync_lock:
+            self.recover()
+            while True:
+                rows = self.ledger.claim(SHEET_BATCH_MAX_ROWS)
+                if not rows:
+                    return
+                started = time.perf_counter()
+                learn_sheet_corrections(CATEGORY_LIST.get())
+                first_row = STORAGE.append_transactions([list(row[1:]) for row in rows])
+                self.ledger.mark([row[0] for row in rows], SYNC_DONE)
+                self.synced += len(rows)
+                self.last_sync_ms = round((time.perf_counter() - started) * 1000)
+                logger.info(f"Synced {len(rows)} ledger row(s) to the sheet at row {first_row} in {self.last_sync_ms} ms")
+
+    def stats(self):
+        return {
+            **self.ledger.stats(),
+            "synced_this_run": self.synced,
+            "last_sync_ms": self.last_sync_ms,
+            "consecutive_failures": self.failures,
+        }
+
+LEDGER_SYNC = LedgerSyncWorker(LOCAL_LEDGER) if LOCAL_LEDGER else None
+
+def record_transactions(items, source=None):
+    """
+    I need a batch of (uid, txn) committed to the local ledger, classified with the cached category list
+    (which only touches the sheet once per TTL), and the sync worker woken.
+    """
+    txns = [txn for _, txn in items]
+    uidvalidity = load_uidvalidity(source)
+    for uid, txn in items:
+        txn['row_id'] = transaction_row_id(uid, source, uidvalidity)
+    # Only an expired list makes ingest queue behind the sync worker's sheet writes
+    allowed_categories = CATEGORY_LIST.get()
+    classify_transactions(txns, allowed_categories)
+    added = LOCAL_LEDGER.add(items, source, uidvalidity)
+    save_last_transaction(txns[-1])
+    logger.info(f"Recorded {added} transaction(s){source_label(source)} in the local ledger")
+    LEDGER_SYNC.wake.set()
+
+# --- Parse Cache ---
+class ParseCache(JsonLRUCache):
+    """
+    I need to remember what each email parsed to, keyed by Message-ID (or a hash of the message when it
+    has none), so an email re-seen after a failed cycle skips MIME decoding and parsing. Non-transactions
+    are cached too. The cache is saved at the end of each cycle; delete the file after changing the
+    parser or alert templates.
+    """
+
+    def get(self, key):
+        """I need (hit, txn) for a key; txn is a copy, since callers add the category to it."""
+        hit, txn = super().get(key)
+        return hit, dict(txn) if txn else txn
+
+    def put(self, key, txn):
+        super().put(key, dict(txn) if txn else None)
+
+PARSE_CACHE = ParseCache(PARSE_CACHE_FILE, int(CONFIG.get("parse_cache_size", PARSE_CACHE_SIZE)))
+
+def parse_cache_key(msg):
+    """I need a stable key for an email: its Message-ID, or a hash of the message when it has none."""
+    message_id = (msg["Message-ID"] or "").strip()
+    if message_id:
+        return message_id
+    return "sha1:" + hashlib.sha1(msg.as_bytes()).hexdigest()
+
+def parse_message(msg):
+    """I need the transaction in a fetched email (or None), served from the parse cache when it was seen before."""
+    key = parse_cache_key(msg)
+    hit, txn = PARSE_CACHE.get(key)
+    if not hit:
+        txn = parse_alert(extract_body(msg), msg["From"])
+        PARSE_CACHE.put(key, txn)
+    return txn
 
 # --- State Management ---
 def save_last_transaction(txn):
@@ -386,71 +2279,968 @@ def check_ngrok_status():
         NGROK_STATUS = f"error ({e})"
 
 # --- Email Ingest ---
-def check_inbox_and_process():
-    """I need to check for new transaction emails and process them."""
-    last_uid = load_last_uid()
-    transactions_processed = 0
-    emails_skipped = 0
-
-    imap = None
+class ByteCountingMixin:
+    """I need to count the bytes read from the IMAP server for the per-cycle stats."""
+    bytes_received = 0
+
+    def read(self, size):
+        data = super().read(size)
+        self.bytes_received += len(data)
+        return data
+
+    def readline(self):
+        line = super().readline()
+        self.bytes_received += len(line)
+        return line
+
+class CountingIMAP4(ByteCountingMixin, imaplib.IMAP4):
+    pass
+
+class CountingIMAP4SSL(ByteCountingMixin, imaplib.IMAP4_SSL):
+    pass
+
+def source_setting(source, key, default=None):
+    """I need a per-source setting from "imap_sources", falling back to the top-level config.json value."""
+    if source and key in source:
+        return source[key]
+    return CONFIG.get(key, default)
+
+def connect_imap(source=None):
+    """I need to open an authenticated IMAP session with the source's folder (the inbox by default) selected."""
+    host = source_setting(source, "imap_server")
+    port = source_setting(source, "imap_port")
+    if source_setting(source, "imap_ssl", True):
+        imap = imap_step(lambda: CountingIMAP4SSL(host, port or imaplib.IMAP4_SSL_PORT, timeout=IMAP_SOCKET_TIMEOUT))
+    else:
+        # Plain IMAP is only meant for a local stand-in server (see budget_bench.py)
+        imap = imap_step(lambda: CountingIMAP4(host, port or imaplib.IMAP4_PORT, timeout=IMAP_SOCKET_TIMEOUT))
+    imap_step(imap.login, source_setting(source, "gmail_user"), source_setting(source, "gmail_app_password"))
+    status, data = imap_step(imap.select, source_setting(source, "folder", "inbox"))
+    if status != "OK":
+        raise imap.error(f"SELECT {source_setting(source, 'folder', 'inbox')} failed: {data}")
+    sync_uidvalidity(imap, source)
+    # The SELECT count is not news: the search that follows every (re)connect covers it
+    imap.untagged_responses.pop("EXISTS", None)
+    return imap
+
+# A dropped or half-open connection; anything else (NO/BAD replies, sheet errors) leaves the session usable
+IMAP_CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError, EOFError)
+
+class ImapConnectionLost(Exception):
+    """I need a dropped IMAP connection told apart from an OSError raised by the Sheets side of a cycle."""
+
+def imap_step(fn, *args):
+    """I need an imaplib call whose connection errors surface as ImapConnectionLost."""
     try:
-        # Connect to Gmail
-        imap = imaplib.IMAP4_SSL(CONFIG["imap_server"])
-        imap.login(CONFIG["gmail_user"], CONFIG["gmail_app_password"])
+        return fn(*args)
+    except IMAP_CONNECTION_ERRORS as e:
+        raise ImapConnectionLost(e) from e
+
+class ImapSessionManager:
+    """
+    I need one authenticated IMAP session reused across poll cycles instead of a TLS handshake and
+    login every minute. A session idle for IMAP_KEEPALIVE_INTERVAL is checked with NOOP before reuse,
+    and reconnects after a drop or failed login wait a jittered exponential backoff.
+    """
 
-        # Select inbox
-        imap.select("inbox")
-        status, data = imap.uid('search', None, "ALL")
-        uids = [int(x) for x in data[0].split()]
-        new_uids = [uid for uid in uids if last_uid is None or uid > last_uid]
+    def __init__(self, source=None):
+        self.source = source
+        self.imap = None
+        self.connected_at = None
+        self.last_used = 0
+        self.failures = 0
+        self.retry_at = 0
+        self.reconnects = 0
+        self.last_login_ms = None
+
+    def get(self):
+        """I need a live session, reusing the current one if it still answers."""
+        if self.imap is not None:
+            if time.monotonic() - self.last_used < IMAP_KEEPALIVE_INTERVAL or self.keepalive():
+                self.last_used = time.monotonic()
+                return self.imap
+        self.wait_for_backoff()
+        return self.connect()
+
+    def connect(self):
+        started = time.monotonic()
+        try:
+            imap = connect_imap(self.source)
+        except Exception:
+            self.schedule_retry()
+            raise
+        if self.connected_at is not None:
+            self.reconnects += 1
+        self.imap = imap
+        self.connected_at = self.last_used = time.monotonic()
+        self.last_login_ms = round((self.connected_at - started) * 1000)
+        self.failures = 0
+        logger.info(
+            f"IMAP session{source_label(self.source)} established in {self.last_login_ms} ms "
+            f"(reconnects so far: {self.reconnects})"
+        )
+        return imap
 
-        # Process new emails
-        for uid in new_uids:
-            status, msg_data = imap.uid('fetch', str(uid), '(RFC822)')
-            if status != "OK":
+    def keepalive(self):
+        """I need to NOOP the session so a dead socket is found before a cycle starts on it."""
+        try:
+            status, _ = self.imap.noop()
+            if status == "OK":
+                return True
+            reason = f"NOOP returned {status}"
+        except IMAP_CONNECTION_ERRORS + (imaplib.IMAP4.error,) as e:
+            reason = f"NOOP failed: {e}"
+        self.drop(reason)
+        return False
+
+    def drop(self, reason):
+        """I need to discard a broken session; the next get() reconnects after a backoff."""
+        logger.warning(f"Dropping IMAP session{source_label(self.source)}: {reason}")
+        imap, self.imap = self.imap, None
+        if imap is not None:
+            try:
+                imap.shutdown()
+            except Exception:
+                pass
+        self.schedule_retry()
+
+    def close(self):
+        """I need to log out cleanly on shutdown."""
+        imap, self.imap = self.imap, None
+        if imap is not None:
+            try:
+                imap.logout()
+            except Exception:
+                pass
+
+    def schedule_retry(self):
+        # Equal jitter: half the exponential delay is fixed, half random, so retries spread out
+        self.failures += 1
+        delay = min(IMAP_RECONNECT_MAX, IMAP_RECONNECT_BASE * 2 ** (self.failures - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.retry_at = time.monotonic() + delay
+        logger.info(f"Next IMAP connect attempt{source_label(self.source)} in {delay:.1f}s (attempt {self.failures})")
+
+    def wait_for_backoff(self):
+        while APP_RUNNING and time.monotonic() < self.retry_at:
+            time.sleep(min(1.0, self.retry_at - time.monotonic()))
+
+    def stats(self):
+        """I need the session numbers reported in the heartbeat."""
+        age = time.monotonic() - self.connected_at if self.imap is not None else None
+        return {
+            "connection_age_s": round(age) if age is not None else None,
+            "reconnects": self.reconnects,
+            "last_login_ms": self.last_login_ms,
+            "consecutive_failures": self.failures,
+        }
+
+IMAP_SESSION = ImapSessionManager()
+
+def uid_search(imap, *criteria):
+    """I need the UIDs a UID SEARCH returns; a NO or BAD reply is an error, not an empty mailbox."""
+    status, data = imap.uid('search', None, *criteria)
+    if status != "OK":
+        raise imap.error(f"UID SEARCH {' '.join(criteria)} failed: {data}")
+    return [int(x) for x in data[0].split()]
+
+def get_resync_uid(imap):
+    """
+    I need to pick the UID to resume from after a mailbox reset. By default that is the current
+    newest message (nothing old is reprocessed); with uidvalidity_resync_days set, mail received
+    in that window is processed again.
+    """
+    days = int(CONFIG.get("uidvalidity_resync_days", 0))
+    if days > 0:
+        since = (datetime.utcnow() - timedelta(days=days)).strftime("%d-%b-%Y")
+        uids = uid_search(imap, "SINCE", since)
+        if uids:
+            return min(uids) - 1
+
+    status, data = imap.response("UIDNEXT")
+    if data and data[0]:
+        return int(data[0]) - 1
+    uids = uid_search(imap, "ALL")
+    return max(uids) if uids else 0
+
+def sync_uidvalidity(imap, source=None):
+    """
+    I need to detect a mailbox reset right after SELECT. UIDs only mean something within one
+    UIDVALIDITY, so when it changes I resync the saved UID instead of trusting the old one.
+    """
+    status, data = imap.response("UIDVALIDITY")
+    if not data or not data[0]:
+        return
+    current = int(data[0])
+    saved = load_uidvalidity(source)
+    if saved == current:
+        return
+    if saved is None:
+        save_uidvalidity(current, source)
+        return
+
+    old_uid = load_last_uid(source)
+    resync_uid = imap_step(get_resync_uid, imap)
+    logger.warning(
+        f"UIDVALIDITY{source_label(source)} changed from {saved} to {current}; resyncing last UID from {old_uid} to {resync_uid}"
+    )
+    # Checkpoint first: if I crash before saving UIDVALIDITY the resync simply runs again
+    save_last_uid(resync_uid, source)
+    CHECKPOINTS.flush(source, force=True)
+    save_uidvalidity(current, source)
+    send_email(
+        "Budget App Mailbox Reset",
+        f"The {source_setting(source, 'folder', 'inbox')}{source_label(source)} UIDVALIDITY changed from {saved} to {current}.\n"
+        f"The last processed UID was resynced from {old_uid} to {resync_uid}.\n"
+        f"Check the sheet for any transactions missed around this time.\n"
+    )
+
+IMAP_TOKEN_RE = re.compile(
+    rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    rb'|(?P<literal>\{\d+\})\s*$|(?P<atom>[^\s()"\[\]{]+(?:\[[^\]]*\](?:<\d+>)?)?))'
+)
+
+def compress_uid_set(uids):
+    """I need to turn a sorted UID list into a compact IMAP set like '5:9,12'."""
+    ranges = []
+    start = prev = uids[0]
+    for uid in uids[1:] + [None]:
+        if uid is not None and uid == prev + 1:
+            prev = uid
+            continue
+        ranges.append(str(start) if start == prev else f"{start}:{prev}")
+        start = prev = uid
+    return ",".join(ranges)
+
+def tokenize_fetch_data(data):
+    """
+    I need to turn imaplib's FETCH data (byte strings and (prefix, literal) tuples) into tokens:
+    "(" and ")" for list boundaries, None for NIL, and bytes for atoms, strings and literals.
+    """
+    for item in data:
+        prefix, literal = item if isinstance(item, tuple) else (item, None)
+        pos = 0
+        while prefix and pos < len(prefix):
+            match = IMAP_TOKEN_RE.match(prefix, pos)
+            if not match:
+                break
+            pos = match.end()
+            if match.group("open"):
+                yield "("
+            elif match.group("close"):
+                yield ")"
+            elif match.group("quoted") is not None:
+                yield re.sub(rb'\\(.)', rb'\1', match.group("quoted"))
+            elif match.group("atom"):
+                atom = match.group("atom")
+                yield None if atom.upper() == b"NIL" else atom
+            # A {n} literal marker is dropped; imaplib hands the literal bytes over separately
+        if literal is not None:
+            yield literal
+
+def parse_fetch_response(data):
+    """
+    I need to group a multi-message FETCH response into {uid: {item: value}}. BODY[...] items are
+    keyed by their section ("HEADER.FIELDS", "1.MIME", "1.2"), BODYSTRUCTURE by name as a nested list.
+    """
+    stack = [[]]
+    for token in tokenize_fetch_data(data):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) > 1:
+                closed = stack.pop()
+                stack[-1].append(closed)
+        else:
+            stack[-1].append(token)
+
+    messages = {}
+    # Top level alternates sequence numbers and item lists; servers may put UID anywhere in the list
+    for entry in stack[0]:
+        if not isinstance(entry, list):
+            continue
+        fetched = {}
+        for key, value in zip(entry[0::2], entry[1::2]):
+            if not isinstance(key, bytes):
+                continue
+            name = key.decode(errors="replace").upper()
+            if name.startswith("BODY["):
+                name = name[len("BODY["):name.index("]")].split(" ")[0]
+            fetched[name] = value
+        if isinstance(fetched.get("UID"), bytes):
+            messages[int(fetched.pop("UID"))] = fetched
+    return messages
+
+def build_partial_message(sections):
+    """
+    I need to rebuild a parseable message from the header fields and the first body part.
+    For multipart mail the first part's own MIME headers are used so its encoding is decoded.
+    """
+    top = (sections.get("HEADER.FIELDS") or b"").rstrip(b"\r\n")
+    body = sections.get("1") or b""
+    top_msg = email.message_from_bytes(top)
+    if top_msg.get_content_maintype() != "multipart":
+        return email.message_from_bytes(top + b"\r\n\r\n" + body)
+
+    mime = (sections.get("1.MIME") or b"").rstrip(b"\r\n")
+    msg = email.message_from_bytes(mime + b"\r\n\r\n" + body)
+    for header in ("Subject", "From", "Message-ID", "Date"):
+        if top_msg[header] is not None:
+            msg[header] = top_msg[header]
+    return msg
+
+def imap_str(value):
+    """I need BODYSTRUCTURE atoms and strings as text (NIL becomes an empty string)."""
+    return value.decode(errors="replace") if isinstance(value, bytes) else ""
+
+def find_text_part(structure):
+    """
+    I need the section of the first text/plain part in a BODYSTRUCTURE, or the first text/html
+    part if there is no plain text. Returns (section, content_type, encoding, charset, size) or None.
+    """
+    found = {}
+    todo = [(structure, "")]
+    while todo:
+        node, path = todo.pop(0)
+        if not isinstance(node, list) or not node:
+            continue
+        if isinstance(node[0], list):
+            # Multipart: child parts come first, then the subtype and extension data
+            children = itertools.takewhile(lambda child: isinstance(child, list), node)
+            todo[:0] = [(child, f"{path}.{i}" if path else str(i)) for i, child in enumerate(children, 1)]
+            continue
+        if len(node) < 7:
+            continue
+        ctype = f"{imap_str(node[0])}/{imap_str(node[1])}".lower()
+        if ctype in ("text/plain", "text/html") and ctype not in found:
+            params = node[2] if isinstance(node[2], list) else []
+            charset = None
+            for key, value in zip(params[0::2], params[1::2]):
+                if imap_str(key).lower() == "charset":
+                    charset = imap_str(value)
+            size = int(node[6]) if isinstance(node[6], bytes) and node[6].isdigit() else 0
+            found[ctype] = (path or "1", ctype, imap_str(node[5]) or "7bit", charset, size)
+    return found.get("text/plain") or found.get("text/html")
+
+def build_section_message(headers, part, body):
+    """I need a parseable single-part message from the header fields and one fetched section."""
+    section, ctype, encoding, charset, size = part
+    content_type = f'{ctype}; charset="{charset}"' if charset else ctype
+    mime = f"Content-Type: {content_type}\r\nContent-Transfer-Encoding: {encoding}\r\n".encode()
+    return email.message_from_bytes((headers or b"").rstrip(b"\r\n") + b"\r\n" + mime + b"\r\n" + (body or b""))
+
+def fetch_messages_rfc822(imap, uids):
+    """I need to fetch each full message in its own round trip (the original behaviour)."""
+    for uid in uids:
+        status, msg_data = imap.uid('fetch', str(uid), '(RFC822)')
+        if status != "OK":
+            continue
+        yield uid, email.message_from_bytes(msg_data[0][1])
+
+def fetch_messages_batch(imap, uids):
+    """
+    I need to pull a whole UID set per command, taking only the header fields plus the first
+    body part, capped at imap_max_body_bytes.
+    """
+    max_bytes = int(CONFIG.get("imap_max_body_bytes", IMAP_MAX_BODY_BYTES))
+    items = (
+        f"(UID BODY.PEEK[HEADER.FIELDS ({IMAP_HEADER_FIELDS} {IMAP_MIME_FIELDS})] "
+        f"BODY.PEEK[1.MIME] BODY.PEEK[1]<0.{max_bytes}>)"
+    )
+    for i in range(0, len(uids), IMAP_FETCH_BATCH_SIZE):
+        batch = uids[i:i + IMAP_FETCH_BATCH_SIZE]
+        status, data = imap.uid('fetch', compress_uid_set(batch), items)
+        if status != "OK":
+            raise imap.error(f"Batched fetch failed for UIDs {batch[0]}-{batch[-1]}: {data}")
+        fetched = parse_fetch_response(data)
+        for uid in batch:
+            if uid in fetched:
+                yield uid, build_partial_message(fetched[uid])
+
+def fetch_messages_bodystructure(imap, uids):
+    """
+    I need to read each message's BODYSTRUCTURE first and then fetch only its plain-text (or HTML)
+    section. Messages whose text part is over imap_max_body_bytes are yielded as None and skipped.
+    """
+    max_bytes = int(CONFIG.get("imap_max_body_bytes", IMAP_MAX_BODY_BYTES))
+    items = f"(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({IMAP_HEADER_FIELDS})])"
+    for i in range(0, len(uids), IMAP_FETCH_BATCH_SIZE):
+        batch = uids[i:i + IMAP_FETCH_BATCH_SIZE]
+        status, data = imap.uid('fetch', compress_uid_set(batch), items)
+        if status != "OK":
+            raise imap.error(f"BODYSTRUCTURE fetch failed for UIDs {batch[0]}-{batch[-1]}: {data}")
+        fetched = parse_fetch_response(data)
+
+        # Group by section so each distinct section costs one command for the whole batch
+        parts = {}
+        by_section = {}
+        for uid in batch:
+            if uid not in fetched:
+                continue
+            part = find_text_part(fetched[uid].get("BODYSTRUCTURE"))
+            if part is None:
+                continue
+            if part[4] > max_bytes:
+                logger.info(f"Skipping UID {uid}: {part[1]} part is {part[4]:,} bytes (limit {max_bytes:,})")
                 continue
+            parts[uid] = part
+            by_section.setdefault(part[0], []).append(uid)
 
-            raw_email = msg_data[0][1]
-            msg = email.message_from_bytes(raw_email)
-            subject = msg["Subject"]
-
-            # Extract email body
-            if msg.is_multipart():
-                for part in msg.walk():
-                    ctype = part.get_content_type()
-                    if ctype == "text/plain":
-                        body = part.get_payload(decode=True).decode()
-                        break
-                else:
-                    body = ""
+        bodies = {}
+        for section, section_uids in by_section.items():
+            status, data = imap.uid('fetch', compress_uid_set(section_uids), f"(UID BODY.PEEK[{section}])")
+            if status != "OK":
+                raise imap.error(f"Section {section} fetch failed: {data}")
+            for uid, sections in parse_fetch_response(data).items():
+                bodies[uid] = sections.get(section)
+
+        for uid in batch:
+            if uid not in fetched:
+                continue
+            if uid in parts and uid in bodies:
+                yield uid, build_section_message(fetched[uid].get("HEADER.FIELDS"), parts[uid], bodies[uid])
             else:
-                body = msg.get_payload(decode=True).decode()
+                yield uid, None
+
+FETCH_MODES = {
+    "rfc822": fetch_messages_rfc822,
+    "batch": fetch_messages_batch,
+    "bodystructure": fetch_messages_bodystructure,
+}
+
+def fetch_messages(imap, uids):
+    """
+    I need to fetch new messages and yield (uid, message) in UID order, using imap_fetch_mode:
+    'batch' (default), 'bodystructure' or 'rfc822'. A None message means nothing worth parsing.
+    """
+    mode = CONFIG.get("imap_fetch_mode", "batch")
+    return FETCH_MODES.get(mode, fetch_messages_batch)(imap, uids)
+
+def get_peak_rss_mb():
+    """I need the process peak RSS in MB (None where the resource module is unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
 
-            # Parse and process transaction
-            txn = parse_email_transaction(body)
+def decode_part(part):
+    """I need a MIME part's payload as text."""
+    return (part.get_payload(decode=True) or b"").decode(errors="replace")
+
+def extract_body(msg):
+    """
+    I need the first text/plain part of a message. HTML-only mail falls back to the visible text of
+    its first text/html part; anything else gives an empty string.
+    """
+    html_part = None
+    for part in msg.walk():
+        ctype = part.get_content_type()
+        if ctype == "text/plain":
+            return decode_part(part)
+        if ctype == "text/html" and html_part is None:
+            html_part = part
+    if html_part is not None:
+        return html_to_text(decode_part(html_part))
+    if not msg.is_multipart():
+        return decode_part(msg)
+    return ""
+
+def imap_quote(value):
+    """I need to quote a string for an IMAP SEARCH key."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def build_search_filter(imap, source=None):
+    """
+    I need the server-side pre-filter from config.json's "imap_filter" as one SEARCH key, e.g.
+    {"senders": ["alerts@bank.com"], "subjects": ["Transaction alert"], "gmail_raw": ["from:chase"]}.
+    Senders and subjects are substring matches (ASCII only); gmail_raw needs the X-GM-EXT-1 capability.
+    Each entry in "imap_sources" may carry its own "imap_filter". Returns None when no filter is configured.
+    """
+    cfg = source_setting(source, "imap_filter") or {}
+    keys = [f"FROM {imap_quote(sender)}" for sender in cfg.get("senders", [])]
+    keys += [f"SUBJECT {imap_quote(subject)}" for subject in cfg.get("subjects", [])]
+    gmail_raw = cfg.get("gmail_raw") or []
+    if isinstance(gmail_raw, str):
+        gmail_raw = [gmail_raw]
+    if gmail_raw:
+        if "X-GM-EXT-1" in imap.capabilities:
+            keys += [f"X-GM-RAW {imap_quote(query)}" for query in gmail_raw]
+        else:
+            logger.warning("imap_filter.gmail_raw ignored: server does not support X-GM-EXT-1")
+    if not keys:
+        return None
+    # IMAP OR takes exactly two keys, so n alternatives need n-1 prefixed ORs
+    return "OR " * (len(keys) - 1) + " ".join(keys)
+
+def search_new_uids(imap, last_uid, source=None):
+    """
+    I need the UIDs newer than the checkpoint, sorted. Returns (uids, scanned_to), where scanned_to is
+    the highest UID a filtered search covered (None without a filter) so skipped mail can be checkpointed.
+    """
+    start = (last_uid or 0) + 1
+    all_mode = CONFIG.get("imap_search_mode", "incremental") == "all"
+    search_filter = build_search_filter(imap, source)
+    scanned_to = None
+
+    if search_filter:
+        # Pin the range to the current newest UID first, so mail arriving mid-cycle is not checkpointed unseen
+        scanned_to = max(uid_search(imap, "UID", "*"), default=0)
+        if scanned_to < start:
+            return [], scanned_to
+        uids = uid_search(imap, "UID", f"{1 if all_mode else start}:{scanned_to}", search_filter)
+    elif all_mode:
+        uids = uid_search(imap, "ALL")
+    else:
+        # Only ask the server for UIDs above the checkpoint
+        uids = uid_search(imap, "UID", f"{start}:*")
+    # "n:*" always matches the newest message, even when its UID is below n
+    return sorted(uid for uid in uids if last_uid is None or uid > last_uid), scanned_to
+
+def deliver_transactions(items, source=None):
+    """
+    I need to write a run of email outcomes [(uid, txn or None), ...] in UID order: all their
+    transactions in one batched insert (or one local-ledger commit), then one local checkpoint at the
+    last UID (see CheckpointJournal).
+    """
+    if not items:
+        return
+    uid = items[-1][0]
+    txns = [txn for _, txn in items if txn]
+    if txns and LOCAL_LEDGER is not None:
+        # Idempotent per (source, uid), so no pending batch to recover
+        record_transactions([(item_uid, txn) for item_uid, txn in items if txn], source)
+    elif txns:
+        uidvalidity = load_uidvalidity(source)
+        for item_uid, txn in items:
             if txn:
-                logger.info(f"Transaction email found (UID {uid}): {subject}")
-                insert_transaction(txn)
+                txn['row_id'] = transaction_row_id(item_uid, source, uidvalidity)
+        CHECKPOINTS.begin(uid, txns, source)
+        insert_transactions(txns)
+    # Always move the checkpoint, even past a run of non-transaction mail
+    save_last_uid(uid, source)
+
+class TransactionBatch:
+    """
+    I need a poll cycle's outcomes collected and written together by deliver_transactions. A long
+    backlog is flushed every SHEET_BATCH_MAX_ROWS emails so the checkpoint keeps moving; after a
+    failed flush nothing more is written and the next cycle starts again from the saved UID.
+    """
+
+    def __init__(self, source=None):
+        self.source = source
+        self.items = []
+        self.failed = False
+
+    def add(self, uid, txn, source=None):
+        self.items.append((uid, txn))
+        if len(self.items) >= SHEET_BATCH_MAX_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.failed or not self.items:
+            return
+        items, self.items = self.items, []
+        try:
+            deliver_transactions(items, self.source)
+        except Exception:
+            self.failed = True
+            raise
+
+def process_new_emails(imap, source=None, last_uid=None, deliver=None):
+    """
+    I need to process every email newer than last_uid (the saved UID when not given) on an open IMAP
+    session. Each email's outcome goes to deliver(uid, txn, source) in UID order; txn is None for
+    skipped mail, and for the UID a filtered search scanned up to. Without a deliver callback the
+    cycle's outcomes are written to the sheet as one batch at the end (or as far as it got).
+    """
+    batch = None
+    if deliver is None:
+        batch = TransactionBatch(source)
+        deliver = batch.add
+    if last_uid is None:
+        last_uid = load_last_uid(source)
+    transactions_processed = 0
+    emails_skipped = 0
+    bytes_before = imap.bytes_received
+
+    # Only the IMAP calls are wrapped: a Sheets network error during the cycle must not drop the session
+    new_uids, scanned_to = imap_step(search_new_uids, imap, last_uid, source)
+    messages = fetch_messages(imap, new_uids)
+
+    try:
+        # Process new emails
+        while True:
+            fetched = imap_step(next, messages, None)
+            if fetched is None:
+                break
+            uid, msg = fetched
+            txn = None
+            if msg is not None:
+                subject = msg["Subject"]
+
+                # Parse and process transaction
+                txn = parse_message(msg)
+            if txn:
+                logger.info(f"Transaction email found{source_label(source)} (UID {uid}): {subject}")
                 transactions_processed += 1
             else:
                 emails_skipped += 1
-                logger.debug(f"Skipped non-transaction email UID {uid}")
-
-            # Always update last UID in the Google Sheet
-            save_last_uid(uid)
+                logger.debug(f"Skipped non-transaction email{source_label(source)} UID {uid}")
+            deliver(uid, txn, source)
+
+        # Mail the server-side filter excluded was never fetched, but the checkpoint still moves past it
+        if scanned_to is not None and scanned_to > max(new_uids[-1] if new_uids else 0, last_uid or 0):
+            deliver(scanned_to, None, source)
+            logger.debug(f"Advanced last UID{source_label(source)} past filtered mail to {scanned_to}")
+    finally:
+        try:
+            if batch is not None:
+                batch.flush()
+                CHECKPOINTS.flush(source)
+        finally:
+            # Saved even when the cycle fails, so the retry finds everything parsed so far
+            PARSE_CACHE.save()
+
+    INGEST_STATS["last_cycle_bytes"] = imap.bytes_received - bytes_before
+    INGEST_STATS["peak_rss_mb"] = get_peak_rss_mb()
+    if new_uids:
+        logger.info(
+            f"Cycle stats{source_label(source)}: {len(new_uids)} new email(s), "
+            f"{INGEST_STATS['last_cycle_bytes']:,} bytes received, peak RSS {INGEST_STATS['peak_rss_mb']} MB"
+        )
+    return transactions_processed, emails_skipped
 
-        imap.logout()
-        return transactions_processed, emails_skipped
+def check_inbox_and_process():
+    """I need to check for new transaction emails and process them on the shared IMAP session."""
+    try:
+        return process_new_emails(IMAP_SESSION.get())
 
+    except ImapConnectionLost as e:
+        IMAP_SESSION.drop(f"connection error: {e}")
+        logger.error(f"IMAP connection error: {e}")
+        return 0, 0
     except Exception as e:
-        if imap:
-            try:
-                imap.logout()
-            except Exception:
-                pass
         logger.error(f"IMAP error: {e}")
         return 0, 0
 
+def imap_line_ready(imap, wait):
+    """
+    I need to know whether a server line has started arriving within wait seconds. Bytes imaplib has
+    already buffered (or TLS has already decrypted) count, so a peek comes before each select.
+    """
+    deadline = time.monotonic() + wait
+    prev_timeout = imap.sock.gettimeout()
+    try:
+        while True:
+            imap.sock.settimeout(0)
+            try:
+                if imap.file.peek(1):
+                    return True
+            except (BlockingIOError, ssl.SSLWantReadError):
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            select.select([imap.sock], [], [], remaining)
+    finally:
+        imap.sock.settimeout(prev_timeout)
+
+def imap_idle_wait(imap, timeout):
+    """
+    I need to block in IMAP IDLE (RFC 2177) until the server reports new mail or the timeout passes.
+    Returns the monotonic time the EXISTS notification arrived, or None on timeout/shutdown.
+    imaplib has no IDLE support before Python 3.14, so I send the command myself but read every line
+    through imaplib, whose buffer may already hold the EXISTS that arrived with the continuation.
+    """
+    # An EXISTS that came in with the last SEARCH/FETCH is news the IDLE would never repeat
+    if imap.untagged_responses.pop("EXISTS", None):
+        return time.monotonic()
+
+    tag = imap._new_tag()
+    imap.send(tag + b" IDLE\r\n")
+    resp = imap.readline()
+    if not resp.startswith(b"+"):
+        raise imap.error(f"IDLE rejected by server: {resp.strip()!r}")
+
+    notified_at = None
+    deadline = time.monotonic() + timeout
+    while APP_RUNNING and notified_at is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Wake up at least once a second so a shutdown is not held up by the IDLE
+        if not imap_line_ready(imap, min(remaining, 1.0)):
+            continue
+        line = imap.readline()
+        if not line:
+            raise imap.abort("connection closed by server during IDLE")
+        if line.startswith(b"* ") and line.rstrip().upper().endswith(b" EXISTS"):
+            notified_at = time.monotonic()
+
+    imap.send(b"DONE\r\n")
+    while True:
+        line = imap.readline()
+        if not line:
+            raise imap.abort("connection closed by server while ending IDLE")
+        if line.startswith(tag):
+            if not line[len(tag):].strip().upper().startswith(b"OK"):
+                raise imap.error(f"IDLE failed: {line.strip()!r}")
+            break
+    return notified_at
+
+def run_idle_ingest():
+    """
+    I need to hold one authenticated IMAP session and process mail as soon as the server pushes it.
+    Returns False if the server does not support IDLE so the caller can fall back to polling.
+    """
+    try:
+        imap = IMAP_SESSION.get()
+        if "IDLE" not in imap.capabilities:
+            logger.warning("IMAP server does not support IDLE, falling back to polling")
+            return False
+
+        logger.info("IMAP IDLE session established. Waiting for new mail...")
+        process_new_emails(imap)
+        while APP_RUNNING:
+            notified_at = imap_step(imap_idle_wait, imap, IMAP_IDLE_REFRESH)
+            if not APP_RUNNING:
+                break
+            # Also runs after a plain IDLE refresh, which picks up anything that arrived
+            # between the last search and the start of the IDLE
+            processed, _ = process_new_emails(imap)
+            IMAP_SESSION.last_used = time.monotonic()
+            if notified_at is not None and processed:
+                latency_ms = (time.monotonic() - notified_at) * 1000
+                INGEST_STATS["last_push_latency_ms"] = round(latency_ms)
+                logger.info(f"IDLE notification-to-sheet latency: {latency_ms:.0f} ms for {processed} transaction(s)")
+    except ImapConnectionLost as e:
+        IMAP_SESSION.drop(f"connection error during IDLE: {e}")
+    except Exception as e:
+        logger.error(f"IMAP IDLE session error: {e}")
+    return True
+
+# --- Multi-source Ingest ---
+SOURCE_WATCHERS = {}
+
+def get_imap_sources():
+    """
+    I need the account/folder pairs from config.json's "imap_sources", e.g.
+    [{"name": "cards", "folder": "Alerts/Cards"}, {"name": "partner", "gmail_user": "...", "gmail_app_password": "..."}].
+    Keys a source leaves out fall back to the top-level config. The first source keeps the A1/A2
+    checkpoint; the others get AppState rows 4, 5, ... unless they set "appstate_row".
+    """
+    sources = []
+    for i, cfg in enumerate(CONFIG.get("imap_sources") or []):
+        source = dict(cfg)
+        source.setdefault("name", f"{source_setting(source, 'gmail_user')}/{source_setting(source, 'folder', 'inbox')}")
+        if i > 0:
+            source.setdefault("appstate_row", 3 + i)
+        if source.get("appstate_row") in (1, 2, 3):
+            raise ValueError(f"imap_sources[{i}]: appstate_row must be 4 or higher (rows 1-3 hold app state)")
+        sources.append(source)
+    return sources
+
+async def sleep_while_running(seconds):
+    """I need an asyncio sleep that returns early once the app is shutting down."""
+    deadline = time.monotonic() + seconds
+    while APP_RUNNING and time.monotonic() < deadline:
+        await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+
+class SourceWatcher:
+    """
+    I need to watch one account/folder on the shared event loop. The fetch side searches, downloads and
+    parses mail on a worker thread and hands each result to this source's bounded queue; the write side
+    drains the queue into the sheet. A full queue only blocks this source's fetcher, and the fetcher keeps
+    its own UID cursor so it can run ahead of the writer.
+    """
+
+    def __init__(self, source, executor):
+        self.source = source
+        self.executor = executor
+        self.session = ImapSessionManager(source)
+        self.queue = None
+        self.loop = None
+        self.cursor = None
+        self.write_failed = False
+        self.transactions = 0
+        self.skipped = 0
+        self.errors = 0
+
+    async def run_blocking(self, func, *args):
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    def deliver(self, uid, txn, source):
+        # Called on the fetch thread; blocks there while the queue is full
+        self.cursor = uid
+        asyncio.run_coroutine_threadsafe(self.queue.put((uid, txn)), self.loop).result()
+
+    async def write(self):
+        while True:
+            # Whatever queued up during the previous write goes out as one batch
+            items = [await self.queue.get()]
+            while len(items) < SHEET_BATCH_MAX_ROWS and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            try:
+                # After a failed write everything queued behind it is dropped; the fetcher rewinds
+                # to the saved checkpoint so nothing is skipped or inserted twice
+                if not self.write_failed:
+                    await self.run_blocking(deliver_transactions, items, self.source)
+                    self.transactions += sum(1 for _, txn in items if txn)
+                    await self.run_blocking(CHECKPOINTS.flush, self.source)
+            except Exception as e:
+                self.write_failed = True
+                self.errors += 1
+                logger.error(f"Sheet write failed{source_label(self.source)} at UIDs {items[0][0]}-{items[-1][0]}: {e}")
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    async def fetch(self):
+        idle = source_setting(self.source, "email_ingest_mode", "idle").lower() == "idle"
+        interval = source_setting(self.source, "email_poll_interval", EMAIL_POLL_INTERVAL)
+        while APP_RUNNING:
+            if self.write_failed:
+                await self.queue.join()
+                self.write_failed = False
+                self.cursor = None
+            try:
+                imap = await self.run_blocking(self.session.get)
+                _, skipped = await self.run_blocking(
+                    process_new_emails, imap, self.source, self.cursor, self.deliver
+                )
+                self.session.last_used = time.monotonic()
+                self.skipped += skipped
+                if idle and "IDLE" in imap.capabilities:
+                    # Let the writer catch up first, so a failed write is retried now rather than after the IDLE
+                    await self.queue.join()
+                    if not self.write_failed:
+                        await self.run_blocking(imap_step, imap_idle_wait, imap, IMAP_IDLE_REFRESH)
+                        continue
+            except ImapConnectionLost as e:
+                self.session.drop(f"connection error: {e}")
+                continue
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"IMAP error{source_label(self.source)}: {e}")
+            await sleep_while_running(interval)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=int(source_setting(self.source, "ingest_queue_size", INGEST_QUEUE_SIZE)))
+        writer = asyncio.create_task(self.write())
+        try:
+            await self.fetch()
+            await self.queue.join()
+        finally:
+            writer.cancel()
+            await self.run_blocking(self.session.close)
+
+    def stats(self):
+        """I need this source's numbers for the heartbeat."""
+        return {
+            "transactions": self.transactions,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            **self.session.stats(),
+        }
+
+async def run_async_ingest(sources):
+    """I need to watch every configured source concurrently on one event loop until shutdown."""
+    # Each source can tie up one thread in IDLE or a blocking fetch, plus one for its sheet writes
+    with ThreadPoolExecutor(max_workers=2 * len(sources), thread_name_prefix="ingest") as executor:
+        watchers = [SourceWatcher(source, executor) for source in sources]
+        SOURCE_WATCHERS.update((watcher.source["name"], watcher) for watcher in watchers)
+        logger.info(f"Async ingest watching {len(sources)} source(s): {', '.join(SOURCE_WATCHERS)}")
+        await asyncio.gather(*(watcher.run() for watcher in watchers))
+
+# --- Offline Backfill ---
+def parse_backfill_message(raw, allowed_categories):
+    """
+    I need to turn one exported message into (timestamp, txn), or None if it is not a transaction.
+    Runs in a worker process, so it only takes and returns plain picklable values.
+    """
+    msg = email.message_from_bytes(raw)
+    txn = parse_alert(extract_body(msg), msg["From"])
+    if not txn:
+        return None
+    txn["merchant"] = normalize_merchant(txn["desc"])
+    txn["category"] = classify_category(txn["desc"], allowed_categories, txn["merchant"])
+    try:
+        timestamp = parsedate_to_datetime(msg["Date"]).timestamp()
+    except (TypeError, ValueError):
+        timestamp = 0
+    return timestamp, txn
+
+def open_archive(path):
+    """I need a mailbox for an exported archive: a Maildir directory or an mbox file."""
+    if os.path.isdir(path):
+        return mailbox.Maildir(path, factory=None, create=False)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No mbox file or Maildir at {path}")
+    return mailbox.mbox(path, create=False)
+
+def iter_archive_batches(archive):
+    """I need the archive's raw messages in bounded batches so a huge export is never all in memory."""
+    batch = []
+    for key in archive.iterkeys():
+        batch.append(archive.get_bytes(key))
+        if len(batch) == BACKFILL_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def write_backfill_csv(transactions, output):
+    """I need to write backfilled transactions to a local CSV in the sheet's column order."""
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Amount", "Description", "Category"])
+        for txn in transactions:
+            writer.writerow([txn["date"], txn["amount"], txn["desc"], txn["category"]])
+
+def write_backfill_sheet(transactions):
+    """I need all backfilled transactions (newest first) stored ahead of what is already there, in one bulk write."""
+    STORAGE.add_history([[txn["date"], txn["amount"], txn["desc"], txn["category"]] for txn in transactions])
+
+def run_backfill(path, output=None, workers=None, allowed_categories=None):
+    """
+    I need to import history from an exported mbox or Maildir: messages are parsed and classified across
+    all cores, then written newest-first in bulk to the sheet, or to a CSV file when output is given.
+    Nothing is de-duplicated against the sheet, so I only run this for ranges not ingested yet.
+    """
+    if allowed_categories is None:
+        allowed_categories = CATEGORY_LIST.get()
+    parse = functools.partial(parse_backfill_message, allowed_categories=allowed_categories)
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    scanned = 0
+    found = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in iter_archive_batches(open_archive(path)):
+            chunksize = max(1, len(batch) // (4 * workers))
+            found += [result for result in pool.map(parse, batch, chunksize=chunksize) if result]
+            scanned += len(batch)
+            elapsed = time.perf_counter() - started
+            logger.info(f"Backfill: {scanned:,} messages scanned, {len(found):,} transactions ({scanned / elapsed:,.0f} msg/s)")
+
+    # The sheet lists newest first
+    transactions = [txn for _, txn in sorted(found, key=lambda item: item[0], reverse=True)]
+    if transactions:
+        if output:
+            write_backfill_csv(transactions, output)
+        else:
+            write_backfill_sheet(transactions)
+    elapsed = time.perf_counter() - started
+    rate = scanned / elapsed if elapsed else 0
+    logger.info(
+        f"Backfill complete: {len(transactions):,} transactions from {scanned:,} messages in {elapsed:.1f}s "
+        f"({rate:,.0f} msg/s), written to {output or CONFIG['transactions_tab']}"
+    )
+    return {"messages": scanned, "transactions": len(transactions), "seconds": elapsed, "messages_per_sec": rate}
+
 # --- Main App Logic ---
 def send_down_email_and_save():
     """I need to send a 'going down' email and update the last down time in Google Sheets."""
@@ -473,6 +3263,13 @@ def shutdown_handler(signum, frame):
     logger.info(f"Received shutdown signal ({signum}), preparing to exit.")
     APP_RUNNING = False
     send_down_email_and_save()
+    MERCHANT_MEMO.save()
+    CHECKPOINTS.flush_all()
+    if LEDGER_SYNC is not None:
+        try:
+            LEDGER_SYNC.sync()
+        except Exception as e:
+            logger.error(f"Final ledger sync failed; pending rows will sync on the next start: {e}")
     # TODO: I may want to add more clean up steps here in the future
     sys.exit(0)
 
@@ -505,7 +3302,68 @@ def run_health_checks():
                 f"• Total transactions: {total_transactions}\n"
                 f"• Emails skipped: {total_skipped}\n"
                 f"• Last transaction: {str(load_last_transaction())}\n"
+                f"• Ingest mode: {INGEST_STATS['mode']}\n"
+                f"• Last push latency (ms): {INGEST_STATS['last_push_latency_ms'] or 'N/A'}\n"
+                f"• Last cycle bytes received: {INGEST_STATS['last_cycle_bytes']}\n"
+                f"• Peak RSS (MB): {INGEST_STATS['peak_rss_mb']}\n"
+            )
+            cache = PARSE_CACHE.stats()
+            heartbeat_msg += (
+                f"• Parse cache: {cache['hits']} hits, {cache['misses']} misses, {cache['size']} entries\n"
+            )
+            memo = MERCHANT_MEMO.stats()
+            heartbeat_msg += (
+                f"• Merchant memo: {memo['hits']} hits, {memo['misses']} misses, {memo['size']} merchants\n"
+            )
+            rules = CATEGORY_RULE_STORE.stats()
+            heartbeat_msg += (
+                f"• Category rules: {rules['rules']} from {rules['source']}, "
+                f"match latency {rules['avg_match_us']} us avg / {rules['max_match_us']} us max\n"
+            )
+            if LEDGER_SYNC is not None:
+                ledger = LEDGER_SYNC.stats()
+                heartbeat_msg += (
+                    f"• Local ledger: {ledger['pending']} pending, {ledger['synced']} synced, "
+                    f"last sync {ledger['last_sync_ms'] if ledger['last_sync_ms'] is not None else 'N/A'} ms, "
+                    f"{ledger['consecutive_failures']} failure(s) in a row\n"
+                )
+            category_list = CATEGORY_LIST.stats()
+            heartbeat_msg += (
+                f"• Category list: {category_list['reads']} read(s), {category_list['hits']} cache hits, "
+                f"{category_list['changes']} change(s)\n"
+            )
+            checkpoints = CHECKPOINTS.stats()
+            heartbeat_msg += (
+                f"• UID checkpoints: {checkpoints['fsyncs']} local fsync(s), {checkpoints['sheet_writes']} AppState write(s), "
+                f"{checkpoints['recovered']} recovered batch(es)\n"
             )
+            sheets = SHEETS_SESSION.stats()
+            heartbeat_msg += (
+                f"• Sheets client: {sheets['authorizations']} authorization(s), {sheets['opens']} spreadsheet open(s), "
+                f"{sheets['handle_hits']} cached handle reuses\n"
+            )
+            appstate = APPSTATE.stats()
+            heartbeat_msg += (
+                f"• AppState ({STORAGE.name} storage): {appstate['reads']} range read(s), {appstate['writes']} batch write(s), "
+                f"{appstate['mirror_hits']} reads from the local mirror\n"
+            )
+            scheduler = SHEETS_SCHEDULER.stats()
+            heartbeat_msg += (
+                f"• Sheets requests: {scheduler['calls']} sent, queue {scheduler['queue_depth']} (max {scheduler['max_queue_depth']}), "
+                f"{scheduler['coalesced']} coalesced, {scheduler['retries']} retried, {scheduler['throttle_s']}s throttled\n"
+            )
+            session = IMAP_SESSION.stats()
+            heartbeat_msg += (
+                f"• IMAP connection age (s): {session['connection_age_s'] if session['connection_age_s'] is not None else 'not connected'}\n"
+                f"• IMAP reconnects: {session['reconnects']}\n"
+                f"• Last IMAP login latency (ms): {session['last_login_ms'] or 'N/A'}\n"
+            )
+            for name, watcher in list(SOURCE_WATCHERS.items()):
+                stats = watcher.stats()
+                heartbeat_msg += (
+                    f"• Source {name}: {stats['transactions']} transactions, {stats['skipped']} skipped, "
+                    f"{stats['errors']} errors, queue {stats['queue_depth']}, reconnects {stats['reconnects']}\n"
+                )
             heartbeat_msg += (
                 f"\n• Log server local URL: http://localhost:{LOG_SERVER_PORT}/logs\n"
                 f"  Username: {LOG_SERVER_USERNAME}\n"
@@ -539,13 +3397,33 @@ def run_health_checks():
         raise
 
 def run_email_ingest():
-    """I need to continuously check for new transaction emails."""
+    """
+    I need to continuously check for new transaction emails. With "imap_sources" configured, every
+    source is watched concurrently by the async engine instead.
+    """
     logger.info("Email ingest started. Monitoring for transaction emails...")
+    mode = CONFIG.get("email_ingest_mode", "idle").lower()
 
     try:
+        sources = get_imap_sources()
+        if sources:
+            INGEST_STATS["mode"] = f"async ({len(sources)} sources)"
+            asyncio.run(run_async_ingest(sources))
+            return
         while APP_RUNNING:
-            check_inbox_and_process()
-            time.sleep(EMAIL_POLL_INTERVAL)
+            if mode == "idle":
+                INGEST_STATS["mode"] = "idle"
+                if not run_idle_ingest():
+                    mode = "poll"
+                    continue
+                # A dropped connection is retried with backoff by the next get(); any other
+                # error left the session open, so wait a poll interval before trying again
+                if APP_RUNNING and IMAP_SESSION.imap is not None:
+                    time.sleep(EMAIL_POLL_INTERVAL)
+            else:
+                INGEST_STATS["mode"] = "poll"
+                check_inbox_and_process()
+                time.sleep(EMAIL_POLL_INTERVAL)
     except KeyboardInterrupt:
         logger.info("Email ingest stopped by user")
         send_down_email_and_save()
@@ -554,6 +3432,8 @@ def run_email_ingest():
         send_email("Budget App Error", f"The budget app encountered an error: {e}")
         send_down_email_and_save()
         raise
+    finally:
+        IMAP_SESSION.close()
 
 def main():
     """I need to orchestrate the entire app: email monitoring, health checks, and local log server."""
@@ -579,8 +3459,19 @@ def main():
     health_thread = threading.Thread(target=run_health_checks, daemon=True)
     health_thread.start()
 
+    # Copy the local ledger to the sheet in the background
+    if LEDGER_SYNC is not None:
+        threading.Thread(target=LEDGER_SYNC.run, daemon=True).start()
+
     # Main process: email ingest
     run_email_ingest()
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        # python budget_app.py backfill <mbox file or Maildir> [output.csv]
+        if len(sys.argv) < 3:
+            print(f"{Fore.YELLOW}Usage: python budget_app.py backfill <mbox|maildir> [output.csv]{Style.RESET_ALL}")
+            sys.exit(1)
+        run_backfill(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    else:
+        main()
@@ -0,0 +1,1583 @@
+import socketserver
+import asyncio
+import socket
+import threading
+import select
+import time
+import re
+import email
+import email.parser
+import email.utils
+import sys
+import random
+import os
+import shutil
+import mailbox
+import tempfile
+import statistics
+import itertools
+import tracemalloc
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+from colorama import init as colorama_init, Fore, Style
+
+colorama_init(autoreset=True)
+
+# Benchmarks import budget_app, which loads config.json from the working directory,
+# so run this from the same folder as the app: python budget_bench.py <benchmark>
+
+def log(msg, color=Fore.RESET):
+    print(color + f"[budget_bench] {time.strftime('%Y-%m-%d %H:%M:%S')} {msg}" + Style.RESET_ALL, flush=True)
+
+def require(ok, msg):
+    """I need a benchmark's guarantee enforced, not just logged: a failure is reported in red and exits 1."""
+    if not ok:
+        log(f"FAILED: {msg}", Fore.RED)
+        sys.exit(1)
+
+SCRATCH_ROOT = None  # The run's temp folder, set and removed by main()
+
+def scratch_dir():
+    """I need a fresh folder for a benchmark's files, under the run's scratch root so nothing outlives the run."""
+    return tempfile.mkdtemp(dir=SCRATCH_ROOT)
+
+def scratch_path(name):
+    return os.path.join(scratch_dir(), name)
+
+# --- Local IMAP stand-in ---
+def parse_uid_set(uid_set, max_uid):
+    """I need to expand an IMAP UID set like '3,5:7' or '12:*' into a set of UIDs."""
+    uids = set()
+    for part in uid_set.split(","):
+        if ":" in part:
+            lo, hi = part.split(":", 1)
+            lo = max_uid if lo == "*" else int(lo)
+            hi = max_uid if hi == "*" else int(hi)
+            if lo > hi:
+                lo, hi = hi, lo
+            uids.update(range(lo, hi + 1))
+        else:
+            uids.add(max_uid if part == "*" else int(part))
+    return uids
+
+FETCH_ITEM_RE = re.compile(r'BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|RFC822|BODYSTRUCTURE', re.I)
+
+def split_raw(raw):
+    """I need to split raw message bytes into (header block, body)."""
+    for sep in (b"\r\n\r\n", b"\n\n"):
+        idx = raw.find(sep)
+        if idx != -1:
+            return raw[:idx + len(sep)], raw[idx + len(sep):]
+    return raw, b""
+
+def get_section(raw, section):
+    """I need the bytes of one BODY[section] of a raw message, as an IMAP server would send them."""
+    section = section.upper()
+    header, body = split_raw(raw)
+    if section == "":
+        return raw
+    if section == "HEADER":
+        return header
+    if section == "TEXT":
+        return body
+    if section.startswith("HEADER.FIELDS"):
+        names = set(section[section.index("(") + 1:section.rindex(")")].split())
+        msg = email.message_from_bytes(header)
+        lines = [f"{k}: {v}\r\n" for k, v in msg.items() if k.upper() in names]
+        return ("".join(lines) + "\r\n").encode()
+
+    is_mime = section.endswith(".MIME")
+    path = section[:-len(".MIME")] if is_mime else section
+    msg = email.message_from_bytes(raw)
+    if not msg.is_multipart():
+        # A single-part message has exactly one part: its body
+        if path != "1":
+            return b""
+        return header if is_mime else body
+    for index in path.split("."):
+        if not msg.is_multipart():
+            return b""
+        msg = msg.get_payload(int(index) - 1)
+    part_header, part_body = split_raw(msg.as_bytes())
+    return part_header if is_mime else part_body
+
+def imap_quote(value):
+    if value is None:
+        return "NIL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def get_bodystructure(msg, body=None):
+    """I need a BODYSTRUCTURE string for a parsed message, sized like get_section serves it."""
+    if msg.is_multipart():
+        children = "".join(get_bodystructure(part) for part in msg.get_payload())
+        return f"({children} {imap_quote(msg.get_content_subtype().upper())})"
+    if body is None:
+        body = split_raw(msg.as_bytes())[1]
+    params = msg.get_params() or []
+    param_str = " ".join(f"{imap_quote(k.upper())} {imap_quote(v)}" for k, v in params[1:])
+    encoding = msg.get("Content-Transfer-Encoding", "7BIT").upper()
+    structure = (
+        f"({imap_quote(msg.get_content_maintype().upper())} {imap_quote(msg.get_content_subtype().upper())} "
+        f"{'(' + param_str + ')' if param_str else 'NIL'} NIL NIL {imap_quote(encoding)} {len(body)}"
+    )
+    if msg.get_content_maintype() == "text":
+        structure += " " + str(body.count(b"\n"))
+    return structure + ")"
+
+SEARCH_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+def search_key_matches(tokens, uid, headers, max_uid):
+    """I need to consume one SEARCH key from tokens and evaluate it for a message."""
+    key = tokens.pop(0).upper()
+    if key == "ALL":
+        return True
+    if key == "UID":
+        return uid in parse_uid_set(tokens.pop(0), max_uid)
+    if key in ("FROM", "SUBJECT"):
+        return tokens.pop(0).lower() in (headers.get(key.title()) or "").lower()
+    if key == "OR":
+        first = search_key_matches(tokens, uid, headers, max_uid)
+        second = search_key_matches(tokens, uid, headers, max_uid)
+        return first or second
+    if key == "X-GM-RAW":
+        # Rough approximation of Gmail search: every term's value must appear in From or Subject
+        haystack = f"{headers.get('From')} {headers.get('Subject')}".lower()
+        return all(term.split(":")[-1].strip("()").lower() in haystack for term in tokens.pop(0).split())
+    raise ValueError(f"unsupported search key {key}")
+
+def search_matches(tokens, uid, raw, max_uid):
+    """I need to evaluate a whole SEARCH program (an implicit AND of its keys)."""
+    tokens = list(tokens)
+    headers = email.parser.BytesHeaderParser().parsebytes(raw)
+    matched = True
+    while tokens:
+        matched = search_key_matches(tokens, uid, headers, max_uid) and matched
+    return matched
+
+class StandInImapHandler(socketserver.StreamRequestHandler):
+    """I need to speak just enough IMAP4rev1 for budget_app's ingest path."""
+
+    def setup(self):
+        super().setup()
+        # Many small writes per response; don't let Nagle's algorithm add to the latency
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def write(self, data):
+        self.server.bytes_sent += len(data)
+        self.wfile.write(data)
+
+    def send_line(self, line):
+        self.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        self.reported = 0
+        caps = "IMAP4rev1"
+        if server.supports_idle:
+            caps += " IDLE"
+        if server.gmail_extensions:
+            caps += " X-GM-EXT-1"
+        self.send_line(f"* OK [CAPABILITY {caps}] budget_bench IMAP stand-in ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            server.commands += 1
+            if server.latency:
+                # Simulated network round trip
+                time.sleep(server.latency)
+            parts = line.decode().rstrip("\r\n").split(" ", 2)
+            tag = parts[0]
+            cmd = parts[1].upper() if len(parts) > 1 else ""
+            args = parts[2] if len(parts) > 2 else ""
+
+            if cmd == "CAPABILITY":
+                self.send_line(f"* CAPABILITY {caps}")
+                self.send_line(f"{tag} OK CAPABILITY completed")
+            elif cmd == "LOGIN":
+                self.send_line(f"{tag} OK LOGIN completed")
+            elif cmd in ("SELECT", "EXAMINE"):
+                with server.lock:
+                    self.reported = len(server.messages)
+                    self.send_line(f"* {self.reported} EXISTS")
+                    self.send_line(f"* OK [UIDVALIDITY {server.uidvalidity}] UIDs valid")
+                    self.send_line(f"* OK [UIDNEXT {server.next_uid}] Predicted next UID")
+                self.send_line(f"{tag} OK [READ-WRITE] {cmd} completed")
+            elif cmd == "NOOP":
+                self.send_line(f"{tag} OK NOOP completed")
+            elif cmd == "UID":
+                sub, _, rest = args.partition(" ")
+                if sub.upper() == "SEARCH":
+                    self.handle_search(tag, rest)
+                elif sub.upper() == "FETCH":
+                    self.handle_fetch(tag, rest)
+                else:
+                    self.send_line(f"{tag} BAD UID {sub} not supported")
+            elif cmd == "IDLE" and server.supports_idle:
+                self.handle_idle(tag)
+            elif cmd == "LOGOUT":
+                self.send_line("* BYE logging out")
+                self.send_line(f"{tag} OK LOGOUT completed")
+                return
+            else:
+                self.send_line(f"{tag} BAD {cmd} not supported")
+
+    def handle_search(self, tag, criteria):
+        server = self.server
+        tokens = [m.group(1) if m.group(1) is not None else m.group(2) for m in SEARCH_TOKEN_RE.finditer(criteria)]
+        if tokens and tokens[0].upper() == "CHARSET":
+            tokens = tokens[2:]
+        with server.lock:
+            max_uid = server.messages[-1][0] if server.messages else 0
+            try:
+                uids = [uid for uid, raw in server.messages if search_matches(tokens, uid, raw, max_uid)]
+            except (IndexError, ValueError) as e:
+                self.send_line(f"{tag} BAD SEARCH {e}")
+                return
+        self.send_line("* SEARCH" + "".join(f" {uid}" for uid in uids))
+        self.send_line(f"{tag} OK SEARCH completed")
+
+    def handle_fetch(self, tag, args):
+        server = self.server
+        uid_set, _, items = args.partition(" ")
+        with server.lock:
+            max_uid = server.messages[-1][0] if server.messages else 0
+            wanted = parse_uid_set(uid_set, max_uid)
+            hits = [(seq, uid, raw) for seq, (uid, raw) in enumerate(server.messages, 1) if uid in wanted]
+        for seq, uid, raw in hits:
+            out = f"* {seq} FETCH (UID {uid}".encode()
+            for match in FETCH_ITEM_RE.finditer(items):
+                if match.group(0).upper() == "BODYSTRUCTURE":
+                    msg = email.message_from_bytes(raw)
+                    out += f" BODYSTRUCTURE {get_bodystructure(msg, None if msg.is_multipart() else split_raw(raw)[1])}".encode()
+                    continue
+                if match.group(0).upper() == "RFC822":
+                    label, data = "RFC822", raw
+                else:
+                    section = match.group(1)
+                    data = get_section(raw, section)
+                    label = f"BODY[{section}]"
+                    if match.group(2) is not None:
+                        origin, length = int(match.group(2)), int(match.group(3))
+                        data = data[origin:origin + length]
+                        label += f"<{origin}>"
+                out += f" {label} {{{len(data)}}}\r\n".encode() + data
+            self.write(out + b")\r\n")
+        self.send_line(f"{tag} OK FETCH completed")
+
+    def handle_idle(self, tag):
+        server = self.server
+        self.send_line("+ idling")
+        # Like a real server, mail that arrived since the last report is announced right away
+        seen = self.reported
+        while True:
+            readable, _, _ = select.select([self.request], [], [], 0.05)
+            if readable:
+                self.rfile.readline()  # DONE
+                self.send_line(f"{tag} OK IDLE terminated")
+                return
+            with server.lock:
+                if len(server.messages) != seen:
+                    seen = self.reported = len(server.messages)
+                    self.send_line(f"* {seen} EXISTS")
+
+class StandInImapServer(socketserver.ThreadingTCPServer):
+    """I need a local, in-memory IMAP server so ingest latency can be measured without Gmail."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, supports_idle=True, gmail_extensions=False, latency=0):
+        super().__init__((host, port), StandInImapHandler)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.uidvalidity = 1
+        self.next_uid = 1
+        self.supports_idle = supports_idle
+        self.gmail_extensions = gmail_extensions
+        self.latency = latency
+        self.bytes_sent = 0
+        self.commands = 0
+
+    def reset_counters(self):
+        self.bytes_sent = 0
+        self.commands = 0
+
+    def append(self, raw):
+        """I need to deliver a raw RFC822 message to the mailbox and return its UID."""
+        with self.lock:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages.append((uid, raw))
+        return uid
+
+def make_alert(merchant, amount="12.34", date="Oct 17, 2026", attachment_bytes=0):
+    """
+    I need a transaction alert in the same format as the bank emails. With attachment_bytes
+    it also carries an HTML alternative and a PDF, like the statement emails do.
+    """
+    text = f"${amount} came out of your account\nTo: {merchant}\nDate: {date}\n"
+    if attachment_bytes:
+        msg = MIMEMultipart("mixed")
+        alternative = MIMEMultipart("alternative")
+        alternative.attach(MIMEText(text, "plain"))
+        alternative.attach(MIMEText(f"<html><body><p>{text}</p></body></html>", "html"))
+        msg.attach(alternative)
+        msg.attach(MIMEApplication(b"%PDF" + b"\0" * attachment_bytes, Name="statement.pdf"))
+    else:
+        msg = MIMEText(text)
+    msg["Subject"] = "Transaction alert"
+    msg["From"] = "alerts@bank.example.com"
+    msg["To"] = "me@example.com"
+    return msg.as_bytes()
+
+def make_html_alert(merchant, amount="12.34", date="Oct 17, 2026", size=2 * 1024):
+    """I need an HTML-only alert padded with marketing markup to roughly size bytes."""
+    rows = (
+        f'<tr><td style="padding:8px"><b>${amount}</b> came out of your account</td></tr>'
+        f'<tr><td>To:</td><td>{merchant}</td></tr><tr><td><strong>Date:</strong> {date}</td></tr>'
+    )
+    promo = '<tr><td class="promo"><a href="https://bank.example.com/offers">Earn 5% back&nbsp;this month</a></td></tr>\n'
+    head = "<html><head><style>td { font-family: Arial; }</style></head><body><table>"
+    padding = promo * max(0, (size - len(head) - len(rows)) // len(promo))
+    msg = MIMEText(f"{head}{rows}{padding}</table></body></html>", "html")
+    msg["Message-ID"] = email.utils.make_msgid(domain="bank.example.com")
+    msg["Subject"] = "Transaction alert"
+    msg["From"] = "alerts@bank.example.com"
+    msg["To"] = "me@example.com"
+    return msg.as_bytes()
+
+def make_newsletter(index, size=20 * 1024):
+    """I need a non-transaction email like the ones that make up most of the inbox."""
+    msg = MIMEText(f"Issue #{index}\n" + "Lorem ipsum dolor sit amet. " * (size // 28))
+    msg["Subject"] = f"Weekly newsletter #{index}"
+    msg["From"] = "news@shop.example.com"
+    msg["To"] = "me@example.com"
+    return msg.as_bytes()
+
+def start_stand_in(budget_app, **kwargs):
+    """I need to start the stand-in server and point budget_app's IMAP config at it."""
+    server = StandInImapServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    budget_app.CONFIG.update(imap_server="127.0.0.1", imap_port=server.server_address[1], imap_ssl=False)
+    return server
+
+def use_local_sheet(budget_app, write_latency=0):
+    """
+    I need to keep the sheet out of the measurement, so the transaction insert and UID
+    checkpoints are replaced with in-memory recorders (write_latency simulates one Sheets API
+    write per batch). Returns a dict of merchant -> write time.
+    """
+    written = {}
+    state = {}
+
+    def key(name, source):
+        return name, (source or {}).get("name")
+
+    def insert(txn):
+        written[txn["desc"]] = time.monotonic()
+
+    def insert_batch(txns):
+        if txns:
+            time.sleep(write_latency)
+        for txn in txns:
+            # Looked up on every call so a benchmark can wrap insert_transaction to inject failures
+            budget_app.insert_transaction(txn)
+
+    budget_app.load_last_uid = lambda source=None: state.get(key("uid", source))
+    budget_app.save_last_uid = lambda uid, source=None: state.__setitem__(key("uid", source), uid)
+    budget_app.load_uidvalidity = lambda source=None: state.get(key("uidvalidity", source))
+    budget_app.save_uidvalidity = lambda value, source=None: state.__setitem__(key("uidvalidity", source), value)
+    budget_app.insert_transaction = insert
+    budget_app.insert_transactions = insert_batch
+    budget_app.CHECKPOINTS = budget_app.CheckpointJournal(scratch_path("checkpoint.json"))
+    return written
+
+def report_latencies(label, latencies_ms):
+    latencies_ms = sorted(latencies_ms)
+    p95 = latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))]
+    log(
+        f"{label}: n={len(latencies_ms)}  p50={statistics.median(latencies_ms):.1f} ms  "
+        f"p95={p95:.1f} ms  max={latencies_ms[-1]:.1f} ms",
+        Fore.CYAN + Style.BRIGHT
+    )
+
+# --- Parser regression corpus ---
+def legacy_parse_email_transaction(body):
+    """I need the multi-scan parser as it was before the single-pass rewrite, as the regression reference."""
+    lines = [line.strip() for line in body.replace('\r\n', '\n').replace('\r', '\n').split('\n') if line.strip()]
+
+    amount = None
+    amount_pattern_1 = re.compile(r'\$([0-9,]+\.\d{2}) came out of your account')
+    amount_pattern_2 = re.compile(r'for \$([0-9,]+\.\d{2})')
+    for line in lines:
+        match = amount_pattern_1.search(line)
+        if match:
+            amount = match.group(1)
+            break
+        match = amount_pattern_2.search(line)
+        if match:
+            amount = match.group(1)
+            break
+
+    merchant = None
+    for i, line in enumerate(lines):
+        if "*To:*" in line or "To:" in line:
+            if line.strip() in ("*To:*", "To:"):
+                for j in range(i+1, len(lines)):
+                    next_line = lines[j].strip()
+                    if next_line:
+                        merchant = next_line
+                        break
+                break
+            else:
+                merchant = line.split(":", 1)[-1].strip("*").strip()
+                break
+
+    if not merchant:
+        for line in lines:
+            if line.lower().startswith("merchant:"):
+                merchant = line.split(":", 1)[-1].strip()
+                break
+
+    date = None
+    for i, line in enumerate(lines):
+        if "*Date:*" in line or "Date:" in line:
+            if line.strip() in ("*Date:*", "Date:"):
+                for j in range(i+1, len(lines)):
+                    next_line = lines[j].strip()
+                    if next_line:
+                        date = next_line
+                        break
+                break
+            else:
+                date = line.split(":", 1)[-1].strip("*").strip()
+                break
+
+    if not amount or not merchant or not date:
+        return None
+
+    return {
+        "amount": amount,
+        "desc": merchant,
+        "date": date
+    }
+
+PARSER_CORPUS = [
+    "$12.34 came out of your account\nTo: SAFEWAY 0987\nDate: Oct 17, 2026\n",
+    "$1,204.00 came out of your account\r\n\r\n*To:*\r\nSTARBUCKS #1234\r\n*Date:*\r\nOct 17, 2026\r\n",
+    "Your card was charged for $8.50 at a merchant.\nMerchant: TACO BELL 221\nDate: 10/17/2026\n",
+    "Hi,\n  You spent for $3.00 then $9.99 came out of your account\n  *To:* CHEVRON 0042  \n  *Date:* Oct 1\n",
+    "$5.00 came out of your account\nSent To: Jane Doe\nDate: Oct 2, 2026\n",
+    "$5.00 came out of your account\nTo:\nDate: Oct 3, 2026\n",
+    "$5.00 came out of your account\nTo:*\nmerchant: ARCO 12\nDate:\n\n  Oct 4, 2026\n",
+    "$5.00 came out of your account\rTo: ROSS 7\rDate: Oct 5, 2026",
+    "Newsletter\nNothing to see here.\nUpdate: prices To: rise\n",
+    "$7.25 came out of your account\nTo: WINCO\n",
+    "Date: Oct 6, 2026\nTo: AMAZON MKTPLACE\nA purchase for $42.00 was made\n",
+    "for $1.00\nfor $2.00 came out of your account\nTo: X\nDate:\n",
+    "$9.00 came out of your account\nTo:\n",
+    "\u2028$4.00 came out of your account\u2028\nTo: \u00a0CAF\u00c9 \u00a0\nDate:\tOct 7\n",
+    "",
+    # Real alerts carry a long footer after the fields; most of the inbox is multi-line newsletters
+    "$18.20 came out of your account\nTo: SAVE MART 55\nDate: Oct 9, 2026\n" + "".join(
+        f"Footer line {i}: manage alerts at bank.example.com. Member FDIC.\n" for i in range(60)
+    ),
+    "".join(f"Newsletter paragraph {i}: shop the sale before it ends.\n\n" for i in range(150)),
+    "Lorem ipsum dolor sit amet. " * 400 + "\n$3.50 came out of your account\nTo: DUNKIN\nDate: Oct 8\n",
+]
+
+# Bodies where the legacy parser was wrong: it took "To:" anywhere in a line as the recipient label
+PARSER_CORPUS_FIXES = {
+    "$5.00 came out of your account\nSent To: Jane Doe\nDate: Oct 2, 2026\n": None,
+}
+
+# --- Classifier regression corpus ---
+def legacy_classify(desc, allowed_categories, rules):
+    """I need the rule-by-rule classifier as it was before the automaton, as the regression reference."""
+    desc_low = desc.lower()
+    for regex, mapped in rules:
+        if re.search(regex, desc_low):
+            if mapped in allowed_categories:
+                return mapped
+
+    if "Uncategorized" in allowed_categories:
+        return "Uncategorized"
+    if "Shopping" in allowed_categories:
+        return "Shopping"
+    return allowed_categories[0] if allowed_categories else ""
+
+MERCHANT_FRAGMENTS = [
+    "SAFEWAY", "STARBUCKS", "CHICK-FIL-A", "CHICK FIL A", "WAL-MART", "WALMART", "WAL MART", "SHELL OIL",
+    "AMAZON MKTPLACE", "7-ELEVEN", "TARGET", "CINEMARK", "GROCERY OUTLET", "UBER EATS", "UBER TRIP",
+    "SQ *BLUE BOTTLE", "TST* IN-N-OUT", "#0457", "SAN JOSE CA", "DOLLAR TREE", "ROSS STORES", "GASTRO PUB", "",
+]
+
+def random_merchant(rng):
+    return " ".join(rng.choice(MERCHANT_FRAGMENTS) for _ in range(rng.randint(1, 3)))
+
+# --- Benchmarks ---
+def bench_idle_latency(count=20, spacing=0.25):
+    """I need to measure notification-to-sheet latency of IDLE push mode against the stand-in."""
+    import budget_app
+    server = start_stand_in(budget_app)
+    written = use_local_sheet(budget_app)
+
+    ingest = threading.Thread(target=budget_app.run_idle_ingest, daemon=True)
+    ingest.start()
+    time.sleep(0.5)
+
+    latencies = []
+    for i in range(count):
+        merchant = f"BENCH MERCHANT {i}"
+        sent_at = time.monotonic()
+        server.append(make_alert(merchant))
+        while merchant not in written:
+            time.sleep(0.001)
+        latencies.append((written[merchant] - sent_at) * 1000)
+        time.sleep(spacing)
+
+    budget_app.APP_RUNNING = False
+    ingest.join(timeout=5)
+    server.shutdown()
+    report_latencies("IDLE delivery-to-sheet latency", latencies)
+
+def bench_backlog(count=200, attachment_bytes=100 * 1024):
+    """I need to compare backlog catch-up cost across the RFC822, batch and BODYSTRUCTURE fetch modes."""
+    import budget_app
+    server = start_stand_in(budget_app)
+    for i in range(count):
+        server.append(make_alert(f"BACKLOG MERCHANT {i}", attachment_bytes=attachment_bytes if i % 4 == 0 else 0))
+
+    for mode in ("rfc822", "batch", "bodystructure"):
+        written = use_local_sheet(budget_app)
+        budget_app.CONFIG["imap_fetch_mode"] = mode
+        server.reset_counters()
+        started = time.perf_counter()
+        budget_app.check_inbox_and_process()
+        elapsed = time.perf_counter() - started
+        log(
+            f"{mode:>13}: {len(written)}/{count} transactions in {elapsed:.2f}s  "
+            f"commands={server.commands}  bytes={server.bytes_sent:,}",
+            Fore.CYAN + Style.BRIGHT
+        )
+    server.shutdown()
+
+def bench_prefilter(count=400, alert_every=20):
+    """I need to compare a cycle over a mostly-newsletter inbox with and without the server-side filter."""
+    import budget_app
+    server = start_stand_in(budget_app)
+    for i in range(count):
+        server.append(make_alert(f"FILTER MERCHANT {i}") if i % alert_every == 0 else make_newsletter(i))
+
+    for label, search_filter in (("unfiltered", None), ("filtered", {"senders": ["alerts@bank.example.com"]})):
+        written = use_local_sheet(budget_app)
+        budget_app.CONFIG["imap_filter"] = search_filter
+        server.reset_counters()
+        started = time.perf_counter()
+        budget_app.check_inbox_and_process()
+        elapsed = time.perf_counter() - started
+        log(
+            f"{label:>10}: {len(written)} transactions from {count} emails in {elapsed:.2f}s  "
+            f"commands={server.commands}  bytes={server.bytes_sent:,}  last UID={budget_app.load_last_uid()}",
+            Fore.CYAN + Style.BRIGHT
+        )
+    server.shutdown()
+
+def bench_session(cycles=30):
+    """I need to compare poll cycles that log in every time with cycles on the shared IMAP session."""
+    import budget_app
+    server = start_stand_in(budget_app)
+    # One recorder for both runs, so the second run resumes from the first run's checkpoint
+    written = use_local_sheet(budget_app)
+    for label, reuse in (("fresh login", False), ("shared session", True)):
+        written.clear()
+        budget_app.IMAP_SESSION.close()
+        server.reset_counters()
+        timings = []
+        for i in range(cycles):
+            if not reuse:
+                budget_app.IMAP_SESSION.close()
+            server.append(make_alert(f"SESSION MERCHANT {label} {i}"))
+            started = time.perf_counter()
+            budget_app.check_inbox_and_process()
+            timings.append((time.perf_counter() - started) * 1000)
+        report_latencies(f"{label:>14} cycle time", timings)
+        log(
+            f"{label:>14}: {len(written)}/{cycles} transactions  commands={server.commands}  "
+            f"session={budget_app.IMAP_SESSION.stats()}",
+            Fore.CYAN + Style.BRIGHT
+        )
+    budget_app.IMAP_SESSION.close()
+    server.shutdown()
+
+def bench_sources(sources=3, count=40, latency=0.01, write_latency=0.005):
+    """
+    I need to compare watching several mailboxes one after another with the async engine watching
+    them concurrently. Every stand-in adds a simulated round trip to each command.
+    """
+    import budget_app
+    servers = [start_stand_in(budget_app, latency=latency) for _ in range(sources)]
+    configs = [
+        {"name": f"source-{i}", "imap_port": server.server_address[1], "email_ingest_mode": "poll"}
+        for i, server in enumerate(servers)
+    ]
+    budget_app.CONFIG["imap_fetch_mode"] = "rfc822"
+    budget_app.CONFIG["imap_sources"] = configs
+    sources_cfg = budget_app.get_imap_sources()
+    # One recorder for both runs, so the second run resumes from the first run's checkpoints
+    written = use_local_sheet(budget_app, write_latency)
+
+    for label in ("serial", "async engine"):
+        written.clear()
+        for i, server in enumerate(servers):
+            for j in range(count):
+                server.append(make_alert(f"{label} SOURCE {i} MERCHANT {j}"))
+        started = time.perf_counter()
+        if label == "serial":
+            for source in sources_cfg:
+                imap = budget_app.connect_imap(source)
+                budget_app.process_new_emails(imap, source)
+                imap.logout()
+        else:
+            budget_app.APP_RUNNING = True
+            engine = threading.Thread(target=lambda: asyncio.run(budget_app.run_async_ingest(sources_cfg)), daemon=True)
+            engine.start()
+            while len(written) < sources * count:
+                time.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        budget_app.APP_RUNNING = False
+        if label != "serial":
+            engine.join(timeout=5)
+        log(
+            f"{label:>12}: {len(written)} transactions from {sources} sources in {elapsed:.2f}s  "
+            f"({len(written) / elapsed:.0f} txn/s)",
+            Fore.CYAN + Style.BRIGHT
+        )
+    for server in servers:
+        server.shutdown()
+
+def bench_backfill(count=20000, alert_every=5):
+    """I need messages/sec for an mbox backfill parsed on one core versus all cores."""
+    import budget_app
+    categories = ["Groceries", "Fast Food", "Shopping", "Coffee Shops", "Gas", "Uncategorized"]
+    merchants = ["SAFEWAY 0987", "STARBUCKS #1234", "CHEVRON 0042", "AMAZON MKTPLACE", "LOCAL DINER"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "archive.mbox")
+        archive = mailbox.mbox(path)
+        for i in range(count):
+            raw = make_alert(merchants[i % len(merchants)]) if i % alert_every == 0 else make_newsletter(i, size=4 * 1024)
+            archive.add(raw)
+        archive.flush()
+        archive.close()
+        log(f"Wrote {count:,} messages ({os.path.getsize(path):,} bytes) to a temporary mbox")
+
+        for workers in (1, os.cpu_count() or 1):
+            stats = budget_app.run_backfill(path, os.path.join(tmp, "out.csv"), workers, categories)
+            log(
+                f"{workers:>3} worker(s): {stats['transactions']:,} transactions from {stats['messages']:,} messages "
+                f"in {stats['seconds']:.2f}s  ({stats['messages_per_sec']:,.0f} msg/s)",
+                Fore.CYAN + Style.BRIGHT
+            )
+
+def bench_parser(rounds=20000):
+    """I need the single-pass parser to match the legacy parser on the corpus, and its speed against it."""
+    import budget_app
+    for body in PARSER_CORPUS:
+        expected = PARSER_CORPUS_FIXES[body] if body in PARSER_CORPUS_FIXES else legacy_parse_email_transaction(body)
+        actual = budget_app.parse_email_transaction(body)
+        if actual != expected:
+            log(f"MISMATCH for {body[:60]!r}: expected {expected}, got {actual}", Fore.RED)
+            sys.exit(1)
+    log(
+        f"Regression corpus: {len(PARSER_CORPUS)} bodies parse as expected "
+        f"({len(PARSER_CORPUS_FIXES)} corrected from legacy)", Fore.GREEN
+    )
+
+    for label, corpus in (("short", PARSER_CORPUS[:-3]), ("footer", PARSER_CORPUS[-3:-2]),
+                          ("newsletter", PARSER_CORPUS[-2:-1]), ("long line", PARSER_CORPUS[-1:])):
+        timings = {}
+        for name, parse in (("legacy", legacy_parse_email_transaction), ("single-pass", budget_app.parse_email_transaction)):
+            n = max(1, rounds // len(corpus))
+            started = time.perf_counter()
+            for _ in range(n):
+                for body in corpus:
+                    parse(body)
+            timings[name] = (time.perf_counter() - started) / (n * len(corpus)) * 1e6
+        log(
+            f"{label:>10}: legacy {timings['legacy']:.2f} us/email  single-pass {timings['single-pass']:.2f} us/email  "
+            f"({timings['legacy'] / timings['single-pass']:.1f}x)",
+            Fore.CYAN + Style.BRIGHT
+        )
+
+def bench_templates(issuers=300, rounds=20000):
+    """I need template selection cost with many registered issuers: sender-keyed dispatch versus trying each in turn."""
+    import budget_app
+    for i in range(issuers):
+        budget_app.register_alert_template(budget_app.AlertTemplate(
+            f"Issuer {i}", [f"alerts@issuer{i}.example.com"],
+            amount=rf"Issuer {i} charge of \$([0-9,]+\.\d{{2}})", merchant=r"^Where:\s*(.+)$", date=r"^When:\s*(.+)$",
+        ))
+    last = issuers - 1
+    body = f"Issuer {last} charge of $23.45\nWhere: SAFEWAY 0987\nWhen: Oct 17, 2026\n"
+    sender = f"Issuer Alerts <alerts@issuer{last}.example.com>"
+    templates = list({id(t): t for t in budget_app.ALERT_TEMPLATES.values()}.values())
+    log(f"Dispatch result: {budget_app.parse_alert(body, sender)}", Fore.GREEN)
+
+    def chain(body):
+        for template in templates:
+            txn = template.parse(body)
+            if txn:
+                return txn
+
+    for label, parse in (("dispatch", lambda b: budget_app.parse_alert(b, sender)), ("try each", chain)):
+        n = rounds if label == "dispatch" else max(1, rounds // 100)
+        started = time.perf_counter()
+        for _ in range(n):
+            parse(body)
+        log(f"{label:>9}: {(time.perf_counter() - started) / n * 1e6:.2f} us/email with {issuers} issuers", Fore.CYAN + Style.BRIGHT)
+
+def bench_html(rounds=200):
+    """I need the per-message cost and peak memory of the HTML-only path for small alerts and heavy marketing mail."""
+    import budget_app
+    for label, size in (("2 KB alert", 2 * 1024), ("500 KB marketing", 500 * 1024)):
+        msg = email.message_from_bytes(make_html_alert(f"HTML MERCHANT {label}", size=size))
+        txn = budget_app.parse_alert(budget_app.extract_body(msg), msg["From"])
+        n = rounds if size < 64 * 1024 else max(1, rounds // 20)
+        started = time.perf_counter()
+        for _ in range(n):
+            budget_app.parse_alert(budget_app.extract_body(msg), msg["From"])
+        per_message_ms = (time.perf_counter() - started) / n * 1000
+        tracemalloc.start()
+        budget_app.extract_body(msg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        log(
+            f"{label:>16}: {per_message_ms:.3f} ms/message  peak extra memory {peak / 1024:,.0f} KB  parsed={txn}",
+            Fore.CYAN + Style.BRIGHT
+        )
+
+def bench_parse_cache(count=200, fail_at=150):
+    """I need to show a cycle retried after a failed sheet write hitting the parse cache instead of re-parsing."""
+    import budget_app
+    server = start_stand_in(budget_app)
+    for i in range(count):
+        server.append(make_html_alert(f"CACHE MERCHANT {i}", size=100 * 1024))
+    budget_app.CONFIG["imap_fetch_mode"] = "rfc822"
+    budget_app.PARSE_CACHE = budget_app.ParseCache(scratch_path("parse_cache.json"), 5000)
+
+    for label, warm in (("cold retry", False), ("cached retry", True)):
+        use_local_sheet(budget_app)
+        insert = budget_app.insert_transaction
+
+        def failing_insert(txn):
+            if txn["desc"] == f"CACHE MERCHANT {fail_at}":
+                raise RuntimeError("simulated Sheets quota error")
+            insert(txn)
+
+        budget_app.insert_transaction = failing_insert
+        budget_app.check_inbox_and_process()
+        budget_app.insert_transaction = insert
+        if not warm:
+            budget_app.PARSE_CACHE.entries.clear()
+        budget_app.PARSE_CACHE.hits = budget_app.PARSE_CACHE.misses = 0
+        started = time.perf_counter()
+        budget_app.check_inbox_and_process()
+        elapsed = time.perf_counter() - started
+        log(
+            f"{label:>12}: retry cycle wrote {count - fail_at} transactions in {elapsed:.3f}s  "
+            f"cache={budget_app.PARSE_CACHE.stats()}",
+            Fore.CYAN + Style.BRIGHT
+        )
+    budget_app.IMAP_SESSION.close()
+    server.shutdown()
+
+def bench_classify(samples=5000, extra_rules=500, rounds=20000):
+    """I need the automaton classifier to agree with the rule-by-rule one, and its cost as rules grow."""
+    import budget_app
+    rng = random.Random(7)
+    categories = ["Groceries", "Fast Food", "Shopping", "Coffee Shops", "Gas", "Movies & DVDs", "Uncategorized", "Rides"]
+    # A few rules re cannot expand to keywords, to exercise the regex fallback and its priority handling
+    rules = budget_app.CATEGORY_RULES[:2] + [(r'uber(?! eats)', 'Rides'), (r'^sq \*', 'Coffee Shops')] + budget_app.CATEGORY_RULES[2:]
+    for _ in range(samples):
+        allowed = rng.sample(categories, rng.randint(0, len(categories)))
+        desc = random_merchant(rng)
+        expected = legacy_classify(desc, allowed, rules)
+        matched = budget_app.CategoryMatcher(rules, allowed).match(desc.lower())
+        actual = matched if matched is not None else legacy_classify("", allowed, [])
+        if actual != expected:
+            log(f"MISMATCH for {desc!r} allowed={allowed}: expected {expected!r}, got {actual!r}", Fore.RED)
+            sys.exit(1)
+    log(f"Regression: {samples} random merchants/category sets classify identically", Fore.GREEN)
+
+    descs = [random_merchant(rng) for _ in range(200)]
+    for label, rule_set in (("7 rules", budget_app.CATEGORY_RULES), (f"{extra_rules + 7} rules", budget_app.CATEGORY_RULES + [
+        ("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8)), "Shopping") for _ in range(extra_rules)
+    ])):
+        matcher = budget_app.CategoryMatcher(rule_set, categories)
+        timings = {}
+        for name, classify in (("legacy", lambda d: legacy_classify(d, categories, rule_set)),
+                               ("automaton", lambda d: matcher.match(d.lower()))):
+            n = max(1, rounds // len(descs) // (20 if name == "legacy" and len(rule_set) > 7 else 1))
+            started = time.perf_counter()
+            for _ in range(n):
+                for desc in descs:
+                    classify(desc)
+            timings[name] = (time.perf_counter() - started) / (n * len(descs)) * 1e6
+        log(
+            f"{label:>10}: legacy {timings['legacy']:.2f} us/txn  automaton {timings['automaton']:.2f} us/txn",
+            Fore.CYAN + Style.BRIGHT
+        )
+
+def bench_rules_reload(rules=300, reloads=5, threads=4):
+    """I need classifications to keep running, never seeing a half-built table, while the rules file is rewritten."""
+    import json
+    import budget_app
+    rng = random.Random(11)
+    categories = ("Groceries", "Fast Food", "Shopping", "Coffee Shops", "Gas", "Uncategorized")
+    path = scratch_path("category_rules.json")
+
+    def write_rules(generation):
+        entries = [{"pattern": pattern, "category": category, "priority": 1} for pattern, category in budget_app.CATEGORY_RULES]
+        entries += [
+            {"pattern": "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8)), "category": "Shopping"}
+            for _ in range(rules)
+        ]
+        # Every generation maps the probe merchant somewhere else
+        entries.append({"pattern": "probe merchant", "category": categories[generation % len(categories)], "priority": 5})
+        with open(path, "w") as f:
+            json.dump(entries, f)
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + generation))
+
+    budget_app.CONFIG["category_rules_file"] = path
+    budget_app.CATEGORY_RULES_CHECK_INTERVAL = 0
+    write_rules(0)
+    errors = []
+    seen = set()
+    stop = threading.Event()
+
+    def classify_loop():
+        while not stop.is_set():
+            try:
+                seen.add(budget_app.classify_category("PROBE MERCHANT #12", categories))
+                budget_app.classify_category(random_merchant(rng), categories)
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=classify_loop) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for generation in range(1, reloads + 1):
+        time.sleep(0.3)
+        write_rules(generation)
+    time.sleep(0.3)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    log(
+        f"{reloads} reloads under {threads} classifying threads: errors={len(errors)}  probe categories seen={sorted(seen)}  "
+        f"stats={budget_app.CATEGORY_RULE_STORE.stats()}",
+        Fore.CYAN + Style.BRIGHT
+    )
+
+def bench_memo(merchants=300, extra_rules=500, rounds=20000):
+    """I need repeat merchants to skip the rule scan, and a category fixed in the sheet to stick."""
+    import budget_app
+    rng = random.Random(13)
+    categories = ("Groceries", "Fast Food", "Shopping", "Coffee Shops", "Gas", "Uncategorized")
+    budget_app.CATEGORY_RULE_STORE.current = budget_app.CategoryRuleSet(budget_app.CATEGORY_RULES + [
+        ("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8)), "Shopping") for _ in range(extra_rules)
+    ], "bench", None)
+    budget_app.CONFIG.pop("category_rules_file", None)
+    path = scratch_path("merchant_memo.json")
+    # Repeat merchants with a different store number on every visit
+    descs = [f"{random_merchant(rng)} #{rng.randint(100, 9999)}" for _ in range(merchants)]
+    visits = [f"{rng.choice(descs).rsplit('#', 1)[0]}#{rng.randint(100, 9999)}" for _ in range(rounds)]
+    matcher = budget_app.CATEGORY_RULE_STORE.matcher(categories)
+
+    started = time.perf_counter()
+    for desc in visits:
+        budget_app.classify_with_rules(desc, matcher)
+    rules_us = (time.perf_counter() - started) / rounds * 1e6
+    budget_app.MERCHANT_MEMO = budget_app.MerchantMemo(path, 10000)
+    started = time.perf_counter()
+    for desc in visits:
+        budget_app.classify_category(desc, categories)
+    memo_us = (time.perf_counter() - started) / rounds * 1e6
+    log(
+        f"{rounds} visits to {merchants} merchants ({extra_rules + 7} rules): rules {rules_us:.2f} us/txn  "
+        f"memo {memo_us:.2f} us/txn  memo={budget_app.MERCHANT_MEMO.stats()}",
+        Fore.CYAN + Style.BRIGHT
+    )
+
+    # Oldest first, written the way the app writes them; then someone recategorizes the last one
+    budget_app.STORAGE = budget_app.MemoryBackend(categories)
+    txns = [
+        {"date": "2026-10-15", "amount": "4.50", "desc": "STARBUCKS 0042", "row_id": "default/1/1"},
+        {"date": "2026-10-16", "amount": "52.10", "desc": "SAFEWAY #0123", "row_id": "default/1/2"},
+        {"date": "2026-10-17", "amount": "38.75", "desc": "SAFEWAY #0456", "row_id": "default/1/3"},
+    ]
+    budget_app.classify_transactions(txns, categories)
+    budget_app.STORAGE.append_transactions([
+        [txn["date"], txn["amount"], txn["desc"], txn["category"], txn["row_id"]] for txn in txns
+    ])
+    budget_app.STORAGE.rows[-1][3] = "Gas"
+
+    before = budget_app.classify_category("SAFEWAY #0789", categories)
+    budget_app.learn_sheet_corrections(categories)
+    after = budget_app.classify_category("SAFEWAY #0789", categories)
+    budget_app.MERCHANT_MEMO = budget_app.MerchantMemo(path, 10000)
+    reloaded = budget_app.classify_category("SAFEWAY #0789", categories)
+    log(f"Sheet correction: before={before!r}  after learning={after!r}  after restart={reloaded!r}", Fore.CYAN + Style.BRIGHT)
+
+# Real-world descriptor variants as they show up in alerts, with the merchant they should normalize to
+DESCRIPTOR_CORPUS = [
+    ("AMZN Mktp US*2K3L45TY1", "amazon"),
+    ("Amazon.com*MB1234XY2", "amazon"),
+    ("AMAZON MKTPLACE PMTS", "amazon"),
+    ("Prime Video*1A2B3C", "amazon"),
+    ("WAL-MART #2345 SAN JOSE CA", "walmart"),
+    ("WM SUPERCENTER #1234", "walmart"),
+    ("Walmart.com 8009256278", "walmart"),
+    ("TARGET T-1234 SUNNYVALE CA", "target"),
+    ("TARGET.COM *", "target"),
+    ("COSTCO WHSE #0423", "costco"),
+    ("COSTCO GAS #0423 SANTA CLARA CA", "costco"),
+    ("SAFEWAY #0457 SAN JOSE CA", "safeway"),
+    ("SAFEWAY FUEL 1234", "safeway"),
+    ("SQ *STARBUCKS #0457 SAN JOSE CA", "starbucks"),
+    ("STARBUCKS STORE 12345", "starbucks"),
+    ("Starbucks Card Reload", "starbucks"),
+    ("DUNKIN #345678 Q35", "dunkin"),
+    ("MCDONALD'S F12345", "mcdonald's"),
+    ("MC DONALDS 1234 OAKLAND CA", "mcdonald's"),
+    ("CHICK-FIL-A #01234", "chick-fil-a"),
+    ("TST* CHICK FIL A 0123", "chick-fil-a"),
+    ("IN-N-OUT BURGER 123", "in-n-out"),
+    ("IN N OUT BURGER #123 MILPITAS CA", "in-n-out"),
+    ("TACO BELL #031234", "taco bell"),
+    ("CHEVRON 0091234 SAN JOSE CA", "chevron"),
+    ("SHELL OIL 57444555100", "shell"),
+    ("ARCO#42142AMPM", "arco"),
+    ("AMPM 42142 FREMONT CA", "arco"),
+    ("7-ELEVEN 38451 CUPERTINO CA", "7-eleven"),
+    ("UBER *TRIP HELP.UBER.COM", "uber"),
+    ("UBER *EATS PENDING", "uber eats"),
+    ("UBER EATS 8005928996 CA", "uber eats"),
+    ("DD DOORDASH BURGERKING", "doordash"),
+    ("DOORDASH*PANDA EXPRESS", "doordash"),
+    ("CINEMARK THEATRES 0123", "cinemark"),
+    ("NETFLIX.COM 866-579-7172 CA", "netflix"),
+    ("Spotify USA 8777781161", "spotify"),
+    ("APPLE.COM/BILL 866-712-7753 CA", "apple"),
+    ("GOOGLE *YouTubePremium", "google"),
+    ("POS PURCHASE DOLLAR TREE 1234", "dollar tree"),
+    ("PURCHASE AUTHORIZED ON 03/14 GROCERY OUTLET 123", "grocery outlet"),
+    ("CHECKCARD 0314 WINCO FOODS #12", "winco"),
+    ("SQ *BLUE BOTTLE COFFEE Oakland CA", "blue bottle coffee oakland"),
+    ("TST* THE HABIT #123", "the habit"),
+]
+
+def bench_normalize(rounds=2000):
+    """I need every corpus variant to land on its canonical merchant, fast enough to run on each transaction."""
+    import budget_app
+    failures = 0
+    for desc, expected in DESCRIPTOR_CORPUS:
+        actual = budget_app.normalize_merchant(desc)
+        if actual != expected:
+            failures += 1
+            log(f"MISMATCH for {desc!r}: expected {expected!r}, got {actual!r}", Fore.RED)
+    if failures:
+        sys.exit(1)
+    descs = [desc for desc, _ in DESCRIPTOR_CORPUS]
+    log(
+        f"Regression: {len(descs)} descriptor variants -> {len(set(budget_app.normalize_merchant(d) for d in descs))} merchants "
+        f"(raw lowercase would be {len(set(d.lower() for d in descs))} keys)",
+        Fore.GREEN
+    )
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for desc in descs:
+            budget_app.normalize_merchant(desc)
+    per_txn_us = (time.perf_counter() - started) / (rounds * len(descs)) * 1e6
+    categories = ("Groceries", "Fast Food", "Shopping", "Coffee Shops", "Gas", "Movies & DVDs", "Uncategorized")
+    matcher = budget_app.CATEGORY_RULE_STORE.matcher(categories)
+    raw_hits = sum(budget_app.CATEGORY_RULE_STORE.match(matcher, d.lower()) is not None for d in descs)
+    hits = sum(budget_app.classify_with_rules(d, matcher) != "Uncategorized" for d in descs)
+    log(
+        f"normalize {per_txn_us:.2f} us/txn  index={len(budget_app.MERCHANT_INDEX.aliases)} aliases  "
+        f"rules matched {raw_hits}/{len(descs)} raw descriptors, {hits}/{len(descs)} with canonical merchants",
+        Fore.CYAN + Style.BRIGHT
+    )
+
+class SheetsQuotaError(Exception):
+    """I need an error shaped like googleapiclient's HttpError for a 429 answer."""
+
+    def __init__(self):
+        super().__init__("429 RATE_LIMIT_EXCEEDED: Quota exceeded for quota metric")
+        self.resp = type("Response", (), {"status": 429})()
+
+SHEETS_READ_CALLS = {"get_value", "get_values", "get_col"}
+SHEETS_WRITE_CALLS = {"update_value", "update_values", "insert_rows", "add_rows"}
+
+class FakeSheetsApi:
+    """
+    I need a pygsheets stand-in that counts API round trips and charges each one a simulated latency.
+    shift_cost adds time per existing row an insert pushes down, like the server reflowing the ledger.
+    quota, when given, is the reads and the writes allowed per quota_window before the API answers 429.
+    """
+
+    def __init__(self, latency, shift_cost=0, quota=None, quota_window=60):
+        self.latency = latency
+        self.shift_cost = shift_cost
+        self.quota = quota
+        self.quota_window = quota_window
+        self.recent = {"read": [], "write": []}
+        self.rejected = 0
+        self.calls = {}
+        self.cells = {}
+        self.rows = [[""] * 5 for _ in range(4)]
+        self.grid_rows = 1000
+        self.down = False
+        self.categories = ["Groceries", "Fast Food", "Shopping", "Coffee Shops", "Gas", "Uncategorized"]
+
+    def call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        time.sleep(self.latency)
+        if self.down:
+            raise RuntimeError("simulated Sheets API outage")
+        kind = "read" if name in SHEETS_READ_CALLS else "write" if name in SHEETS_WRITE_CALLS else None
+        if self.quota and kind:
+            now = time.monotonic()
+            recent = self.recent[kind] = [t for t in self.recent[kind] if now - t < self.quota_window]
+            if len(recent) >= self.quota:
+                self.rejected += 1
+                raise SheetsQuotaError()
+            recent.append(now)
+
+    def authorize(self, service_account_file=None, **kwargs):
+        self.call("authorize")
+        api = self
+
+        class Worksheet:
+            def __init__(self, title):
+                self.title = title
+
+            def get_value(self, cell):
+                api.call("get_value")
+                return api.cells.get((self.title, cell), "")
+
+            def update_value(self, cell, value):
+                api.call("update_value")
+                api.cells[(self.title, cell)] = value
+
+            def get_values(self, start, end):
+                api.call("get_values")
+                if self.title == "AppState":
+                    return [
+                        [api.cells.get((self.title, f"{col}{row}"), "") for col in "AB"]
+                        for row in range(int(start[1:]), int(end[1:]) + 1)
+                    ]
+                if start == "B28":
+                    return [[category] for category in api.categories]
+                (col_a, row_a), (col_b, row_b) = (
+                    (ord(cell[0]) - ord("A"), int(cell[1:])) for cell in (start, end)
+                )
+                rows = [row[col_a:col_b + 1] for row in api.rows[row_a - 1:row_b]]
+                return [row for row in rows if any(row)]
+
+            @property
+            def rows(self):
+                return api.grid_rows
+
+            def add_rows(self, number):
+                api.call("add_rows")
+                api.grid_rows += number
+
+            def get_col(self, col, include_tailing_empty=True):
+                api.call("get_col")
+                return [row[col - 1] for row in api.rows]
+
+            def insert_rows(self, row, number=1, values=None):
+                api.call("insert_rows")
+                time.sleep(api.shift_cost * max(0, len(api.rows) - row))
+                api.rows[row:row] = [[""] * 5 for _ in range(number)]
+                api.grid_rows += number
+
+            def update_values_batch(self, ranges, values):
+                api.call("update_values_batch")
+                for cell, value in zip(ranges, values):
+                    api.cells[(self.title, cell)] = value[0][0]
+
+            def update_values(self, start, values):
+                api.call("update_values")
+                first = start[0] - 1
+                api.rows.extend([""] * 5 for _ in range(first + len(values) - len(api.rows)))
+                api.rows[first:first + len(values)] = [[""] + list(row) for row in values]
+
+        class Spreadsheet:
+            def worksheet(self, by, title):
+                api.call("worksheet")
+                return Worksheet(title)
+
+        class Client:
+            def open(self, name):
+                api.call("open")
+                return Spreadsheet()
+
+        return Client()
+
+def lift_sheets_quota(budget_app):
+    """I need the scheduler's quota out of the way for benchmarks that count requests rather than pace them."""
+    budget_app.CONFIG["sheets_read_quota"] = budget_app.CONFIG["sheets_write_quota"] = 10 ** 6
+    budget_app.SHEETS_SCHEDULER = budget_app.SheetsScheduler()
+
+def use_fake_sheets(budget_app, latency, **options):
+    """
+    I need the app's Sheets side pointed at a fresh FakeSheetsApi (options go to it), with a new session,
+    AppState mirror and category cache so nothing carries over from an earlier API. Returns the API.
+    """
+    api = FakeSheetsApi(latency, **options)
+    budget_app.pygsheets.authorize = api.authorize
+    budget_app.SHEETS_SESSION = budget_app.SheetsSession()
+    budget_app.APPSTATE = budget_app.AppStateStore()
+    budget_app.CATEGORY_LIST = budget_app.CategoryListCache()
+    return api
+
+def use_scratch_state(budget_app, learn=True):
+    """
+    I need the merchant memo, parse cache and checkpoint journal in scratch files, never the working
+    directory's. With learn=False the memo's sheet re-read counts as done, so it stays out of timings.
+    """
+    budget_app.MERCHANT_MEMO = budget_app.MerchantMemo(scratch_path("merchant_memo.json"), 10000)
+    if not learn:
+        budget_app.MERCHANT_MEMO.learned_at = time.monotonic()
+    budget_app.PARSE_CACHE = budget_app.ParseCache(scratch_path("parse_cache.json"), 5000)
+    budget_app.CHECKPOINTS = budget_app.CheckpointJournal(scratch_path("checkpoint.json"))
+
+def bench_sheets_session(count=50, latency=0.02, threads=2):
+    """I need the AppState helpers' API round trips with a shared session against the old per-call authorize."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+
+    def legacy_save_last_uid(uid):
+        gc = budget_app.pygsheets.authorize(service_account_file=None)
+        sh = gc.open(budget_app.CONFIG["sheet_name"])
+        wks = budget_app.get_appstate_sheet(gc, sh)
+        wks.update_value(budget_app.APPSTATE_UID_CELL, str(uid))
+
+    def legacy_load_last_up():
+        gc = budget_app.pygsheets.authorize(service_account_file=None)
+        sh = gc.open(budget_app.CONFIG["sheet_name"])
+        return budget_app.get_appstate_sheet(gc, sh).get_value(budget_app.APPSTATE_LAST_UP_CELL)
+
+    for label, save, load in (("per-call authorize", legacy_save_last_uid, legacy_load_last_up),
+                              ("shared session", budget_app.write_sheet_last_uid, budget_app.load_last_up)):
+        api = use_fake_sheets(budget_app, latency)
+
+        def worker(offset):
+            for uid in range(offset, count * threads, threads):
+                save(uid)
+                load()
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        log(
+            f"{label:>18}: {count * threads} UID saves + status reads from {threads} threads in {elapsed:.2f}s  "
+            f"round trips={sum(api.calls.values())} {api.calls}",
+            Fore.CYAN + Style.BRIGHT
+        )
+
+def bench_appstate(heartbeats=20, latency=0.02):
+    """I need the Sheets requests a heartbeat's AppState bookkeeping costs, cell by cell against the mirrored store."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+    api = use_fake_sheets(budget_app, latency)
+
+    def legacy_heartbeat():
+        # save_last_up + load_last_up + load_last_down as they were: one cell request each
+        with budget_app.SHEETS_SESSION as sheets:
+            wks = sheets.appstate()
+            wks.update_value(budget_app.APPSTATE_LAST_UP_CELL, time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime()))
+            return wks.get_value(budget_app.APPSTATE_LAST_UP_CELL), wks.get_value(budget_app.APPSTATE_LAST_DOWN_CELL)
+
+    def store_heartbeat():
+        budget_app.save_last_up()
+        return budget_app.load_last_up(), budget_app.load_last_down()
+
+    for label, heartbeat in (("cell by cell", legacy_heartbeat), ("mirrored store", store_heartbeat)):
+        budget_app.APPSTATE = budget_app.AppStateStore()
+        api.calls.clear()
+        started = time.perf_counter()
+        for _ in range(heartbeats):
+            last_up, _ = heartbeat()
+            time.sleep(1.0)
+        elapsed = time.perf_counter() - started - heartbeats
+        requests = sum(api.calls.values())
+        log(
+            f"{label:>14}: {heartbeats} heartbeats, {requests} requests ({requests / heartbeats:.2f} per heartbeat), "
+            f"{elapsed * 1000 / heartbeats:.0f} ms each  last up={last_up!r}  {api.calls}",
+            Fore.CYAN + Style.BRIGHT
+        )
+    # Writes that queue up behind one in flight are folded into a single batch update
+    api.calls.clear()
+    budget_app.save_last_down()
+    workers = [
+        threading.Thread(target=budget_app.save_last_up),
+        threading.Thread(target=budget_app.write_sheet_last_uid, args=(4242,)),
+        threading.Thread(target=budget_app.save_uidvalidity, args=(7,)),
+    ]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    log(
+        f"4 AppState writes (3 concurrent): {api.calls}  A1={api.cells.get(('AppState', 'A1'))!r} "
+        f"A2={api.cells.get(('AppState', 'A2'))!r}  store={budget_app.APPSTATE.stats()}",
+        Fore.CYAN + Style.BRIGHT
+    )
+
+def bench_batch_writes(count=20, latency=0.02):
+    """I need the Sheets API requests a 20-alert cycle costs, written row by row against one batch."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+    server = start_stand_in(budget_app)
+    budget_app.CONFIG["imap_fetch_mode"] = "rfc822"
+    api = use_fake_sheets(budget_app, latency)
+    use_scratch_state(budget_app)
+
+    def legacy_deliver(uid, txn, source=None):
+        # insert_transaction as it was: one row insert and four cell writes, then a checkpoint per email
+        if txn:
+            with budget_app.SHEETS_SESSION as sheets:
+                wks = sheets.worksheet(budget_app.CONFIG["transactions_tab"])
+                allowed = budget_app.get_allowed_categories(sheets.worksheet(budget_app.CONFIG["summary_tab"]))
+                txn["category"] = budget_app.classify_category(txn["desc"], allowed)
+                wks.insert_rows(4, number=1, values=None)
+                for col, field in enumerate(("date", "amount", "desc", "category"), start=2):
+                    wks.update_value((5, col), txn[field])
+        budget_app.write_sheet_last_uid(uid)
+
+    for label, deliver in (("per-row writes", legacy_deliver), ("batched writes", None)):
+        for i in range(count):
+            server.append(make_alert(f"{label.upper()} MERCHANT {i}"))
+        budget_app.SHEETS_SESSION = budget_app.SheetsSession()
+        imap = budget_app.connect_imap()
+        last_uid = budget_app.load_last_uid()
+        api.calls.clear()
+        started = time.perf_counter()
+        processed, _ = budget_app.process_new_emails(imap, last_uid=last_uid, deliver=deliver)
+        elapsed = time.perf_counter() - started
+        imap.logout()
+        requests = sum(api.calls.values())
+        log(
+            f"{label:>14}: {processed} transactions in {elapsed:.2f}s  {requests} API requests "
+            f"({requests / processed:.2f} per transaction)  {api.calls}",
+            Fore.CYAN + Style.BRIGHT
+        )
+    newest = [row[3] for row in api.rows[4:7]]
+    log(f"Top rows after both cycles (newest first): {newest}", Fore.CYAN + Style.BRIGHT)
+    server.shutdown()
+
+def bench_append_ledger(sizes=(1000, 10000, 50000), cycles=5, per_cycle=5, latency=0.01, shift_cost=2e-6):
+    """I need per-cycle write latency as the ledger grows, inserting at row 5 against appending."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+    use_scratch_state(budget_app, learn=False)
+    for layout in ("insert", "append"):
+        budget_app.CONFIG["ledger_layout"] = layout
+        for size in sizes:
+            api = use_fake_sheets(budget_app, latency, shift_cost=shift_cost)
+            api.rows += [["", "2024-01-01", "1.00", f"HISTORY {i}", "Shopping"] for i in range(size)]
+            api.grid_rows = len(api.rows)
+            budget_app.LEDGER = budget_app.AppendLedger(scratch_path("ledger_state.json"))
+            budget_app.insert_transactions([{"date": "2025-01-01", "amount": "1.00", "desc": "WARMUP"}])
+            timings = []
+            for cycle in range(cycles):
+                txns = [
+                    {"date": "2025-01-02", "amount": "2.00", "desc": f"CYCLE {cycle} MERCHANT {i}"}
+                    for i in range(per_cycle)
+                ]
+                started = time.perf_counter()
+                budget_app.insert_transactions(txns)
+                timings.append((time.perf_counter() - started) * 1000)
+            newest = api.rows[4][3] if layout == "insert" else api.rows[-1][3]
+            log(
+                f"{layout:>6} layout, {size:>6} rows: {statistics.median(timings):.0f} ms per {per_cycle}-transaction cycle  "
+                f"newest={newest!r}",
+                Fore.CYAN + Style.BRIGHT
+            )
+
+def bench_checkpoint(count=200, batch_rows=50, latency=0.005):
+    """I need a 200-email backlog to cost one AppState write, and a crash mid-batch to lose and duplicate nothing."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+    server = start_stand_in(budget_app)
+    budget_app.CONFIG["imap_fetch_mode"] = "rfc822"
+    budget_app.SHEET_BATCH_MAX_ROWS = batch_rows
+    api = use_fake_sheets(budget_app, latency)
+    use_scratch_state(budget_app)
+    path = budget_app.CHECKPOINTS.path
+    for i in range(count):
+        server.append(make_alert(f"BACKLOG MERCHANT {i}") if i % 2 else make_newsletter(i))
+
+    imap = budget_app.connect_imap()
+    budget_app.check_inbox_and_process()
+    backlog = [row[3] for row in api.rows if row[3].startswith("BACKLOG")]
+    require(len(backlog) == len(set(backlog)) == count // 2, f"backlog wrote {len(backlog)} rows, {len(set(backlog))} distinct")
+    log(
+        f"{count}-email backlog: AppState writes (last UID + first UIDVALIDITY)={api.calls.get('update_values_batch', 0)}  "
+        f"journal={budget_app.CHECKPOINTS.stats()}",
+        Fore.CYAN + Style.BRIGHT
+    )
+
+    insert = budget_app.insert_transactions
+    for crash_after_write in (False, True):
+        for i in range(3):
+            server.append(make_alert(f"CRASH {crash_after_write} MERCHANT {i}"))
+
+        def crashing_insert(txns):
+            if crash_after_write:
+                insert(txns)
+            raise SystemExit("simulated crash")
+
+        budget_app.insert_transactions = crashing_insert
+        try:
+            budget_app.process_new_emails(imap)
+        except SystemExit:
+            pass
+        budget_app.insert_transactions = insert
+        # A fresh process: only the journal file and the sheet survive
+        budget_app.CHECKPOINTS = budget_app.CheckpointJournal(path)
+        budget_app.check_inbox_and_process()
+        descs = [row[3] for row in api.rows if row[3].startswith(f"CRASH {crash_after_write}")]
+        require(
+            sorted(descs) == [f"CRASH {crash_after_write} MERCHANT {i}" for i in range(3)],
+            f"crash {'after' if crash_after_write else 'before'} the sheet write left rows {sorted(descs)}"
+        )
+        log(
+            f"crash {'after' if crash_after_write else 'before'} the sheet write: rows={sorted(descs)}  "
+            f"journal={budget_app.CHECKPOINTS.stats()}",
+            Fore.CYAN + Style.BRIGHT
+        )
+    imap.logout()
+    budget_app.IMAP_SESSION.close()
+    server.shutdown()
+
+def bench_category_cache(count=100, latency=0.01):
+    """I need the category reads 100 one-transaction cycles cost, with and without the TTL cache."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+    use_scratch_state(budget_app, learn=False)
+    for label, ttl in (("no cache", 0), ("10 min TTL", 600)):
+        api = use_fake_sheets(budget_app, latency)
+        budget_app.CONFIG["category_cache_ttl"] = ttl
+        started = time.perf_counter()
+        for i in range(count):
+            if i == count // 2:
+                api.categories = api.categories + ["Travel"]
+            budget_app.insert_transactions([{"date": "2025-01-02", "amount": "2.00", "desc": f"TRAVEL AGENCY {i}"}])
+        elapsed = time.perf_counter() - started
+        log(
+            f"{label:>10}: {count} cycles in {elapsed:.2f}s  category range reads={api.calls['get_values']}  "
+            f"cache={budget_app.CATEGORY_LIST.stats()}",
+            Fore.CYAN + Style.BRIGHT
+        )
+
+def bench_local_ledger(count=100, latency=0.05):
+    """I need ingest time with the local ledger against writing straight to a slow sheet, and a sheet outage it rides out."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+    server = start_stand_in(budget_app)
+    budget_app.CONFIG["imap_fetch_mode"] = "rfc822"
+    api = use_fake_sheets(budget_app, latency)
+    use_scratch_state(budget_app)
+    budget_app.SHEET_BATCH_MAX_ROWS = 10
+    budget_app.LEDGER_SYNC_RETRY_BASE = 0.1
+    imap = budget_app.connect_imap()
+
+    for label in ("sheet only", "local ledger"):
+        if label == "local ledger":
+            budget_app.LOCAL_LEDGER = budget_app.LocalLedger(scratch_path("ledger.db"))
+            budget_app.LEDGER_SYNC = budget_app.LedgerSyncWorker(budget_app.LOCAL_LEDGER)
+            budget_app.APP_RUNNING = True
+            threading.Thread(target=budget_app.LEDGER_SYNC.run, daemon=True).start()
+        for i in range(count):
+            server.append(make_alert(f"{label.upper()} MERCHANT {i}"))
+        started = time.perf_counter()
+        processed, _ = budget_app.process_new_emails(imap)
+        ingest = time.perf_counter() - started
+        while budget_app.LEDGER_SYNC and budget_app.LEDGER_SYNC.stats()["pending"] + budget_app.LEDGER_SYNC.stats()["sending"]:
+            time.sleep(0.01)
+        in_sheet = time.perf_counter() - started
+        rows = [row[3] for row in api.rows if row[3].startswith(label.upper())]
+        require(len(rows) == len(set(rows)) == count, f"{label}: {len(rows)} rows in the sheet, {len(set(rows))} distinct")
+        log(
+            f"{label:>12}: ingested {processed} transactions in {ingest:.2f}s ({processed / ingest:.0f} txn/s), "
+            f"all in the sheet after {in_sheet:.2f}s",
+            Fore.CYAN + Style.BRIGHT
+        )
+
+    # Sheets goes down: ingest keeps committing locally, the worker backs off and catches up afterwards
+    api.down = True
+    for i in range(count):
+        server.append(make_alert(f"OUTAGE MERCHANT {i}"))
+    started = time.perf_counter()
+    processed, _ = budget_app.process_new_emails(imap)
+    ingest = time.perf_counter() - started
+    during = budget_app.LEDGER_SYNC.stats()
+    time.sleep(0.5)
+    api.down = False
+    budget_app.LEDGER_SYNC.wake.set()
+    while budget_app.LEDGER_SYNC.stats()["pending"] + budget_app.LEDGER_SYNC.stats()["sending"]:
+        time.sleep(0.01)
+    outage_rows = [row[3] for row in api.rows if row[3].startswith("OUTAGE")]
+    require(
+        len(outage_rows) == len(set(outage_rows)) == count,
+        f"outage: {len(outage_rows)} rows in the sheet after recovery, {len(set(outage_rows))} distinct"
+    )
+    log(
+        f"outage: ingested {processed} in {ingest:.2f}s while the sheet was down (pending={during['pending']}); "
+        f"after recovery {len(outage_rows)} rows in the sheet, {len(set(outage_rows))} distinct",
+        Fore.CYAN + Style.BRIGHT
+    )
+    totals = budget_app.LOCAL_LEDGER.category_totals()
+    log(f"Local report: {[(category, n) for category, n, _ in totals]}", Fore.CYAN + Style.BRIGHT)
+    budget_app.APP_RUNNING = False
+    imap.logout()
+    server.shutdown()
+
+def bench_scheduler(batches=20, per_batch=5, quota=20, window=2.0, latency=0.005, heartbeat_threads=3):
+    """
+    I need transaction batches written while heartbeat threads hammer the AppState cells, against a
+    quota the API enforces: with the scheduler's buckets off (retry only) and sized to the quota.
+    """
+    import budget_app
+    budget_app.SHEETS_QUOTA_WINDOW = window
+    budget_app.SHEETS_RETRY_BASE = 0.1
+    use_scratch_state(budget_app, learn=False)
+    for label, bucket in (("retry only", 100000), ("token buckets", quota)):
+        api = use_fake_sheets(budget_app, latency, quota=quota, quota_window=window)
+        budget_app.CONFIG["sheets_read_quota"] = bucket
+        budget_app.CONFIG["sheets_write_quota"] = bucket
+        budget_app.SHEETS_SCHEDULER = budget_app.SheetsScheduler()
+        running = True
+
+        beats = itertools.count()
+
+        def heartbeat():
+            # A fresh value every time, so the AppState mirror cannot skip the write
+            while running:
+                budget_app.APPSTATE.set({budget_app.APPSTATE_LAST_UP_CELL: next(beats)})
+                budget_app.load_last_down()
+
+        threads = [threading.Thread(target=heartbeat) for _ in range(heartbeat_threads)]
+        for thread in threads:
+            thread.start()
+        latencies = []
+        started = time.perf_counter()
+        for batch in range(batches):
+            txns = [{"date": "2025-01-02", "amount": "2.00", "desc": f"BATCH {batch} MERCHANT {i}"} for i in range(per_batch)]
+            begun = time.perf_counter()
+            budget_app.insert_transactions(txns)
+            latencies.append((time.perf_counter() - begun) * 1000)
+        elapsed = time.perf_counter() - started
+        running = False
+        for thread in threads:
+            thread.join()
+        written = sum(1 for row in api.rows if row[3].startswith("BATCH"))
+        report_latencies(f"{label}: batch write", latencies)
+        log(
+            f"{label:>13}: {written} rows in {elapsed:.2f}s  429s={api.rejected}  "
+            f"heartbeat writes={api.calls.get('update_values_batch', 0)}  scheduler={budget_app.SHEETS_SCHEDULER.stats()}",
+            Fore.CYAN + Style.BRIGHT
+        )
+
+def bench_storage(count=300, latency=0.02):
+    """I need full-pipeline ingest throughput (IMAP stand-in to stored rows) on each storage backend."""
+    import budget_app
+    lift_sheets_quota(budget_app)
+    server = start_stand_in(budget_app)
+    budget_app.CONFIG["imap_fetch_mode"] = "rfc822"
+    budget_app.SHEET_BATCH_MAX_ROWS = 50
+    use_scratch_state(budget_app)
+    api = use_fake_sheets(budget_app, latency)
+    folder = scratch_dir()
+    backends = (
+        ("sheets (fake API)", budget_app.SheetsBackend()),
+        ("memory", budget_app.MemoryBackend(api.categories)),
+        ("csv", budget_app.CsvBackend(folder, api.categories)),
+    )
+    imap = budget_app.connect_imap()
+    for label, backend in backends:
+        budget_app.STORAGE = backend
+        budget_app.APPSTATE = budget_app.AppStateStore()
+        budget_app.CATEGORY_LIST = budget_app.CategoryListCache()
+        for i in range(count):
+            server.append(make_alert(f"{backend.name.upper()} GROCERY OUTLET {i}"))
+        started = time.perf_counter()
+        processed, _ = budget_app.process_new_emails(imap)
+        elapsed = time.perf_counter() - started
+        # What shutdown does: copy the newest checkpointed UID into the store's AppState
+        budget_app.CHECKPOINTS.flush_all()
+        stored = backend.recent_transactions(count)
+        log(
+            f"{label:>17}: {processed} transactions in {elapsed:.2f}s ({processed / elapsed:,.0f} txn/s)  "
+            f"newest={stored[0] if stored else None}  {len(stored)} stored",
+            Fore.CYAN + Style.BRIGHT
+        )
+    # A restarted process picks the csv ledger and its app state back up
+    reopened = budget_app.CsvBackend(folder, api.categories)
+    log(
+        f"csv reopened: {len(reopened.rows)} rows, AppState={reopened.read_state(2)}",
+        Fore.CYAN + Style.BRIGHT
+    )
+    imap.logout()
+    server.shutdown()
+
+BENCHMARKS = {
+    "idle-latency": bench_idle_latency,
+    "backlog": bench_backlog,
+    "prefilter": bench_prefilter,
+    "session": bench_session,
+    "sources": bench_sources,
+    "backfill": bench_backfill,
+    "parser": bench_parser,
+    "templates": bench_templates,
+    "html": bench_html,
+    "parse-cache": bench_parse_cache,
+    "classify": bench_classify,
+    "rules-reload": bench_rules_reload,
+    "memo": bench_memo,
+    "normalize": bench_normalize,
+    "sheets-session": bench_sheets_session,
+    "appstate": bench_appstate,
+    "batch-writes": bench_batch_writes,
+    "append-ledger": bench_append_ledger,
+    "checkpoint": bench_checkpoint,
+    "category-cache": bench_category_cache,
+    "local-ledger": bench_local_ledger,
+    "scheduler": bench_scheduler,
+    "storage": bench_storage,
+}
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else None
+    if name not in BENCHMARKS:
+        log(f"Usage: python budget_bench.py <{'|'.join(BENCHMARKS)}>", Fore.YELLOW)
+        sys.exit(1)
+    log(f"Running benchmark: {name}", Fore.GREEN)
+    global SCRATCH_ROOT
+    SCRATCH_ROOT = tempfile.mkdtemp(prefix="budget_bench_")
+    try:
+        BENCHMARKS[name]()
+    finally:
+        shutil.rmtree(SCRATCH_ROOT, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# budget_app reads config.json (and writes its logs and caches) in the working directory at import time,
+# so the tests run from a scratch folder with a minimal config.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+WORKDIR = tempfile.mkdtemp(prefix="budget_app_tests_")
+with open(os.path.join(WORKDIR, "config.json"), "w") as f:
+    json.dump({
+        "imap_server": "localhost",
+        "gmail_user": "tests@example.com",
+        "gmail_app_password": "unused",
+        "my_alert_email": "tests@example.com",
+        "google_service_account_json": "unused.json",
+        "sheet_name": "Budget Tests",
+        "transactions_tab": "Transactions",
+        "summary_tab": "Summary",
+    }, f)
+os.chdir(WORKDIR)
+
+@pytest.fixture
+def app():
+    import budget_app
+    return budget_app
+
+@pytest.fixture
+def memory_storage(app, monkeypatch, tmp_path):
+    """The app wired to an in-memory store, with its journal and memo under tmp_path."""
+    storage = app.MemoryBackend()
+    monkeypatch.setattr(app, "STORAGE", storage)
+    monkeypatch.setattr(app, "APPSTATE", app.AppStateStore())
+    monkeypatch.setattr(app, "CATEGORY_LIST", app.CategoryListCache())
+    monkeypatch.setattr(app, "CHECKPOINTS", app.CheckpointJournal(str(tmp_path / "checkpoint.json")))
+    monkeypatch.setattr(app, "MERCHANT_MEMO", app.MerchantMemo(str(tmp_path / "merchant_memo.json"), 1000))
+    monkeypatch.setattr(app, "LOCAL_LEDGER", None)
+    return storage
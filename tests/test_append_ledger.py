@@ -0,0 +1,73 @@
+READS = {"get_col", "get_values"}
+WRITES = {"add_rows", "insert_rows", "update_values"}
+
+class FakeWorksheet:
+    def __init__(self, requests):
+        self.requests = requests
+        self.rows = 10
+
+    def get_col(self, col, include_tailing_empty=True):
+        self.requests.append("get_col")
+        return ["", "", "", "", "2025-01-01", "2025-01-02"]
+
+    def get_values(self, start, end):
+        self.requests.append("get_values")
+        return []
+
+    def add_rows(self, number):
+        self.requests.append("add_rows")
+        self.rows += number
+
+    def insert_rows(self, row, number=1, values=None):
+        assert values is None
+        self.requests.append("insert_rows")
+
+    def update_values(self, start, values):
+        self.requests.append("update_values")
+
+class ChargeCheckingScheduler:
+    """Runs each call at once and checks it was charged the reads and writes it actually sent."""
+
+    def __init__(self):
+        self.requests = []
+        self.sheets = type("Sheets", (), {})()
+        wks = FakeWorksheet(self.requests)
+        self.sheets.worksheet = lambda title: wks
+        self.charged = []
+        self.idempotent = []
+
+    def call(self, fn, priority=0, reads=0, writes=0, key=None, idempotent=True):
+        before = len(self.requests)
+        result = fn(self.sheets)
+        sent = self.requests[before:]
+        assert (reads, writes) == (sum(r in READS for r in sent), sum(r in WRITES for r in sent)), sent
+        self.charged.append((reads, writes))
+        self.idempotent.append(idempotent)
+        return result
+
+def test_append_charges_each_request(app, monkeypatch, tmp_path):
+    scheduler = ChargeCheckingScheduler()
+    monkeypatch.setattr(app, "SHEETS_SCHEDULER", scheduler)
+    monkeypatch.setattr(app, "LEDGER", app.AppendLedger(str(tmp_path / "ledger_state.json")))
+    monkeypatch.setitem(app.CONFIG, "ledger_layout", "append")
+    backend = app.SheetsBackend()
+
+    rows = [["2025-01-03", "1.00", f"MERCHANT {i}", "Shopping", f"default/1/{i}"] for i in range(8)]
+    assert backend.append_transactions(rows) == 7
+    # Scan, grid check, grow, write
+    assert scheduler.charged == [(1, 0), (0, 0), (0, 1), (0, 1)]
+    assert app.LEDGER.next_row == 15
+    backend.recent_transactions(5)
+    assert scheduler.charged[-1] == (1, 0)
+
+def test_insert_layout_writes_values_in_their_own_call(app, monkeypatch):
+    scheduler = ChargeCheckingScheduler()
+    monkeypatch.setattr(app, "SHEETS_SCHEDULER", scheduler)
+    monkeypatch.setitem(app.CONFIG, "ledger_layout", "insert")
+
+    rows = [["2025-01-03", "1.00", f"MERCHANT {i}", "Shopping", f"default/1/{i}"] for i in range(3)]
+    assert app.SheetsBackend().append_transactions(rows) == app.LEDGER_FIRST_ROW
+    # The blank rows once, then a value write that can be retried alone
+    assert scheduler.requests == ["insert_rows", "update_values"]
+    assert scheduler.charged == [(0, 1), (0, 1)]
+    assert scheduler.idempotent == [False, True]
@@ -0,0 +1,72 @@
+import random
+import re
+
+import pytest
+
+CATEGORIES = ("Groceries", "Fast Food", "Shopping", "Coffee Shops", "Gas", "Movies & DVDs", "Uncategorized")
+
+def regex_match(rules, allowed_categories, desc_low):
+    """The rule-by-rule re search the automaton replaced."""
+    for pattern, category in rules:
+        if category in allowed_categories and re.search(pattern, desc_low):
+            return category
+    return None
+
+@pytest.mark.parametrize("pattern, expected", [
+    ("safeway|save mart", ["safeway", "save mart"]),
+    ("chick[- ]fil[- ]a", ["chick-fil-a", "chick-fil a", "chick fil-a", "chick fil a"]),
+    ("wal[- ]?mart", ["wal-mart", "wal mart", "walmart"]),
+    (r"7\-eleven|a\.b", ["7-eleven", "a.b"]),
+    ("shell", ["shell"]),
+])
+def test_expand_keywords(app, pattern, expected):
+    assert sorted(app.expand_keywords(pattern)) == sorted(expected)
+
+@pytest.mark.parametrize("pattern", [
+    "star.ucks", "gas+", "(arco)", "^shell", r"\d+ fuel", "[a-z]mart", "[^x]mart", "a{2}",
+])
+def test_expand_keywords_leaves_other_patterns_to_re(app, pattern):
+    assert app.expand_keywords(pattern) is None
+
+def test_expand_keywords_gives_up_past_the_limit(app):
+    assert app.expand_keywords("[ab]" * 7) is None
+    assert len(app.expand_keywords("[ab]" * 6)) == 64
+
+def test_automaton_returns_the_lowest_rule_index(app):
+    automaton = app.KeywordAutomaton()
+    for keyword, index in (("he", 3), ("she", 1), ("hers", 0), ("his", 2)):
+        automaton.add(keyword, index)
+    automaton.build()
+    assert automaton.search("ushe") == 1
+    assert automaton.search("ahishe") == 1
+    assert automaton.search("ushers") == 0
+    assert automaton.search("xyz") is None
+
+def test_matcher_agrees_with_regex_on_the_built_in_rules(app):
+    matcher = app.CategoryMatcher(app.CATEGORY_RULES, CATEGORIES)
+    descs = [
+        "safeway #0123", "chick-fil-a 0042", "wal mart supercenter", "walmart.com", "shell oil 5744",
+        "amazon mktplace", "target t-1234", "starbucks store 9", "cinemark theatre", "trader joe's",
+        "arco ampm", "costco gas #12", "burger king", "", "gasoline alley coffee",
+    ]
+    for desc in descs:
+        assert matcher.match(desc) == regex_match(app.CATEGORY_RULES, CATEGORIES, desc), desc
+
+def test_matcher_honours_rule_priority_across_automaton_and_re(app):
+    rules = [(r"\d{4} fuel", "Gas"), ("fuel", "Shopping"), ("pump.*station", "Gas"), ("station", "Coffee Shops")]
+    matcher = app.CategoryMatcher(rules, CATEGORIES)
+    for desc in ("1234 fuel stop", "fuel stop", "pump 4 station", "station cafe", "pumpkin"):
+        assert matcher.match(desc) == regex_match(rules, CATEGORIES, desc), desc
+
+def test_matcher_skips_rules_for_categories_not_allowed(app):
+    matcher = app.CategoryMatcher(app.CATEGORY_RULES, ("Shopping", "Uncategorized"))
+    assert matcher.match("costco amazon") == "Shopping"
+    assert matcher.match("safeway") is None
+
+def test_matcher_agrees_with_regex_on_random_descriptions(app):
+    rng = random.Random(13)
+    words = ["safe", "way", "save", "mart", "wal", "-", " ", "shell", "gas", "star", "bucks", "arco", "tar", "get", "x"]
+    matcher = app.CategoryMatcher(app.CATEGORY_RULES, CATEGORIES)
+    for _ in range(2000):
+        desc = "".join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+        assert matcher.match(desc) == regex_match(app.CATEGORY_RULES, CATEGORIES, desc), desc
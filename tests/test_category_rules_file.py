@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+CATEGORIES = ("Groceries", "Gas", "Shopping", "Uncategorized")
+
+@pytest.fixture
+def rules_file(app, monkeypatch, tmp_path):
+    path = tmp_path / "rules.json"
+    monkeypatch.setitem(app.CONFIG, "category_rules_file", str(path))
+    monkeypatch.setattr(app, "CATEGORY_RULES_CHECK_INTERVAL", 0)
+    return path
+
+def write_rules(path, rules, mtime):
+    path.write_text(json.dumps(rules))
+    os.utime(path, ns=(mtime, mtime))
+
+def match(store, desc):
+    return store.match(store.matcher(CATEGORIES), desc)
+
+def test_load_orders_rules_by_priority_then_file_order(app, tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([
+        {"pattern": "a", "category": "Gas"},
+        {"pattern": "b", "category": "Shopping", "priority": 5},
+        {"pattern": "c", "category": "Groceries"},
+    ]))
+    assert app.load_category_rules_file(str(path)) == [("b", "Shopping"), ("a", "Gas"), ("c", "Groceries")]
+
+@pytest.mark.parametrize("content", [
+    '{"pattern": "a"}', '[{"pattern": "a"}]', '[{"pattern": "(", "category": "Gas"}]',
+    '[{"pattern": 1, "category": "Gas"}]', '[{"pattern": "a", "category": "Gas", "priority": "high"}]', "[",
+])
+def test_load_rejects_malformed_files(app, tmp_path, content):
+    path = tmp_path / "rules.json"
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        app.load_category_rules_file(str(path))
+
+def test_edited_file_is_picked_up(app, rules_file):
+    write_rules(rules_file, [{"pattern": "trader joe", "category": "Groceries"}], 1_000_000_000)
+    store = app.CategoryRuleStore()
+    assert match(store, "trader joe's #552") == "Groceries"
+    assert match(store, "safeway") is None
+
+    write_rules(rules_file, [{"pattern": "trader joe", "category": "Shopping"}], 2_000_000_000)
+    assert match(store, "trader joe's #552") == "Shopping"
+    assert store.current.source == str(rules_file)
+
+def test_bad_edit_keeps_the_previous_rules(app, rules_file):
+    write_rules(rules_file, [{"pattern": "chevron", "category": "Gas"}], 1_000_000_000)
+    store = app.CategoryRuleStore()
+    assert match(store, "chevron 0042") == "Gas"
+
+    rules_file.write_text('[{"pattern": "(", "category": "Gas"}]')
+    os.utime(rules_file, ns=(2_000_000_000, 2_000_000_000))
+    assert match(store, "chevron 0042") == "Gas"
+    assert store.failed_mtime == 2_000_000_000
+
+    os.remove(rules_file)
+    assert match(store, "chevron 0042") == "Gas"
+
+def test_reload_precompiles_matchers_in_use(app, rules_file):
+    write_rules(rules_file, [{"pattern": "arco", "category": "Gas"}], 1_000_000_000)
+    store = app.CategoryRuleStore()
+    store.matcher(CATEGORIES)
+    write_rules(rules_file, [{"pattern": "arco", "category": "Shopping"}], 2_000_000_000)
+    store.refresh()
+    assert CATEGORIES in store.current.matchers
+
+def test_unchanged_file_is_checked_at_most_once_per_interval(app, rules_file, monkeypatch):
+    write_rules(rules_file, [{"pattern": "arco", "category": "Shopping"}], 1_000_000_000)
+    store = app.CategoryRuleStore()
+    assert match(store, "arco") == "Shopping"
+    monkeypatch.setattr(app, "CATEGORY_RULES_CHECK_INTERVAL", 3600)
+    write_rules(rules_file, [{"pattern": "arco", "category": "Gas"}], 2_000_000_000)
+    assert match(store, "arco") == "Shopping"
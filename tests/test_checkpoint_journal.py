@@ -0,0 +1,41 @@
+import pytest
+
+def alert(uid, desc="STARBUCKS #1234"):
+    return uid, {"date": "2025-01-02", "amount": "4.50", "desc": desc}
+
+def restart(app, tmp_path, monkeypatch):
+    # A fresh process: only the journal file and the store survive
+    monkeypatch.setattr(app, "CHECKPOINTS", app.CheckpointJournal(str(tmp_path / "checkpoint.json")))
+
+def crash(after_write, insert):
+    def crashing_insert(txns):
+        if after_write:
+            insert(txns)
+        raise SystemExit("simulated crash")
+    return crashing_insert
+
+@pytest.mark.parametrize("after_write", [False, True])
+def test_repeat_merchant_batch_settles_correctly(app, memory_storage, tmp_path, monkeypatch, after_write):
+    app.save_uidvalidity(100)
+    app.deliver_transactions([alert(1), alert(2)])
+    assert app.load_last_uid() == 2
+
+    # The same merchant again; the run dies before or after the write lands
+    with monkeypatch.context() as m, pytest.raises(SystemExit):
+        m.setattr(app, "insert_transactions", crash(after_write, app.insert_transactions))
+        app.deliver_transactions([alert(3), alert(4)])
+    restart(app, tmp_path, monkeypatch)
+    assert app.load_last_uid() == (4 if after_write else 2)
+    assert len(memory_storage.rows) == (4 if after_write else 2)
+
+def test_landed_batch_found_behind_another_sources_rows(app, memory_storage, tmp_path, monkeypatch):
+    other = {"name": "card", "appstate_row": 4}
+    app.save_uidvalidity(100)
+    with monkeypatch.context() as m, pytest.raises(SystemExit):
+        m.setattr(app, "insert_transactions", crash(True, app.insert_transactions))
+        app.deliver_transactions([alert(7, "COSTCO")])
+    # Another source writes after the crash, before this source recovers
+    app.deliver_transactions([alert(3, "COSTCO"), alert(4, "SHELL")], other)
+    restart(app, tmp_path, monkeypatch)
+    assert app.load_last_uid() == 7
+    assert [row[4] for row in memory_storage.rows] == ["default/100/7", "card/0/3", "card/0/4"]
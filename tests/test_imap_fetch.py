@@ -0,0 +1,92 @@
+HEADERS = b"Subject: Transaction alert\r\nFrom: alerts@bank.example.com\r\nContent-Type: text/plain\r\n\r\n"
+BODY = b"$12.34 came out of your account\r\nTo: SAFEWAY 0987\r\nDate: Oct 17, 2026\r\n"
+
+class FakeImap:
+    error = Exception
+
+    def __init__(self, data):
+        self.data = data
+        self.commands = []
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        return "OK", self.data
+
+def test_compress_uid_set(app):
+    assert app.compress_uid_set([5, 6, 7, 8, 9, 12]) == "5:9,12"
+    assert app.compress_uid_set([3]) == "3"
+    assert app.compress_uid_set([1, 3, 4]) == "1,3:4"
+
+def test_parse_fetch_response_groups_messages_by_uid(app):
+    data = [
+        (b'1 (UID 41 BODY[HEADER.FIELDS (SUBJECT FROM)] {%d}' % len(HEADERS), HEADERS),
+        (b' BODY[1]<0> {%d}' % len(BODY), BODY),
+        b')',
+        # Servers may put UID after the other items and quote or NIL some values
+        (b'2 (BODY[1]<0> {3}', b'abc'),
+        b' BODY[1.MIME] NIL FLAGS (\\Seen) X-NOTE "a \\"quoted\\" value" UID 42)',
+    ]
+    fetched = app.parse_fetch_response(data)
+    assert sorted(fetched) == [41, 42]
+    assert fetched[41] == {"HEADER.FIELDS": HEADERS, "1": BODY}
+    assert fetched[42]["1"] == b"abc"
+    assert fetched[42]["1.MIME"] is None
+    assert fetched[42]["FLAGS"] == [b"\\Seen"]
+    assert fetched[42]["X-NOTE"] == b'a "quoted" value'
+
+def test_parse_fetch_response_skips_entries_without_uid(app):
+    assert app.parse_fetch_response([b'1 (FLAGS (\\Seen))', None]) == {}
+
+def test_fetch_messages_batch_uses_one_command_per_batch(app):
+    imap = FakeImap([
+        (b'1 (UID 7 BODY[HEADER.FIELDS (SUBJECT FROM)] {%d}' % len(HEADERS), HEADERS),
+        (b' BODY[1.MIME] {0}', b''),
+        (b' BODY[1]<0> {%d}' % len(BODY), BODY),
+        b')',
+    ])
+    messages = list(app.fetch_messages_batch(imap, [7, 8]))
+    assert len(imap.commands) == 1
+    assert imap.commands[0][1] == "7:8"
+    assert [uid for uid, msg in messages] == [7]
+    msg = messages[0][1]
+    assert msg["Subject"] == "Transaction alert"
+    assert app.parse_email_transaction(app.extract_body(msg))["desc"] == "SAFEWAY 0987"
+
+def structure(app, text):
+    return app.parse_fetch_response([b"1 (UID 1 BODYSTRUCTURE " + text + b")"])[1]["BODYSTRUCTURE"]
+
+def test_find_text_part_single_part(app):
+    node = structure(app, b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 512 10 NIL NIL NIL)')
+    assert app.find_text_part(node) == ("1", "text/plain", "QUOTED-PRINTABLE", "utf-8", 512)
+
+def test_find_text_part_prefers_plain_text_over_html(app):
+    node = structure(app, (
+        b'(("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "BASE64" 9000 120 NIL NIL NIL)'
+        b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 300 8 NIL NIL NIL)'
+        b'("IMAGE" "PNG" ("NAME" "logo.png") NIL NIL "BASE64" 80000 NIL NIL NIL) "RELATED" NIL NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "b1") NIL NIL NIL)'
+    ))
+    assert app.find_text_part(node) == ("2.1", "text/plain", "7BIT", None, 300)
+
+def test_find_text_part_falls_back_to_html_and_skips_attachments(app):
+    node = structure(app, (
+        b'(("APPLICATION" "PDF" ("NAME" "statement.pdf") NIL NIL "BASE64" 400000 NIL NIL NIL)'
+        b'("TEXT" "HTML" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 2048 40 NIL NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "b2") NIL NIL NIL)'
+    ))
+    assert app.find_text_part(node) == ("2", "text/html", "QUOTED-PRINTABLE", "iso-8859-1", 2048)
+
+def test_find_text_part_without_text(app):
+    node = structure(app, b'("IMAGE" "JPEG" NIL NIL NIL "BASE64" 1000 NIL NIL NIL)')
+    assert app.find_text_part(node) is None
+    assert app.find_text_part(None) is None
+
+def test_bodystructure_mode_skips_oversized_text_parts(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "imap_max_body_bytes", 1000)
+    imap = FakeImap([
+        b'1 (UID 9 BODYSTRUCTURE ("TEXT" "HTML" NIL NIL NIL "BASE64" 250000 900 NIL NIL NIL)',
+        (b' BODY[HEADER.FIELDS (SUBJECT FROM)] {%d}' % len(HEADERS), HEADERS),
+        b')',
+    ])
+    assert list(app.fetch_messages_bodystructure(imap, [9])) == [(9, None)]
+    assert len(imap.commands) == 1
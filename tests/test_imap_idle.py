@@ -0,0 +1,58 @@
+import imaplib
+import socket
+import threading
+import time
+
+class ScriptedIMAP4(imaplib.IMAP4):
+    """imaplib over one end of a socket pair, so a test can script the server's exact bytes."""
+
+    def __init__(self, sock):
+        self.test_sock = sock
+        super().__init__()
+
+    def open(self, host="", port=0, timeout=None):
+        self.host, self.port = host, port
+        self.sock = self.test_sock
+        self.file = self.sock.makefile("rb")
+
+def serve(sock, burst, received):
+    """Greets, answers CAPABILITY, then answers an IDLE with `burst` in a single send and ends it on DONE."""
+    reader = sock.makefile("rb")
+    sock.sendall(b"* OK ready\r\n")
+    line = reader.readline()
+    received.append(line)
+    sock.sendall(b"* CAPABILITY IMAP4rev1 IDLE\r\n" + line.split(b" ")[0] + b" OK CAPABILITY completed\r\n")
+    line = reader.readline()
+    if not line:
+        return
+    received.append(line)
+    sock.sendall(burst)
+    received.append(reader.readline())  # DONE
+    sock.sendall(line.split(b" ")[0] + b" OK IDLE terminated\r\n")
+
+def connect(burst=b""):
+    client, server = socket.socketpair()
+    received = []
+    thread = threading.Thread(target=serve, args=(server, burst, received), daemon=True)
+    thread.start()
+    return ScriptedIMAP4(client), thread, received
+
+def test_exists_buffered_with_the_continuation_is_seen(app):
+    imap, _, _ = connect(b"+ idling\r\n* 3 EXISTS\r\n")
+    started = time.monotonic()
+    assert app.imap_idle_wait(imap, 5) is not None
+    assert time.monotonic() - started < 1
+
+def test_exists_from_an_earlier_command_skips_the_idle(app):
+    imap, thread, received = connect()
+    imap.untagged_responses["EXISTS"] = [b"3"]
+    assert app.imap_idle_wait(imap, 5) is not None
+    assert "EXISTS" not in imap.untagged_responses
+    imap.shutdown()
+    thread.join(timeout=5)
+    assert [line.split(b" ")[1] for line in received] == [b"CAPABILITY\r\n"]
+
+def test_idle_times_out_quietly(app):
+    imap, _, received = connect(b"+ idling\r\n")
+    assert app.imap_idle_wait(imap, 0.3) is None
+    assert received[-1] == b"DONE\r\n"
@@ -0,0 +1,33 @@
+import types
+
+import pytest
+
+class FakeSession:
+    def __init__(self):
+        self.dropped = []
+
+    def get(self):
+        return types.SimpleNamespace(bytes_received=0)
+
+    def drop(self, reason):
+        self.dropped.append(reason)
+
+@pytest.fixture
+def session(app, monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(app, "IMAP_SESSION", session)
+    return session
+
+def test_sheets_network_error_keeps_the_imap_session(app, session, monkeypatch):
+    def cycle(imap):
+        raise ConnectionResetError("Sheets API connection reset")
+    monkeypatch.setattr(app, "process_new_emails", cycle)
+    assert app.check_inbox_and_process() == (0, 0)
+    assert session.dropped == []
+
+def test_imap_connection_error_drops_the_session(app, memory_storage, session, monkeypatch):
+    def search(*args):
+        raise app.imaplib.IMAP4.abort("socket error: EOF")
+    monkeypatch.setattr(app, "search_new_uids", search)
+    assert app.check_inbox_and_process() == (0, 0)
+    assert len(session.dropped) == 1
@@ -0,0 +1,35 @@
+import json
+import threading
+
+def test_concurrent_saves_keep_the_newest_entries(app, tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = app.JsonLRUCache(path, 1000)
+    errors = []
+
+    def writer(n):
+        try:
+            for i in range(50):
+                cache.put(f"{n}-{i}", i)
+                cache.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.save()
+    assert errors == []
+    with open(path) as f:
+        assert len(json.load(f)) == 400
+    assert not (tmp_path / "cache.json.tmp").exists()
+
+def test_failed_save_is_retried(app, tmp_path):
+    cache = app.JsonLRUCache(str(tmp_path / "missing" / "cache.json"), 10)
+    cache.put("key", "value")
+    cache.save()
+    (tmp_path / "missing").mkdir()
+    cache.save()
+    with open(tmp_path / "missing" / "cache.json") as f:
+        assert json.load(f) == {"key": "value"}
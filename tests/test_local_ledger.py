@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+def txn(desc):
+    return {"date": "2025-01-02", "amount": "4.50", "desc": desc, "merchant": desc, "category": "Coffee Shops"}
+
+def test_uid_reused_after_uidvalidity_reset_is_recorded(app, tmp_path):
+    ledger = app.LocalLedger(str(tmp_path / "ledger.db"))
+    assert ledger.add([(7, txn("BEFORE RESET"))], None, 100) == 1
+    # A re-fetch of the same email is still ignored
+    assert ledger.add([(7, txn("BEFORE RESET"))], None, 100) == 0
+    # After the reset the server hands UID 7 to a new email
+    assert ledger.add([(7, txn("AFTER RESET"))], None, 200) == 1
+    assert ledger.add([(7, txn("AFTER RESET"))], None, 200) == 0
+    assert [row[3] for row in ledger.claim(10)] == ["BEFORE RESET", "AFTER RESET"]
+
+def unfinished_sync(app, ledger, after_write):
+    """A sync that claimed every pending row and died before or after the sheet write."""
+    rows = ledger.claim(100)
+    if after_write:
+        app.STORAGE.append_transactions([list(row[1:]) for row in rows])
+
+def test_sync_recovery_matches_repeat_merchants_by_row_id(app, memory_storage, tmp_path):
+    ledger = app.LocalLedger(str(tmp_path / "ledger.db"))
+    worker = app.LedgerSyncWorker(ledger)
+    ledger.add([(1, txn("STARBUCKS")), (2, txn("STARBUCKS"))], None, 100)
+    worker.sync()
+    # The same merchant again; the write never landed
+    ledger.add([(3, txn("STARBUCKS")), (4, txn("STARBUCKS"))], None, 100)
+    unfinished_sync(app, ledger, after_write=False)
+    worker.sync()
+    assert [row[4] for row in memory_storage.rows] == ["default/100/1", "default/100/2", "default/100/3", "default/100/4"]
+    assert ledger.stats() == {"pending": 0, "sending": 0, "synced": 4}
+
+def test_sync_recovery_finds_landed_rows_behind_newer_ones(app, memory_storage, tmp_path):
+    ledger = app.LocalLedger(str(tmp_path / "ledger.db"))
+    worker = app.LedgerSyncWorker(ledger)
+    ledger.add([(1, txn("COSTCO"))], None, 100)
+    unfinished_sync(app, ledger, after_write=True)
+    # Another writer appends to the sheet before the worker recovers
+    memory_storage.append_transactions([["2025-01-03", "9.99", "COSTCO", "Groceries", "card/0/1"]])
+    worker.sync()
+    assert len(memory_storage.rows) == 2
+    assert ledger.stats() == {"pending": 0, "sending": 0, "synced": 1}
+
+def test_sheet_outage_is_written_exactly_once_afterwards(app, memory_storage, tmp_path, monkeypatch):
+    ledger = app.LocalLedger(str(tmp_path / "ledger.db"))
+    worker = app.LedgerSyncWorker(ledger)
+    monkeypatch.setattr(app, "SHEET_BATCH_MAX_ROWS", 4)
+    ledger.add([(uid, txn(f"OUTAGE MERCHANT {uid}")) for uid in range(1, 11)], None, 100)
+    append = memory_storage.append_transactions
+    writes = []
+
+    def flaky_append(rows):
+        # The second batch lands but its response is lost; then the sheet is down
+        writes.append(len(rows))
+        if len(writes) == 2:
+            append(rows)
+        if len(writes) >= 2:
+            raise ConnectionResetError("Sheets is down")
+        return append(rows)
+
+    with monkeypatch.context() as m:
+        m.setattr(memory_storage, "append_transactions", flaky_append)
+        for _ in range(3):
+            with pytest.raises(ConnectionResetError):
+                worker.sync()
+    worker.sync()
+    ids = [row[4] for row in memory_storage.rows]
+    assert sorted(ids) == sorted(f"default/100/{uid}" for uid in range(1, 11))
+    assert ledger.stats() == {"pending": 0, "sending": 0, "synced": 10}
+
+def test_shutdown_sync_waits_for_the_write_in_flight(app, memory_storage, tmp_path, monkeypatch):
+    ledger = app.LocalLedger(str(tmp_path / "ledger.db"))
+    worker = app.LedgerSyncWorker(ledger)
+    ledger.add([(1, txn("COSTCO")), (2, txn("SHELL"))], None, 100)
+    writing, release = threading.Event(), threading.Event()
+    append = memory_storage.append_transactions
+
+    def slow_append(rows):
+        writing.set()
+        release.wait(5)
+        return append(rows)
+
+    monkeypatch.setattr(memory_storage, "append_transactions", slow_append)
+    background = threading.Thread(target=worker.sync)
+    background.start()
+    assert writing.wait(5)
+    # The shutdown handler's pass starts while the worker's rows are still marked sending
+    shutdown = threading.Thread(target=worker.sync)
+    shutdown.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in (background, shutdown):
+        thread.join(5)
+    assert [row[4] for row in memory_storage.rows] == ["default/100/1", "default/100/2"]
+    assert ledger.stats() == {"pending": 0, "sending": 0, "synced": 2}
@@ -0,0 +1,43 @@
+CATEGORIES = ["Groceries", "Gas", "Coffee Shops", "Uncategorized"]
+
+def write(app, storage, *rows):
+    """Classifies and stores (desc, row id) rows the way the ingest path does."""
+    txns = [{"date": "2025-01-02", "amount": "9.99", "desc": desc, "row_id": row_id} for desc, row_id in rows]
+    app.classify_transactions(txns, CATEGORIES)
+    storage.append_transactions([[t["date"], t["amount"], t["desc"], t["category"], t["row_id"]] for t in txns])
+
+def add_rule(app, monkeypatch, keyword, category):
+    rules = app.CategoryRuleSet(app.CATEGORY_RULES + [(keyword, category)], "test", None)
+    monkeypatch.setattr(app.CATEGORY_RULE_STORE, "current", rules)
+
+def learn(app):
+    app.MERCHANT_MEMO.learned_at = None
+    app.learn_sheet_corrections(CATEGORIES)
+
+def test_new_rule_is_not_undone_by_learning(app, memory_storage, monkeypatch):
+    write(app, memory_storage, ("TRADER JOE'S #552", "default/1/1"))
+    assert memory_storage.rows[-1][3] == "Uncategorized"
+    add_rule(app, monkeypatch, "trader joe", "Groceries")
+    learn(app)
+    assert app.classify_category("TRADER JOE'S #553", CATEGORIES) == "Groceries"
+
+def test_hand_fix_is_learned_and_survives_a_rule_change(app, memory_storage, monkeypatch):
+    write(app, memory_storage, ("SAFEWAY #0123", "default/1/1"), ("SAFEWAY #0456", "default/1/2"))
+    memory_storage.rows[-1][3] = "Gas"
+    learn(app)
+    assert app.classify_category("SAFEWAY #0789", CATEGORIES) == "Gas"
+    add_rule(app, monkeypatch, "safeway", "Coffee Shops")
+    assert app.classify_category("SAFEWAY #0789", CATEGORIES) == "Gas"
+
+def test_undone_fix_hands_the_merchant_back_to_the_rules(app, memory_storage):
+    write(app, memory_storage, ("SAFEWAY #0123", "default/1/1"))
+    memory_storage.rows[-1][3] = "Gas"
+    learn(app)
+    memory_storage.rows[-1][3] = "Groceries"
+    learn(app)
+    assert app.classify_category("SAFEWAY #0789", CATEGORIES) == "Groceries"
+
+def test_rows_without_a_written_record_are_not_learned(app, memory_storage):
+    memory_storage.append_transactions([["2025-01-02", "9.99", "SAFEWAY #0123", "Gas", ""]])
+    learn(app)
+    assert app.classify_category("SAFEWAY #0789", CATEGORIES) == "Groceries"
@@ -0,0 +1,35 @@
+import pytest
+
+@pytest.mark.parametrize("desc, expected", [
+    ("SQ *STARBUCKS #0457 SAN JOSE CA", "starbucks"),
+    ("Starbucks Store 12", "starbucks"),
+    ("AMZN Mktp US*2K3L45", "amazon"),
+    ("AMAZON.COM*MK1AB2 SEATTLE WA", "amazon"),
+    ("WAL-MART #1234", "walmart"),
+    ("WM SUPERCENTER 5678 FRESNO CA 93722", "walmart"),
+    ("CHECKCARD 0412 CHEVRON 0042", "chevron"),
+    ("POS PURCHASE SHELL OIL 57442", "shell"),
+    ("MCDONALD'S F12345", "mcdonald's"),
+    ("Uber Eats", "uber eats"),
+    ("UBER *TRIP HELP.UBER.COM", "uber"),
+])
+def test_known_merchants_share_a_key(app, desc, expected):
+    assert app.normalize_merchant(desc) == expected
+
+def test_unknown_merchant_gets_its_cleaned_name(app):
+    assert app.normalize_merchant("TST* BLUE BOTTLE COFFEE #12 OAKLAND CA") == "blue bottle coffee"
+    assert app.normalize_merchant("Corner Deli") == "corner deli"
+
+def test_descriptor_with_nothing_left_falls_back_to_itself(app):
+    assert app.normalize_merchant("  #1234 ") == "#1234"
+
+def test_longest_alias_wins(app):
+    index = app.MerchantIndex({"uber": ["uber"], "uber eats": ["uber eats"]})
+    assert index.normalize("UBER EATS PENDING") == "uber eats"
+    assert index.normalize("UBER TRIP") == "uber"
+
+def test_config_aliases_extend_the_index(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "merchant_aliases", {"Blue Bottle": ["blue bottle coffee", "bluebottle"]})
+    index = app.load_merchant_index()
+    assert index.normalize("SQ *BLUEBOTTLE 0042") == "blue bottle"
+    assert index.normalize("ARCO AMPM #82") == "arco"
@@ -0,0 +1,13 @@
+import pytest
+
+def test_unknown_backend_exits_with_a_colored_error(app, monkeypatch, capsys):
+    monkeypatch.setitem(app.CONFIG, "storage_backend", "postgres")
+    with pytest.raises(SystemExit) as exit_info:
+        app.open_storage()
+    assert exit_info.value.code == 1
+    out = capsys.readouterr().out
+    assert "'postgres'" in out and out.startswith(app.Fore.RED)
+
+def test_memory_backend_is_opened(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "storage_backend", "memory")
+    assert isinstance(app.open_storage(), app.MemoryBackend)
@@ -0,0 +1,15 @@
+def test_to_label_inside_a_line_is_not_the_recipient(app):
+    body = "$5.00 came out of your account\nSent To: Jane Doe\nDate: Oct 2, 2026\n"
+    assert app.parse_email_transaction(body) is None
+
+def test_labels_at_line_start_are_read(app):
+    body = "$12.34 came out of your account\n*To:* SAFEWAY 0987\nDate: Oct 17, 2026\n"
+    assert app.parse_email_transaction(body) == {"amount": "12.34", "desc": "SAFEWAY 0987", "date": "Oct 17, 2026"}
+
+def test_bare_labels_take_the_next_line(app):
+    body = "$1,204.00 came out of your account\r\n*To:*\r\nSTARBUCKS #1234\r\nDate:\r\nOct 17, 2026\r\n"
+    assert app.parse_email_transaction(body) == {"amount": "1,204.00", "desc": "STARBUCKS #1234", "date": "Oct 17, 2026"}
+
+def test_merchant_label_is_the_fallback(app):
+    body = "Your card was charged for $8.50 at a merchant.\nMerchant: TACO BELL 221\nDate: 10/17/2026\n"
+    assert app.parse_email_transaction(body)["desc"] == "TACO BELL 221"
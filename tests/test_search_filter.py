@@ -0,0 +1,31 @@
+import types
+
+def imap(*capabilities):
+    return types.SimpleNamespace(capabilities=capabilities)
+
+def test_no_filter_configured(app, monkeypatch):
+    monkeypatch.delitem(app.CONFIG, "imap_filter", raising=False)
+    assert app.build_search_filter(imap()) is None
+
+def test_single_sender(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "imap_filter", {"senders": ["alerts@bank.com"]})
+    assert app.build_search_filter(imap()) == 'FROM "alerts@bank.com"'
+
+def test_alternatives_are_or_prefixed(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "imap_filter", {
+        "senders": ["alerts@bank.com", "no-reply@card.com"], "subjects": ['Your "card" alert'],
+    })
+    assert app.build_search_filter(imap()) == (
+        'OR OR FROM "alerts@bank.com" FROM "no-reply@card.com" SUBJECT "Your \\"card\\" alert"'
+    )
+
+def test_gmail_raw_needs_the_capability(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "imap_filter", {"senders": ["alerts@bank.com"], "gmail_raw": "from:chase"})
+    assert app.build_search_filter(imap("IMAP4REV1", "X-GM-EXT-1")) == 'OR FROM "alerts@bank.com" X-GM-RAW "from:chase"'
+    assert app.build_search_filter(imap("IMAP4REV1")) == 'FROM "alerts@bank.com"'
+
+def test_source_filter_overrides_the_top_level_one(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "imap_filter", {"senders": ["alerts@bank.com"]})
+    source = {"name": "card", "imap_filter": {"subjects": ["Purchase"]}}
+    assert app.build_search_filter(imap(), source) == 'SUBJECT "Purchase"'
+    assert app.build_search_filter(imap(), {"name": "other"}) == 'FROM "alerts@bank.com"'
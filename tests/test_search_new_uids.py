@@ -0,0 +1,36 @@
+import imaplib
+
+import pytest
+
+class FakeImap:
+    error = imaplib.IMAP4.error
+    capabilities = ("IMAP4REV1",)
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.searches = []
+
+    def uid(self, command, charset, *criteria):
+        self.searches.append(criteria)
+        return self.replies.pop(0)
+
+@pytest.fixture(autouse=True)
+def no_filter(app, monkeypatch):
+    monkeypatch.delitem(app.CONFIG, "imap_filter", raising=False)
+    monkeypatch.delitem(app.CONFIG, "imap_search_mode", raising=False)
+
+def test_searches_above_the_checkpoint(app):
+    imap = FakeImap(("OK", [b"40 41 42"]))
+    assert app.search_new_uids(imap, 40) == ([41, 42], None)
+    assert imap.searches == [("UID", "41:*")]
+
+def test_failed_search_is_an_error_not_an_empty_mailbox(app):
+    imap = FakeImap(("NO", [b"[UNAVAILABLE] mailbox busy"]))
+    with pytest.raises(imaplib.IMAP4.error):
+        app.search_new_uids(imap, 40)
+
+def test_failed_filtered_search_is_an_error(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "imap_filter", {"senders": ["alerts@bank.com"]})
+    imap = FakeImap(("OK", [b"50"]), ("BAD", [b"Could not parse command"]))
+    with pytest.raises(imaplib.IMAP4.error):
+        app.search_new_uids(imap, 40)
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+
+import pytest
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Resp", (), {"status": status})()
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the scheduler")
+        time.sleep(0.005)
+
+def start(target, *args, **kwargs):
+    thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+def test_priority_raise_wakes_the_new_head(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "sheets_read_quota", 10)
+    monkeypatch.setitem(app.CONFIG, "sheets_write_quota", 1000)
+    scheduler = app.SheetsScheduler()
+    scheduler.reads.drain()
+    results = {}
+
+    def run(name, fn, priority, **kwargs):
+        results[name] = scheduler.call(fn, priority, **kwargs)
+
+    # A read the empty read bucket holds at the head for several seconds
+    reader = start(run, "read", lambda sheets: "R", app.SHEETS_PRIORITY_BOOKKEEPING, reads=1)
+    wait_for(lambda: scheduler.stats()["queue_depth"] == 1)
+    # A bookkeeping write parked behind it, then a checkpoint write that joins it and moves it ahead
+    first = start(run, "first", lambda sheets: "old", app.SHEETS_PRIORITY_BOOKKEEPING, writes=1, key="appstate write")
+    wait_for(lambda: scheduler.stats()["queue_depth"] == 2)
+    second = start(run, "second", lambda sheets: "new", app.SHEETS_PRIORITY_CHECKPOINT, writes=1, key="appstate write")
+    for thread in (first, second):
+        thread.join(2)
+        assert not thread.is_alive()
+    assert results["first"] == results["second"] == "new"
+    assert reader.is_alive()
+
+    with scheduler.cond:
+        scheduler.reads.tokens = scheduler.reads.capacity
+        scheduler.cond.notify_all()
+    reader.join(2)
+    assert results["read"] == "R"
+
+def test_coalescing_threads_all_finish(app, monkeypatch):
+    monkeypatch.setitem(app.CONFIG, "sheets_read_quota", 100000)
+    monkeypatch.setitem(app.CONFIG, "sheets_write_quota", 100000)
+    scheduler = app.SheetsScheduler()
+    priorities = (app.SHEETS_PRIORITY_TRANSACTIONS, app.SHEETS_PRIORITY_CHECKPOINT, app.SHEETS_PRIORITY_BOOKKEEPING)
+    finished = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(50):
+            key = rng.choice(["a", "b", "c", None])
+            kind = {"writes": 1} if rng.random() < 0.5 else {"reads": 1}
+            scheduler.call(lambda sheets: time.sleep(0.0005), rng.choice(priorities), key=key, **kind)
+        finished.append(seed)
+
+    threads = [start(worker, seed) for seed in range(8)]
+    for thread in threads:
+        thread.join(20)
+    assert sorted(finished) == list(range(8))
+    assert scheduler.stats()["queue_depth"] == 0
+
+def test_network_errors_are_retried(app, monkeypatch):
+    monkeypatch.setattr(app, "SHEETS_RETRY_BASE", 0.01)
+    scheduler = app.SheetsScheduler()
+    attempts = []
+
+    def flaky(sheets):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionResetError("connection reset by peer")
+        return "ok"
+
+    assert scheduler.call(flaky, writes=1) == "ok"
+    assert scheduler.stats()["retries"] == 2
+
+
+@pytest.mark.parametrize("error", [HttpError(503), ConnectionResetError("connection reset by peer")])
+def test_non_idempotent_call_is_not_retried_once_it_may_have_landed(app, monkeypatch, error):
+    monkeypatch.setattr(app, "SHEETS_RETRY_BASE", 0.01)
+    scheduler = app.SheetsScheduler()
+    attempts = []
+
+    def insert(sheets):
+        attempts.append(1)
+        raise error
+
+    with pytest.raises(type(error)):
+        scheduler.call(insert, writes=1, idempotent=False)
+    assert len(attempts) == 1
+
+def test_non_idempotent_call_is_retried_after_a_429(app, monkeypatch):
+    monkeypatch.setattr(app, "SHEETS_RETRY_BASE", 0.01)
+    scheduler = app.SheetsScheduler()
+    attempts = []
+
+    def insert(sheets):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise HttpError(429)
+        return "inserted"
+
+    assert scheduler.call(insert, writes=1, idempotent=False) == "inserted"
+    assert len(attempts) == 2
+
+def test_session_keeps_handles_on_retryable_errors(app):
+    session = app.SheetsSession()
+    for error in (HttpError(429), HttpError(503), ConnectionResetError("reset")):
+        session.sh = "spreadsheet"
+        try:
+            with session:
+                raise error
+        except Exception:
+            pass
+        assert session.sh == "spreadsheet"
+
+def test_session_drops_handles_when_the_sheet_is_gone(app):
+    session = app.SheetsSession()
+    for error in (HttpError(404), HttpError(403), app.pygsheets.WorksheetNotFound("Transactions")):
+        session.sh = "spreadsheet"
+        session.worksheets["Transactions"] = "worksheet"
+        try:
+            with session:
+                raise error
+        except Exception:
+            pass
+        assert session.sh is None and not session.worksheets